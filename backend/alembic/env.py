@@ -18,6 +18,8 @@ from app.models.transaction import Transaction
 from app.models.server import Server
 from app.models.log import Log
 from app.models.task import Task
+from app.models.metric import MetricSample, MetricRollup, MetricCursor
+from app.models.usage import UsageSegment, UsageDaily, ServerUsage
 
 # Alembic Config object
 config = context.config
@@ -0,0 +1,73 @@
+"""Metrics time-series tables
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Raw samples (append-only, BRIN on timestamp)
+    op.create_table(
+        'metric_samples',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('server_id', sa.Integer(), nullable=False),
+        sa.Column('resource_type', sa.String(length=10), nullable=False),
+        sa.Column('resource_id', sa.String(length=100), nullable=False),
+        sa.Column('timestamp', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('cpu', sa.Float(), nullable=True),
+        sa.Column('mem', sa.Float(), nullable=True),
+        sa.Column('maxmem', sa.Float(), nullable=True),
+        sa.Column('netin', sa.Float(), nullable=True),
+        sa.Column('netout', sa.Float(), nullable=True),
+        sa.Column('diskread', sa.Float(), nullable=True),
+        sa.Column('diskwrite', sa.Float(), nullable=True),
+        sa.ForeignKeyConstraint(['server_id'], ['servers.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_metric_samples_timestamp_brin', 'metric_samples', ['timestamp'],
+        postgresql_using='brin'
+    )
+
+    # Downsampled buckets
+    op.create_table(
+        'metric_rollups',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('server_id', sa.Integer(), nullable=False),
+        sa.Column('resource_type', sa.String(length=10), nullable=False),
+        sa.Column('resource_id', sa.String(length=100), nullable=False),
+        sa.Column('bucket_seconds', sa.Integer(), nullable=False),
+        sa.Column('bucket_start', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('sample_count', sa.Integer(), nullable=False),
+        sa.Column('cpu_sum', sa.Float(), nullable=False),
+        sa.Column('cpu_max', sa.Float(), nullable=False),
+        sa.Column('mem_sum', sa.Float(), nullable=False),
+        sa.Column('mem_max', sa.Float(), nullable=False),
+        sa.Column('maxmem', sa.Float(), nullable=True),
+        sa.Column('netin_sum', sa.Float(), nullable=False),
+        sa.Column('netout_sum', sa.Float(), nullable=False),
+        sa.Column('diskread_sum', sa.Float(), nullable=False),
+        sa.Column('diskwrite_sum', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['server_id'], ['servers.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint(
+            'resource_type', 'server_id', 'resource_id', 'bucket_seconds', 'bucket_start',
+            name='uq_metric_rollups_bucket'
+        )
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('metric_rollups')
+    op.drop_index('ix_metric_samples_timestamp_brin', table_name='metric_samples')
+    op.drop_table('metric_samples')
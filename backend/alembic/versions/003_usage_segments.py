@@ -0,0 +1,57 @@
+"""Usage ledger for event-driven billing
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'usage_segments',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('vm_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('rate', sa.Numeric(precision=10, scale=4), nullable=False),
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('ended_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('billed_until', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('settled_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['vm_id'], ['user_vms.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'uq_usage_segments_open_vm', 'usage_segments', ['vm_id'], unique=True,
+        postgresql_where=sa.text('ended_at IS NULL')
+    )
+    op.create_index(
+        'ix_usage_segments_unsettled', 'usage_segments', ['user_id'],
+        postgresql_where=sa.text('settled_at IS NULL')
+    )
+
+    # Open a segment for every VM that is billable right now
+    op.execute("""
+        INSERT INTO usage_segments (vm_id, user_id, rate, started_at, billed_until)
+        SELECT v.id, v.user_id, t.cost_per_hour,
+               COALESCE(v.last_billed_at, v.created_at),
+               COALESCE(v.last_billed_at, v.created_at)
+        FROM user_vms v
+        JOIN vm_templates t ON t.id = v.template_id
+        WHERE v.state IN ('running', 'suspended')
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_usage_segments_unsettled', table_name='usage_segments')
+    op.drop_index('uq_usage_segments_open_vm', table_name='usage_segments')
+    op.drop_table('usage_segments')
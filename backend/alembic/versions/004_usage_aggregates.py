@@ -0,0 +1,56 @@
+"""Materialized usage aggregates for admin dashboards
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'usage_daily',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('template_id', sa.Integer(), nullable=False),
+        sa.Column('amount', sa.Numeric(precision=14, scale=4), nullable=False),
+        sa.Column('vm_hours', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['template_id'], ['vm_templates.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('day', 'user_id', 'template_id', name='uq_usage_daily_key')
+    )
+
+    op.create_table(
+        'server_usage',
+        sa.Column('server_id', sa.Integer(), nullable=False),
+        sa.Column('active_vms', sa.Integer(), nullable=False),
+        sa.Column('vcpus', sa.Integer(), nullable=False),
+        sa.Column('ram_mb', sa.BigInteger(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['server_id'], ['servers.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('server_id')
+    )
+
+    # Seed server counts from the current VM states
+    op.execute("""
+        INSERT INTO server_usage (server_id, active_vms, vcpus, ram_mb)
+        SELECT s.id, COUNT(v.id), COALESCE(SUM(v.cpu_cores), 0), COALESCE(SUM(v.ram_mb), 0)
+        FROM servers s
+        LEFT JOIN user_vms v ON v.server_id = s.id AND v.state IN ('running', 'suspended')
+        GROUP BY s.id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('server_usage')
+    op.drop_table('usage_daily')
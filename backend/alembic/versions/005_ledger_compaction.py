@@ -0,0 +1,86 @@
+"""Monthly usage summaries, invoices and segment archive
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'usage_monthly',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('month', sa.Date(), nullable=False),
+        sa.Column('vm_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('template_id', sa.Integer(), nullable=False),
+        sa.Column('amount', sa.Numeric(precision=14, scale=4), nullable=False),
+        sa.Column('vm_hours', sa.Float(), nullable=False),
+        sa.Column('segments', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['vm_id'], ['user_vms.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['template_id'], ['vm_templates.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('month', 'vm_id', name='uq_usage_monthly_key')
+    )
+    op.create_index('ix_usage_monthly_user', 'usage_monthly', ['user_id', 'month'])
+
+    # No foreign keys: archived rows outlive the VMs and users they describe
+    op.create_table(
+        'usage_segments_archive',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('vm_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('rate', sa.Numeric(precision=10, scale=4), nullable=False),
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('ended_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('billed_until', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('settled_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('archived_month', sa.Date(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_usage_segments_archive_archived_month', 'usage_segments_archive', ['archived_month'])
+
+    op.create_table(
+        'ledger_periods',
+        sa.Column('month', sa.Date(), nullable=False),
+        sa.Column('vms', sa.Integer(), nullable=False),
+        sa.Column('invoices', sa.Integer(), nullable=False),
+        sa.Column('segments_archived', sa.Integer(), nullable=False),
+        sa.Column('closed_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('month')
+    )
+
+    op.create_table(
+        'invoices',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('month', sa.Date(), nullable=False),
+        sa.Column('number', sa.String(length=32), nullable=False),
+        sa.Column('total', sa.Numeric(precision=14, scale=2), nullable=False),
+        sa.Column('vm_hours', sa.Float(), nullable=False),
+        sa.Column('lines', sa.JSON(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('number'),
+        sa.UniqueConstraint('user_id', 'month', name='uq_invoices_user_month')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('invoices')
+    op.drop_table('ledger_periods')
+    op.drop_index('ix_usage_segments_archive_archived_month', table_name='usage_segments_archive')
+    op.drop_table('usage_segments_archive')
+    op.drop_index('ix_usage_monthly_user', table_name='usage_monthly')
+    op.drop_table('usage_monthly')
@@ -0,0 +1,42 @@
+"""Balance snapshots and usage running total
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'users',
+        sa.Column('usage_charged', sa.Numeric(precision=14, scale=2), server_default='0', nullable=False)
+    )
+
+    op.create_table(
+        'balance_snapshots',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('as_of', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('balance', sa.Numeric(precision=10, scale=2), nullable=False),
+        sa.Column('last_txn_id', sa.Integer(), nullable=False),
+        sa.Column('usage_charged', sa.Numeric(precision=14, scale=2), nullable=False),
+        sa.Column('drift', sa.Numeric(precision=10, scale=2), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_balance_snapshots_user', 'balance_snapshots', ['user_id', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_balance_snapshots_user', table_name='balance_snapshots')
+    op.drop_table('balance_snapshots')
+    op.drop_column('users', 'usage_charged')
@@ -0,0 +1,38 @@
+"""Per-resource metrics high-water mark
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'metric_cursors',
+        sa.Column('resource_type', sa.String(length=10), nullable=False),
+        sa.Column('server_id', sa.Integer(), nullable=False),
+        sa.Column('resource_id', sa.String(length=100), nullable=False),
+        sa.Column('latest', sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(['server_id'], ['servers.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('resource_type', 'server_id', 'resource_id')
+    )
+
+    # One last scan of the raw samples; collection reads the cursors from now on
+    op.execute(
+        "INSERT INTO metric_cursors (resource_type, server_id, resource_id, latest) "
+        "SELECT resource_type, server_id, resource_id, max(timestamp) FROM metric_samples "
+        "GROUP BY resource_type, server_id, resource_id"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('metric_cursors')
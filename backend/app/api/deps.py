@@ -4,7 +4,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 
 from app.core.database import get_async_db
-from app.core.security import decode_token, verify_token_type
+from app.core.security import decode_token, verify_token_type, verify_not_revoked
 from app.models.user import User, UserRole, UserStatus
 from sqlalchemy import select
 
@@ -20,6 +20,8 @@ async def get_current_user(
     token = credentials.credentials
     payload = decode_token(token)
     verify_token_type(payload, "access")
+    # In memory: a logged-out or banned user's token is refused before any DB read
+    await verify_not_revoked(payload)
     
     user_id: Optional[int] = payload.get("sub")
     if user_id is None:
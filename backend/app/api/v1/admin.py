@@ -1,22 +1,40 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import csv
+import io
+
+from fastapi import APIRouter, Depends, HTTPException, status, Response, UploadFile, File, Form
+from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from typing import List
+from sqlalchemy import select, func
+from typing import List, Optional
 from decimal import Decimal
-from datetime import datetime
+from datetime import datetime, date
 
 from app.core.database import get_async_db
+from app.core.config import settings
+from app.core.events import event_publisher
+from app.core.revocation import token_revocations
 from app.core.logging import audit_logger
 from app.core.encryption import encryption
+from app.core.responses import model_response
 from app.api.deps import get_current_admin_user
 from app.models.user import User, UserStatus, UserRole
 from app.models.server import Server
 from app.models.log import Log
+from app.models.task import Task, TaskStatus
 from app.models.transaction import Transaction, TransactionType
 from app.models.template import VMTemplate
-from app.schemas.user import UserResponse, AddCreditsRequest, BanUserRequest, UnbanUserRequest
+from app.models.usage import UsageDaily, ServerUsage
+from app.schemas.user import UserResponse, AddCreditsRequest, BanUserRequest, UnbanUserRequest, BalanceAuditResponse
 from app.schemas.server import ServerCreate, ServerResponse, ServerTestConnectionRequest
 from app.schemas.template import TemplateCreate, TemplateResponse, TemplateUpdate
+from app.schemas.usage import UserSpendResponse, TemplateRevenueResponse, ServerUsageResponse
+from app.schemas.bulk import (
+    BulkCreditItem, BulkCreditRequest, BulkBanRequest, BulkUnbanRequest, BulkVMStopRequest,
+    BulkResponse, TaskResponse
+)
+from app.services.balances import BalanceService
+from app.services.bulk import BulkAdminService
+from app.services.exhaustion import exhaustion_scheduler
 
 
 router = APIRouter(prefix="/admin")
@@ -39,7 +57,7 @@ async def list_users(
         .offset(offset)
     )
     users = result.scalars().all()
-    return users
+    return model_response(List[UserResponse], users)
 
 
 @router.get("/users/{user_id}", response_model=UserResponse)
@@ -61,6 +79,46 @@ async def get_user(
     return user
 
 
+@router.get("/users/{user_id}/balance-audit", response_model=BalanceAuditResponse)
+async def audit_user_balance(
+    user_id: int,
+    current_admin: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Replay the user's balance from their latest snapshot (admin only)"""
+    user = (await db.execute(select(User).where(User.id == user_id))).scalar_one_or_none()
+    
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    
+    snapshot = (await db.execute(BalanceService.latest_snapshots([user.id]))).scalar_one_or_none()
+    if snapshot is None:
+        # No snapshot yet: nothing to replay from
+        return BalanceAuditResponse(
+            user_id=user.id, balance=user.balance, snapshot_as_of=None, snapshot_balance=None,
+            transactions_since=0, transactions_amount=0, usage_charged_since=0, expected=None, drift=None
+        )
+    
+    since = (await db.execute(BalanceService.transactions_since([snapshot]))).first()
+    amount, count = (since[1], since[2]) if since else (0, 0)
+    expected = BalanceService.expected(snapshot, amount, user.usage_charged)
+    
+    return BalanceAuditResponse(
+        user_id=user.id,
+        balance=user.balance,
+        snapshot_as_of=snapshot.as_of,
+        snapshot_balance=snapshot.balance,
+        transactions_since=count,
+        transactions_amount=amount,
+        usage_charged_since=user.usage_charged - snapshot.usage_charged,
+        expected=expected,
+        drift=user.balance - expected
+    )
+
+
 @router.post("/users/{user_id}/credit")
 async def add_user_credit(
     user_id: int,
@@ -96,6 +154,8 @@ async def add_user_credit(
     db.add(transaction)
     await db.commit()
     
+    await exhaustion_scheduler.refresh_async(db, [user.id])
+    
     audit_logger.log(
         "admin_credit_added",
         user_id=current_admin.id,
@@ -145,6 +205,9 @@ async def ban_user(
     
     await db.commit()
     
+    # Sessions end now, not when their tokens expire
+    await token_revocations.revoke_users_async([user.id])
+    
     ban_type = "temporary" if ban_data.ban_until else "permanent"
     
     audit_logger.log(
@@ -203,6 +266,158 @@ async def unban_user(
     return {"message": "User unbanned successfully", "user_id": user.id}
 
 
+# ==================== Bulk Operations ====================
+
+async def _run_bulk(
+    operation: str,
+    request,
+    current_admin: User,
+    db: AsyncSession,
+    response: Response
+) -> BulkResponse:
+    """Apply small requests inline; queue large ones as a background Task"""
+    total = len(BulkAdminService.items(request))
+    
+    if total > settings.BULK_SYNC_MAX_ITEMS:
+        task = Task(
+            type=operation,
+            status=TaskStatus.PENDING,
+            payload={"admin_id": current_admin.id, "request": request.model_dump(mode="json")}
+        )
+        db.add(task)
+        await db.commit()
+        
+        # Imported here: loading Celery costs every API process startup time
+        from app.tasks.admin import run_bulk_operation
+        task.celery_task_id = run_bulk_operation.delay(task.id).id
+        await db.commit()
+        
+        response.status_code = status.HTTP_202_ACCEPTED
+        return BulkResponse(total=total, task_id=task.id)
+    
+    # Proxmox calls first (VM stops), so the database only records what they confirmed
+    proxmox = None
+    targets = BulkAdminService.proxmox_targets(operation, request, 0, total)
+    if targets is not None:
+        proxmox = await BulkAdminService.run_proxmox(operation, (await db.execute(targets)).all())
+    
+    # The same set-based code as the background task, on this session's connection
+    outcome = await db.run_sync(
+        lambda session: BulkAdminService.apply(session, operation, request, current_admin.id, 0, total, proxmox)
+    )
+    await db.commit()
+    
+    await exhaustion_scheduler.refresh_async(db, outcome.user_ids)
+    await token_revocations.revoke_users_async(outcome.revoked)
+    for event in outcome.events:
+        await event_publisher.publish_async(*event)
+    
+    audit_logger.log(
+        operation,
+        user_id=current_admin.id,
+        details={"items": total, "failed": outcome.failed}
+    )
+    
+    return BulkResponse(
+        total=total,
+        succeeded=total - outcome.failed,
+        failed=outcome.failed,
+        results=outcome.results
+    )
+
+
+@router.post("/bulk/credits", response_model=BulkResponse)
+async def bulk_add_credits(
+    bulk_data: BulkCreditRequest,
+    response: Response,
+    current_admin: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Add credits to many users (admin only)"""
+    return await _run_bulk("bulk_credit", bulk_data, current_admin, db, response)
+
+
+@router.post("/bulk/credits/csv", response_model=BulkResponse)
+async def bulk_add_credits_csv(
+    response: Response,
+    file: UploadFile = File(...),
+    reason: Optional[str] = Form(None),
+    current_admin: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Add credits from a CSV with user_id,amount[,reason] columns (admin only)"""
+    content = (await file.read()).decode("utf-8-sig")
+    
+    try:
+        items = [
+            BulkCreditItem(
+                user_id=row["user_id"],
+                amount=row["amount"],
+                reason=row.get("reason") or None
+            )
+            for row in csv.DictReader(io.StringIO(content))
+        ]
+        bulk_data = BulkCreditRequest(items=items, reason=reason)
+    except (KeyError, ValidationError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Invalid CSV (expected user_id,amount[,reason] columns): {e}"
+        )
+    
+    return await _run_bulk("bulk_credit", bulk_data, current_admin, db, response)
+
+
+@router.post("/bulk/ban", response_model=BulkResponse)
+async def bulk_ban_users(
+    bulk_data: BulkBanRequest,
+    response: Response,
+    current_admin: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Ban many users (admin only)"""
+    return await _run_bulk("bulk_ban", bulk_data, current_admin, db, response)
+
+
+@router.post("/bulk/unban", response_model=BulkResponse)
+async def bulk_unban_users(
+    bulk_data: BulkUnbanRequest,
+    response: Response,
+    current_admin: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Unban many users (admin only)"""
+    return await _run_bulk("bulk_unban", bulk_data, current_admin, db, response)
+
+
+@router.post("/bulk/vms/stop", response_model=BulkResponse)
+async def bulk_stop_vms(
+    bulk_data: BulkVMStopRequest,
+    response: Response,
+    current_admin: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Stop many VMs (admin only)"""
+    return await _run_bulk("bulk_stop_vms", bulk_data, current_admin, db, response)
+
+
+@router.get("/tasks/{task_id}", response_model=TaskResponse)
+async def get_task(
+    task_id: int,
+    current_admin: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get background task progress and results (admin only)"""
+    task = await db.get(Task, task_id)
+    
+    if not task:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Task not found"
+        )
+    
+    return task
+
+
 # ==================== Server Management ====================
 
 @router.get("/servers", response_model=List[ServerResponse])
@@ -213,7 +428,7 @@ async def list_servers(
     """List all Proxmox servers (admin only)"""
     result = await db.execute(select(Server).order_by(Server.name))
     servers = result.scalars().all()
-    return servers
+    return model_response(List[ServerResponse], servers)
 
 
 @router.post("/servers", response_model=ServerResponse, status_code=status.HTTP_201_CREATED)
@@ -250,6 +465,8 @@ async def create_server(
     )
     
     db.add(server)
+    await db.flush()
+    db.add(ServerUsage(server_id=server.id, active_vms=0, vcpus=0, ram_mb=0))
     await db.commit()
     await db.refresh(server)
     
@@ -368,6 +585,84 @@ async def update_template(
     return template
 
 
+# ==================== Usage ====================
+
+@router.get("/usage/users", response_model=List[UserSpendResponse])
+async def get_user_spend(
+    current_admin: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_async_db),
+    day: Optional[date] = None,
+    limit: int = 100
+):
+    """Top spenders for a day, from the daily usage rollup (admin only)"""
+    day = day or datetime.utcnow().date()
+    amount = func.sum(UsageDaily.amount).label("amount")
+    
+    result = await db.execute(
+        select(
+            UsageDaily.user_id,
+            User.email,
+            amount,
+            func.sum(UsageDaily.vm_hours).label("vm_hours")
+        )
+        .join(User, User.id == UsageDaily.user_id)
+        .where(UsageDaily.day == day)
+        .group_by(UsageDaily.user_id, User.email)
+        .order_by(amount.desc())
+        .limit(limit)
+    )
+    
+    return model_response(List[UserSpendResponse], result.all())
+
+
+@router.get("/usage/templates", response_model=List[TemplateRevenueResponse])
+async def get_template_revenue(
+    current_admin: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_async_db),
+    day: Optional[date] = None
+):
+    """Revenue per template for a day, from the daily usage rollup (admin only)"""
+    day = day or datetime.utcnow().date()
+    amount = func.sum(UsageDaily.amount).label("amount")
+    
+    result = await db.execute(
+        select(
+            UsageDaily.template_id,
+            VMTemplate.name,
+            amount,
+            func.sum(UsageDaily.vm_hours).label("vm_hours")
+        )
+        .join(VMTemplate, VMTemplate.id == UsageDaily.template_id)
+        .where(UsageDaily.day == day)
+        .group_by(UsageDaily.template_id, VMTemplate.name)
+        .order_by(amount.desc())
+    )
+    
+    return model_response(List[TemplateRevenueResponse], result.all())
+
+
+@router.get("/usage/servers", response_model=List[ServerUsageResponse])
+async def get_server_usage(
+    current_admin: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Allocated VMs, vCPUs and RAM per server (admin only)"""
+    result = await db.execute(
+        select(
+            ServerUsage.server_id,
+            Server.name,
+            ServerUsage.active_vms,
+            ServerUsage.vcpus,
+            ServerUsage.ram_mb,
+            ServerUsage.updated_at
+        )
+        .join(Server, Server.id == ServerUsage.server_id)
+        .order_by(Server.name)
+    )
+    
+    return model_response(List[ServerUsageResponse], result.all())
+
+
 # ==================== Logs ====================
 
 @router.get("/logs")
@@ -1,6 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from typing import Optional
 from datetime import datetime, timedelta
 
 from app.core.database import get_async_db
@@ -10,8 +12,11 @@ from app.core.security import (
     create_access_token,
     create_refresh_token,
     decode_token,
-    verify_token_type
+    verify_token_type,
+    verify_not_revoked,
+    security
 )
+from app.core.revocation import token_revocations
 from app.core.rate_limit import rate_limiter
 from app.core.config import settings
 from app.core.logging import audit_logger
@@ -136,6 +141,7 @@ async def refresh(
     
     payload = decode_token(token_data.refresh_token)
     verify_token_type(payload, "refresh")
+    await verify_not_revoked(payload)
     
     user_id = payload.get("sub")
     if not user_id:
@@ -162,3 +168,27 @@ async def refresh(
         access_token=access_token,
         refresh_token=new_refresh_token
     )
+
+
+@router.post("/logout")
+async def logout(
+    token_data: Optional[TokenRefresh] = None,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Revoke the access token and, if given, the refresh token"""
+    
+    payload = decode_token(credentials.credentials)
+    verify_token_type(payload, "access")
+    await verify_not_revoked(payload)
+    await token_revocations.revoke_token(payload)
+    
+    if token_data is not None:
+        refresh_payload = decode_token(token_data.refresh_token)
+        verify_token_type(refresh_payload, "refresh")
+        # Only the caller's own refresh token
+        if refresh_payload.get("sub") == payload.get("sub"):
+            await token_revocations.revoke_token(refresh_payload)
+    
+    audit_logger.log("user_logged_out", user_id=int(payload["sub"]))
+    
+    return {"message": "Logged out"}
@@ -1,18 +1,96 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from typing import Optional
+
+from app.core.database import get_async_db
+from app.api.deps import get_current_active_user, get_current_operator_or_admin_user
+from app.models.user import User
+from app.models.server import Server
+from app.models.vm import VM
+from app.services.timeseries import TimeSeriesService
 
 
 router = APIRouter(prefix="/monitoring")
 
+RANGE_PATTERN = "^(1h|24h|30d)$"
+
 
 @router.get("/nodes")
-async def get_nodes_status():
+async def get_nodes_status(
+    current_user: User = Depends(get_current_operator_or_admin_user),
+    db: AsyncSession = Depends(get_async_db)
+):
     """Get status of all Proxmox nodes"""
-    # TODO: Implement Proxmox node monitoring
-    return {"nodes": []}
+    result = await db.execute(select(Server.id, Server.name, Server.status))
+    servers = {row.id: row for row in result.all()}
+    
+    nodes = await TimeSeriesService.latest_node_points(db)
+    
+    for node in nodes:
+        server = servers.get(node["server_id"])
+        node["server_name"] = server.name if server else None
+        node["server_status"] = server.status if server else None
+    
+    return {"nodes": nodes}
 
 
 @router.get("/node/{node_id}/metrics")
-async def get_node_metrics(node_id: int):
-    """Get metrics for a specific node"""
-    # TODO: Implement node metrics retrieval
-    return {"metrics": {}}
+async def get_node_metrics(
+    node_id: int,
+    node: str = Query(..., description="Proxmox node name on the server"),
+    range: str = Query("1h", pattern=RANGE_PATTERN),
+    current_user: User = Depends(get_current_operator_or_admin_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get metrics for a specific node (node_id is the server ID)"""
+    server = await db.get(Server, node_id)
+    
+    if not server:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Server not found"
+        )
+    
+    points = await TimeSeriesService.query_range(db, ("node", server.id, node), range)
+    
+    return {
+        "server_id": server.id,
+        "node": node,
+        "range": range,
+        "metrics": points
+    }
+
+
+@router.get("/vm/{vm_id}/metrics")
+async def get_vm_metrics(
+    vm_id: int,
+    range: str = Query("1h", pattern=RANGE_PATTERN),
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get metrics for one of the current user's VMs"""
+    result = await db.execute(
+        select(VM)
+        .where(VM.id == vm_id)
+        .where(VM.user_id == current_user.id)
+    )
+    vm = result.scalar_one_or_none()
+    
+    if not vm:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="VM not found"
+        )
+    
+    points = []
+    if vm.proxmox_vm_id is not None:
+        points = await TimeSeriesService.query_range(
+            db, ("vm", vm.server_id, str(vm.proxmox_vm_id)), range
+        )
+    
+    return {
+        "vm_id": vm.id,
+        "range": range,
+        "metrics": points
+    }
@@ -4,6 +4,7 @@ from sqlalchemy import select
 from typing import List
 
 from app.core.database import get_async_db
+from app.core.responses import model_response
 from app.models.template import VMTemplate
 from app.schemas.template import TemplateResponse
 
@@ -30,7 +31,7 @@ async def list_templates(
         template.cost_per_day = template.cost_per_day
         template.cost_per_month = template.cost_per_month
     
-    return templates
+    return model_response(List[TemplateResponse], templates)
 
 
 @router.get("/{template_id}", response_model=TemplateResponse)
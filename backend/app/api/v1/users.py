@@ -4,11 +4,14 @@ from sqlalchemy import select
 from typing import List
 
 from app.core.database import get_async_db
+from app.core.responses import model_response
 from app.api.deps import get_current_active_user
 from app.models.user import User
 from app.models.transaction import Transaction
+from app.models.invoice import Invoice
 from app.schemas.user import UserResponse, UserCreditsResponse
 from app.schemas.transaction import TransactionResponse
+from app.schemas.invoice import InvoiceResponse
 
 
 router = APIRouter(prefix="/user")
@@ -46,4 +49,42 @@ async def get_user_transactions(
         .offset(offset)
     )
     transactions = result.scalars().all()
-    return transactions
+    return model_response(List[TransactionResponse], transactions)
+
+
+@router.get("/invoices", response_model=List[InvoiceResponse])
+async def get_user_invoices(
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db),
+    limit: int = 12,
+    offset: int = 0
+):
+    """Get monthly usage invoices, newest first"""
+    result = await db.execute(
+        select(Invoice)
+        .where(Invoice.user_id == current_user.id)
+        .order_by(Invoice.month.desc())
+        .limit(limit)
+        .offset(offset)
+    )
+    invoices = result.scalars().all()
+    return model_response(List[InvoiceResponse], invoices)
+
+
+@router.get("/invoices/{number}", response_model=InvoiceResponse)
+async def get_user_invoice(
+    number: str,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get one invoice by number"""
+    invoice = (await db.execute(
+        select(Invoice)
+        .where(Invoice.number == number)
+        .where(Invoice.user_id == current_user.id)
+    )).scalar_one_or_none()
+    
+    if not invoice:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Invoice not found")
+    
+    return model_response(InvoiceResponse, invoice)
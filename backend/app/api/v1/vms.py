@@ -1,22 +1,32 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from typing import List
 from decimal import Decimal
 from datetime import datetime
+import orjson
 
 from app.core.database import get_async_db
-from app.core.logging import audit_logger
+from app.core.logging import logger, audit_logger
 from app.core.config import settings
+from app.core.events import event_publisher
+from app.core.responses import model_response
 from app.api.deps import get_current_active_user
 from app.models.user import User
 from app.models.vm import VM, VMState
 from app.models.template import VMTemplate
 from app.models.transaction import Transaction, TransactionType
 from app.models.server import Server, ServerStatus
-from app.schemas.vm import VMCreate, VMResponse, VMAction, VMListResponse
+from app.schemas.vm import (
+    VMCreate, VMResponse, VMAction, VMListResponse, VMBulkAction, VMBulkDelete, VMBulkTarget, MAX_BULK_VMS
+)
 from app.services.proxmox import ProxmoxService
 from app.services.billing import BillingService
+from app.services.usage import UsageService
+from app.services.exhaustion import exhaustion_scheduler
+from app.services.proxmox_scheduler import Priority
+from app.services.vm_bulk import VMBulkService, TRANSITIONS
 
 
 router = APIRouter(prefix="/vms")
@@ -36,7 +46,7 @@ async def list_vms(
     )
     vms = result.scalars().all()
     
-    return VMListResponse(vms=vms, total=len(vms))
+    return model_response(VMListResponse, {"vms": vms, "total": len(vms)})
 
 
 @router.post("", response_model=VMResponse, status_code=status.HTTP_201_CREATED)
@@ -120,6 +130,10 @@ async def create_vm(
     # TODO: Queue VM creation task via Celery
     # For now, mark as creating
     
+    await event_publisher.publish_async(
+        current_user.id, "vm_state", {"vm_id": vm.id, "state": vm.state.value}
+    )
+    
     audit_logger.log(
         "vm_created",
         user_id=current_user.id,
@@ -129,6 +143,122 @@ async def create_vm(
     return vm
 
 
+async def _bulk_lifecycle(
+    action: str,
+    target: VMBulkTarget,
+    current_user: User,
+    db: AsyncSession
+) -> StreamingResponse:
+    """Stream one NDJSON result per VM, then a summary line"""
+    
+    # Ownership and current state for every VM in one query
+    rows = (await db.execute(VMBulkService.select_vms(current_user.id, target))).all()
+    if len(rows) > MAX_BULK_VMS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Selector matches more than {MAX_BULK_VMS} VMs; narrow it or pass vm_ids"
+        )
+    todo, results = VMBulkService.plan(action, target, rows)
+    new_state = TRANSITIONS[action][1]
+    
+    async def stream():
+        failed = sum(1 for result in results if result["status"] == "error")
+        skipped = len(results) - failed
+        for result in results:
+            yield orjson.dumps(result) + b"\n"
+        
+        # Only VMs whose Proxmox task succeeded change state (DELETED closes billing)
+        finished = []
+        pending = 0
+        async for row, outcome, upid, error in VMBulkService.dispatch(action, todo):
+            if outcome == "error":
+                failed += 1
+                yield orjson.dumps({"id": row.id, "status": "error", "upid": upid, "error": error}) + b"\n"
+            elif outcome == "dispatched":
+                # Still running: reconciliation picks up the final state
+                pending += 1
+                yield orjson.dumps({"id": row.id, "status": "dispatched", "upid": upid}) + b"\n"
+            else:
+                finished.append(row.id)
+                yield orjson.dumps({"id": row.id, "status": "ok", "state": new_state.value, "upid": upid}) + b"\n"
+        
+        # The request's session has been closed (not discarded) by now and reopens on use
+        try:
+            applied = await VMBulkService.apply(db, action, finished, datetime.utcnow())
+            await db.commit()
+        except Exception as e:
+            logger.error(f"Bulk VM {action} failed to record states: {e}")
+            await db.rollback()
+            yield orjson.dumps({"summary": {
+                "total": len(results) + len(todo),
+                "succeeded": 0,
+                "failed": failed + len(finished),
+                "skipped": skipped,
+                "dispatched": pending,
+                "error": "Failed to record VM states"
+            }}) + b"\n"
+            return
+        
+        if any(row.state != new_state for row in applied):
+            await exhaustion_scheduler.refresh_async(db, [current_user.id])
+        
+        for row in applied:
+            await event_publisher.publish_async(
+                current_user.id,
+                "vm_state",
+                {"vm_id": row.id, "state": new_state.value, "action": action}
+            )
+        
+        audit_logger.log(
+            f"vm_bulk_{action}",
+            user_id=current_user.id,
+            details={"vm_ids": [row.id for row in applied], "failed": failed}
+        )
+        
+        yield orjson.dumps({"summary": {
+            "total": len(results) + len(todo),
+            "succeeded": len(applied),
+            "failed": failed,
+            "skipped": skipped + len(finished) - len(applied),
+            "dispatched": pending
+        }}) + b"\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@router.post("/actions")
+async def bulk_vm_action(
+    bulk_data: VMBulkAction,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Perform an action on many VMs, streaming per-VM results (NDJSON)"""
+    
+    if bulk_data.action in ("start", "resume") and not current_user.can_create_vm:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Cannot start VMs. Account may be banned."
+        )
+    
+    if bulk_data.action in ("start", "resume") and current_user.balance <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail="Insufficient balance to start VMs"
+        )
+    
+    return await _bulk_lifecycle(bulk_data.action, bulk_data, current_user, db)
+
+
+@router.post("/bulk-delete")
+async def bulk_delete_vms(
+    bulk_data: VMBulkDelete,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Delete many VMs, streaming per-VM results (NDJSON)"""
+    return await _bulk_lifecycle("delete", bulk_data, current_user, db)
+
+
 @router.get("/{vm_id}", response_model=VMResponse)
 async def get_vm(
     vm_id: int,
@@ -161,11 +291,12 @@ async def vm_action(
 ):
     """Perform action on VM (start, stop, reboot, etc.)"""
     
-    # Get VM
+    # Get VM (locked until commit so concurrent actions serialize)
     result = await db.execute(
         select(VM)
         .where(VM.id == vm_id)
         .where(VM.user_id == current_user.id)
+        .with_for_update()
     )
     vm = result.scalar_one_or_none()
     
@@ -175,39 +306,81 @@ async def vm_action(
             detail="VM not found"
         )
     
-    # Check if user can start VMs (for start action)
-    if action.action == "start" and not current_user.can_create_vm:
+    if vm.state in (VMState.DELETED, VMState.DELETING):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="VM is deleted"
+        )
+    
+    allowed, new_state = TRANSITIONS[action.action]
+    if vm.state == new_state and action.action != "reboot":
+        # Already there: nothing to ask Proxmox for
+        return {"message": f"VM {action.action} action initiated", "vm_id": vm.id, "upid": None}
+    
+    if vm.state not in allowed:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Cannot {action.action} a VM that is {vm.state.value}"
+        )
+    
+    # Starting and resuming both open a billing segment
+    if action.action in ("start", "resume") and not current_user.can_create_vm:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Cannot start VM. Account may be banned."
         )
     
-    # Check balance for start action
-    if action.action == "start" and current_user.balance <= 0:
+    if action.action in ("start", "resume") and current_user.balance <= 0:
         raise HTTPException(
             status_code=status.HTTP_402_PAYMENT_REQUIRED,
             detail="Insufficient balance to start VM"
         )
     
-    # TODO: Execute action via Proxmox service
-    # For now, update state
-    if action.action == "start":
-        vm.state = VMState.RUNNING
-        vm.last_billed_at = datetime.utcnow()
-    elif action.action == "stop":
-        vm.state = VMState.STOPPED
-    elif action.action == "reboot":
-        pass  # State remains running
+    # Proxmox first: the database only records what the cluster confirmed,
+    # otherwise reconciliation would put the old state back
+    target = (await db.execute(
+        VMBulkService.select_vms(current_user.id, VMBulkTarget(vm_ids=[vm.id]))
+    )).one()
+    [(_, outcome, upid, error)] = [
+        result async for result in VMBulkService.dispatch(action.action, [target], Priority.INTERACTIVE)
+    ]
     
-    await db.commit()
+    if outcome == "error":
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Proxmox failed to {action.action} the VM: {error}"
+        )
     
     audit_logger.log(
         f"vm_{action.action}",
         user_id=current_user.id,
-        details={"vm_id": vm.id, "action": action.action}
+        details={"vm_id": vm.id, "action": action.action, "upid": upid}
     )
     
-    return {"message": f"VM {action.action} action initiated", "vm_id": vm.id}
+    if outcome == "dispatched":
+        # Still running on Proxmox: reconciliation records the final state
+        return {"message": f"VM {action.action} action initiated", "vm_id": vm.id, "upid": upid}
+    
+    previous_state = vm.state
+    vm.state = new_state
+    vm.state_changed_at = datetime.utcnow()
+    
+    # Open or close the usage segment in the same transaction
+    await UsageService.record_transition(db, vm, previous_state, vm.state_changed_at)
+    
+    await db.commit()
+    
+    # Burn rate changed: move the projected zero-balance time
+    if vm.state != previous_state:
+        await exhaustion_scheduler.refresh_async(db, [current_user.id])
+    
+    await event_publisher.publish_async(
+        current_user.id,
+        "vm_state",
+        {"vm_id": vm.id, "state": vm.state.value, "action": action.action}
+    )
+    
+    return {"message": f"VM {action.action} action initiated", "vm_id": vm.id, "upid": upid}
 
 
 @router.delete("/{vm_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -222,6 +395,7 @@ async def delete_vm(
         select(VM)
         .where(VM.id == vm_id)
         .where(VM.user_id == current_user.id)
+        .with_for_update()
     )
     vm = result.scalar_one_or_none()
     
@@ -232,11 +406,20 @@ async def delete_vm(
         )
     
     # Soft delete
+    previous_state = vm.state
     vm.state = VMState.DELETED
     vm.deleted_at = datetime.utcnow()
     
+    await UsageService.record_transition(db, vm, previous_state, vm.deleted_at)
+    
     await db.commit()
     
+    await exhaustion_scheduler.refresh_async(db, [current_user.id])
+    
+    await event_publisher.publish_async(
+        current_user.id, "vm_state", {"vm_id": vm.id, "state": vm.state.value}
+    )
+    
     audit_logger.log(
         "vm_deleted",
         user_id=current_user.id,
@@ -0,0 +1,53 @@
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+
+from app.core.database import get_async_db
+from app.core.security import decode_token, verify_token_type, verify_not_revoked
+from app.core.events import connection_manager
+from app.models.user import User, UserStatus
+
+
+router = APIRouter(prefix="/ws")
+
+
+@router.websocket("/vms")
+async def vm_events(
+    websocket: WebSocket,
+    token: str,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Push VM state, task progress and balance changes to the owning user"""
+    
+    # Browsers cannot set headers on WebSocket requests, so the access token
+    # is passed as a query parameter
+    try:
+        payload = decode_token(token)
+        verify_token_type(payload, "access")
+        await verify_not_revoked(payload)
+        user_id = int(payload.get("sub"))
+    except (HTTPException, TypeError, ValueError):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    result = await db.execute(select(User.status).where(User.id == user_id))
+    user_status = result.scalar_one_or_none()
+    
+    if user_status != UserStatus.ACTIVE:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    # Release the DB connection; the socket may stay open for hours
+    await db.close()
+    
+    await websocket.accept()
+    connection_manager.connect(user_id, websocket)
+    
+    try:
+        while True:
+            # Client messages are only keep-alives
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        connection_manager.disconnect(user_id, websocket)
@@ -0,0 +1,145 @@
+"""
+Cross-process cache invalidation over Redis pub/sub
+
+Each API worker (and Celery worker) keeps its own in-memory caches; nothing
+is shared between processes. When one process changes something another may
+have cached, it publishes (cache name, key) here and every other subscribed
+process drops that key from its copy:
+
+    cache_bus.register("proxmox_reads", proxmox_reads.invalidate)
+    ...
+    proxmox_reads.invalidate(scope)               # this process
+    cache_bus.publish("proxmox_reads", scope)     # everyone else
+
+Delivery is best effort. Caches that use it must also expire on their own,
+so a missed message only means serving a stale entry until its TTL.
+"""
+import asyncio
+import os
+import uuid
+from typing import Any, Callable, Dict, Optional, Set
+
+import orjson
+import redis
+import redis.asyncio as aioredis
+
+from app.core.config import settings
+from app.core.logging import logger
+
+
+INVALIDATION_CHANNEL = "unimanager:cache-invalidate"
+
+
+class CacheInvalidationBus:
+    """Publishes invalidations and applies other processes' ones to registered caches"""
+
+    def __init__(self):
+        self._handlers: Dict[str, Callable[[str], Any]] = {}
+        self._clients: Dict[asyncio.AbstractEventLoop, aioredis.Redis] = {}
+        self._sync_client: Optional[redis.Redis] = None
+        self._pending: Set[asyncio.Task] = set()
+        self._listener: Optional[asyncio.Task] = None
+        self._origin = self._new_origin()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    @staticmethod
+    def _new_origin() -> str:
+        return f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    def _after_fork(self) -> None:
+        # A preloaded worker must not mistake its siblings' messages for its own
+        self._origin = self._new_origin()
+        self._clients = {}
+        self._sync_client = None
+        self._pending = set()
+        self._listener = None
+
+    def register(self, cache: str, invalidate: Callable[[str], Any]) -> None:
+        self._handlers[cache] = invalidate
+
+    def publish(self, cache: str, key: str) -> None:
+        """Tell other processes to drop key from cache; never blocks the caller"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = loop.create_task(self._publish(loop, cache, key))
+        # Keep a reference until it's sent
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    def publish_sync(self, cache: str, key: str) -> None:
+        """publish() for code without an event loop (Celery tasks)"""
+        try:
+            if self._sync_client is None:
+                self._sync_client = redis.from_url(settings.REDIS_URL)
+            self._sync_client.publish(INVALIDATION_CHANNEL, self._message(cache, key))
+        except Exception as e:
+            logger.warning(f"Failed to publish invalidation for {cache}: {e}")
+
+    def _message(self, cache: str, key: str) -> bytes:
+        return orjson.dumps({"origin": self._origin, "cache": cache, "key": key})
+
+    async def _publish(self, loop: asyncio.AbstractEventLoop, cache: str, key: str) -> None:
+        try:
+            client = self._clients.get(loop)
+            if client is None:
+                client = self._clients[loop] = aioredis.from_url(settings.REDIS_URL)
+            await client.publish(INVALIDATION_CHANNEL, self._message(cache, key))
+        except Exception as e:
+            logger.warning(f"Failed to publish invalidation for {cache}: {e}")
+
+    def apply(self, raw: bytes) -> None:
+        """Apply one invalidation message, ignoring this process's own"""
+        try:
+            message = orjson.loads(raw)
+            origin, cache, key = message["origin"], message["cache"], message["key"]
+        except (orjson.JSONDecodeError, KeyError, TypeError):
+            return
+        handler = self._handlers.get(cache)
+        if origin != self._origin and handler is not None:
+            handler(key)
+
+    async def _listen(self) -> None:
+        while True:
+            client = aioredis.from_url(settings.REDIS_URL)
+            pubsub = client.pubsub()
+            try:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self.apply(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Cache invalidation listener error, reconnecting: {e}")
+            finally:
+                try:
+                    await pubsub.aclose()
+                    await client.aclose()
+                except Exception as e:
+                    logger.warning(f"Failed to close invalidation subscription: {e}")
+            await asyncio.sleep(1)
+
+    def start(self) -> None:
+        """Start the subscription task (called from the app lifespan)"""
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            try:
+                await client.aclose()
+            except Exception:
+                pass
+
+
+cache_bus = CacheInvalidationBus()
@@ -24,6 +24,8 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
+    TOKEN_CACHE_SIZE: int = 10000  # Verified tokens whose claims are kept per process; 0 disables
+    TOKEN_REVOCATION_SYNC_SECONDS: float = 10.0  # Longest a process goes without reloading revocations
     ENCRYPTION_KEY: str  # Base64 encoded 32-byte key for Fernet
     
     # CORS
@@ -51,13 +53,58 @@ class Settings(BaseSettings):
     EMAILS_FROM_EMAIL: str = "noreply@unimanager.com"
     EMAILS_FROM_NAME: str = "Uni-Manager"
     
+    # Proxmox
+    PROXMOX_READ_CACHE_SECONDS: float = 2.0  # Micro-cache for status/node/rrd reads; 0 disables
+    PROXMOX_TASK_POLL_INITIAL_SECONDS: float = 0.5  # UPID poll interval, doubled while nothing finishes
+    PROXMOX_TASK_POLL_MAX_SECONDS: float = 10.0
+    PROXMOX_TASK_MAX_POLL_FAILURES: int = 20  # Consecutive failed polls before a UPID is given up
+    PROXMOX_TASK_MAX_TRACK_SECONDS: float = 6 * 3600  # Longest a UPID is followed
+    PROXMOX_RATE_LIMIT_PER_SECOND: float = 50.0  # Requests per server and process; 0 disables
+    PROXMOX_RATE_LIMIT_BURST: int = 100
+    PROXMOX_BULK_CONCURRENCY: int = 8  # Requests in flight per server for bulk VM actions
+    PROXMOX_BULK_TASK_TIMEOUT_SECONDS: float = 120.0  # Bulk actions wait this long for each Proxmox task
+    
     # Rate Limiting
     RATE_LIMIT_LOGIN_ATTEMPTS: int = 5
     RATE_LIMIT_LOGIN_WINDOW: int = 300  # seconds
     
     # Billing
     BILLING_CYCLE_MINUTES: int = 60
+    BALANCE_ENFORCE_INTERVAL_SECONDS: int = 15  # Poll of the deadline sorted set
+    BALANCE_SWEEP_MINUTES: int = 60  # Full rebuild of the deadline schedule
     MIN_BALANCE_THRESHOLD: float = 0.0
+    LEDGER_CLOSE_GRACE_HOURS: int = 24  # A month is compacted and invoiced this long after it ends
+    BALANCE_SNAPSHOT_HOURS: int = 24  # Interval between balance snapshots (and drift checks)
+    BALANCE_SNAPSHOT_BATCH_SIZE: int = 1000  # Users locked and snapshotted per transaction
+    BALANCE_DRIFT_TOLERANCE: float = 0.01  # Larger differences from the replayed balance are flagged
+    
+    # Bulk admin operations
+    BULK_SYNC_MAX_ITEMS: int = 500  # Larger requests run as a background Task
+    BULK_CHUNK_SIZE: int = 1000  # Items per transaction in the background Task
+    
+    # Idempotency-Key handling (POST /vms and VM actions)
+    IDEMPOTENCY_TTL_SECONDS: int = 86400  # How long a finished response is replayed
+    IDEMPOTENCY_LOCK_SECONDS: int = 120  # Claim on an in-flight request, renewed while it runs and freed if the worker dies
+    IDEMPOTENCY_WAIT_SECONDS: int = 30  # Duplicates wait this long for the first request
+    
+    # WebSocket events
+    WS_SEND_QUEUE_SIZE: int = 100  # Per-socket backlog; a slow client loses its oldest events
+    
+    # Monitoring
+    VM_RECONCILE_INTERVAL_SECONDS: int = 60
+    VM_RECONCILE_GRACE_SECONDS: int = 180  # Panel state changes are trusted over Proxmox this long
+    METRICS_COLLECT_INTERVAL_SECONDS: int = 300  # rrddata "hour" keeps ~70 minutes
+    METRICS_COLLECT_CONCURRENCY: int = 20
+    
+    # Startup (checked by app/tests/test_startup.py)
+    IMPORT_BUDGET_API_SECONDS: float = 5.0
+    IMPORT_BUDGET_WORKER_SECONDS: float = 3.0
+    
+    # Metrics
+    CELERY_METRICS_PORT: int = 9808  # 0 disables the worker metrics server
+    
+    # Logging
+    LOG_QUEUE_SIZE: int = 10000  # Records buffered for the writer thread; the oldest are dropped beyond this
     
     # Audit
     LOG_RETENTION_DAYS: int = 365
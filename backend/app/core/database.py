@@ -1,21 +1,76 @@
-from sqlalchemy import create_engine
+import os
+from typing import TYPE_CHECKING, AsyncGenerator, Generator, Optional
+
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
-from typing import Generator, AsyncGenerator
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from app.core.config import settings
 
-# Sync engine for Alembic migrations
+if TYPE_CHECKING:
+    from sqlalchemy.engine import Engine
+    from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Engines are created on first use: importing this module doesn't load the
+# DB drivers, so a Celery worker never builds the async engine, the API never
+# builds the sync one, and nothing connects before a preload fork.
+
+# Sync engine for Alembic migrations and Celery tasks
 SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
-engine = create_engine(SQLALCHEMY_DATABASE_URL, pool_pre_ping=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+_engine: Optional["Engine"] = None
 
 # Async engine for FastAPI
 ASYNC_DATABASE_URL = settings.DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
-async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=False, future=True)
-AsyncSessionLocal = async_sessionmaker(
-    async_engine, class_=AsyncSession, expire_on_commit=False
-)
+_async_engine: Optional["AsyncEngine"] = None
+
+
+def get_engine() -> "Engine":
+    global _engine
+    if _engine is None:
+        from sqlalchemy import create_engine
+        _engine = create_engine(SQLALCHEMY_DATABASE_URL, pool_pre_ping=True)
+    return _engine
+
+
+def get_async_engine() -> "AsyncEngine":
+    global _async_engine
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine
+        _async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=False, future=True)
+    return _async_engine
+
+
+def __getattr__(name: str):
+    # `engine` and `async_engine` stay importable as before
+    if name == "engine":
+        return get_engine()
+    if name == "async_engine":
+        return get_async_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class _SyncSession(Session):
+    def __init__(self, bind=None, **kwargs):
+        super().__init__(bind=bind or get_engine(), **kwargs)
+
+
+class _AsyncSession(AsyncSession):
+    def __init__(self, bind=None, **kwargs):
+        super().__init__(bind=bind or get_async_engine(), **kwargs)
+
+
+SessionLocal = sessionmaker(class_=_SyncSession, autocommit=False, autoflush=False)
+AsyncSessionLocal = async_sessionmaker(class_=_AsyncSession, expire_on_commit=False)
+
+
+def _after_fork_in_child() -> None:
+    """Forked workers (gunicorn --preload, Celery prefork) must not share the parent's connections"""
+    if _engine is not None:
+        _engine.dispose(close=False)
+    if _async_engine is not None:
+        _async_engine.sync_engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
 
 # Base class for models
 Base = declarative_base()
@@ -41,5 +96,5 @@ async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
 
 async def init_db() -> None:
     """Initialize database tables"""
-    async with async_engine.begin() as conn:
+    async with get_async_engine().begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
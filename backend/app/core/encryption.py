@@ -1,4 +1,3 @@
-from cryptography.fernet import Fernet
 import base64
 from app.core.config import settings
 
@@ -7,9 +6,18 @@ class Encryption:
     """Encryption utilities for sensitive data"""
     
     def __init__(self):
-        # Ensure the key is properly formatted
-        key = settings.ENCRYPTION_KEY.encode() if isinstance(settings.ENCRYPTION_KEY, str) else settings.ENCRYPTION_KEY
-        self.fernet = Fernet(key)
+        self._fernet = None
+    
+    @property
+    def fernet(self):
+        # Built on first use: cryptography is slow to import and most
+        # processes (beat, most workers) never decrypt anything
+        if self._fernet is None:
+            from cryptography.fernet import Fernet
+            # Ensure the key is properly formatted
+            key = settings.ENCRYPTION_KEY.encode() if isinstance(settings.ENCRYPTION_KEY, str) else settings.ENCRYPTION_KEY
+            self._fernet = Fernet(key)
+        return self._fernet
     
     def encrypt(self, data: str) -> str:
         """Encrypt a string"""
@@ -0,0 +1,171 @@
+import asyncio
+import json
+from collections import defaultdict, deque
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Deque, Dict, Optional, Set
+
+import redis
+import redis.asyncio as aioredis
+
+from app.core.config import settings
+from app.core.logging import logger
+
+if TYPE_CHECKING:
+    # Celery workers publish events but never hold sockets: keep FastAPI out of them
+    from fastapi import WebSocket
+
+
+# Single channel: one subscription per API process regardless of user count
+EVENTS_CHANNEL = "unimanager:events"
+
+
+def _build_message(user_id: int, event_type: str, data: Dict[str, Any]) -> str:
+    return json.dumps({
+        "user_id": user_id,
+        "type": event_type,
+        "data": data,
+        "timestamp": datetime.utcnow().isoformat()
+    }, default=str)
+
+
+class EventPublisher:
+    """Publishes user-scoped events to Redis (sync for Celery, async for the API)"""
+
+    def __init__(self):
+        self._sync_client: Optional[redis.Redis] = None
+        self._async_client: Optional[aioredis.Redis] = None
+
+    def publish(self, user_id: int, event_type: str, data: Dict[str, Any]) -> None:
+        """Publish an event from synchronous code (Celery tasks)"""
+        try:
+            if self._sync_client is None:
+                self._sync_client = redis.from_url(settings.REDIS_URL)
+            self._sync_client.publish(EVENTS_CHANNEL, _build_message(user_id, event_type, data))
+        except Exception as e:
+            logger.error(f"Failed to publish event {event_type}: {e}")
+
+    async def publish_async(self, user_id: int, event_type: str, data: Dict[str, Any]) -> None:
+        """Publish an event from the API event loop"""
+        try:
+            if self._async_client is None:
+                self._async_client = aioredis.from_url(settings.REDIS_URL)
+            await self._async_client.publish(EVENTS_CHANNEL, _build_message(user_id, event_type, data))
+        except Exception as e:
+            logger.error(f"Failed to publish event {event_type}: {e}")
+
+
+class ConnectionManager:
+    """
+    Tracks WebSocket connections per user and fans out Redis events to them.
+
+    A single background task owns the Redis subscription; idle sockets cost
+    only a dict entry, so one process can hold tens of thousands of them.
+    Events are queued per socket and drained by a sender task that exists
+    only while the socket has a backlog, so a slow client never holds up
+    the listener or anyone else's events.
+    """
+
+    def __init__(self):
+        self.connections: Dict[int, Set["WebSocket"]] = defaultdict(set)
+        self._outboxes: Dict["WebSocket", Deque[str]] = {}
+        self._senders: Dict["WebSocket", asyncio.Task] = {}
+        self._listener: Optional[asyncio.Task] = None
+
+    @property
+    def connection_count(self) -> int:
+        return sum(len(sockets) for sockets in self.connections.values())
+
+    def connect(self, user_id: int, websocket: "WebSocket") -> None:
+        self.connections[user_id].add(websocket)
+
+    def disconnect(self, user_id: int, websocket: "WebSocket") -> None:
+        outbox = self._outboxes.pop(websocket, None)
+        if outbox:
+            # Ends the sender's loop
+            outbox.clear()
+        sockets = self.connections.get(user_id)
+        if not sockets:
+            return
+        sockets.discard(websocket)
+        if not sockets:
+            del self.connections[user_id]
+
+    def deliver(self, user_id: int, message: str) -> None:
+        """Queue a pre-serialized message for every socket of a user without waiting"""
+        for ws in self.connections.get(user_id, ()):
+            outbox = self._outboxes.get(ws)
+            if outbox is None:
+                outbox = self._outboxes[ws] = deque(maxlen=settings.WS_SEND_QUEUE_SIZE)
+            # Full: the oldest event falls off
+            outbox.append(message)
+            if ws not in self._senders:
+                self._senders[ws] = asyncio.create_task(self._drain(user_id, ws, outbox))
+
+    async def _drain(self, user_id: int, websocket: "WebSocket", outbox: Deque[str]) -> None:
+        try:
+            while outbox:
+                try:
+                    await websocket.send_text(outbox.popleft())
+                except Exception:
+                    self.disconnect(user_id, websocket)
+                    return
+        finally:
+            self._senders.pop(websocket, None)
+            if self._outboxes.get(websocket) is outbox:
+                del self._outboxes[websocket]
+
+    async def _listen(self) -> None:
+        while True:
+            client = aioredis.from_url(settings.REDIS_URL)
+            pubsub = client.pubsub()
+            try:
+                await pubsub.subscribe(EVENTS_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    raw = message["data"]
+                    if isinstance(raw, bytes):
+                        raw = raw.decode()
+                    try:
+                        user_id = int(json.loads(raw)["user_id"])
+                    except (ValueError, KeyError, TypeError):
+                        continue
+                    # Skip users without a socket in this process
+                    if user_id in self.connections:
+                        self.deliver(user_id, raw)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Event listener error, reconnecting: {e}")
+            finally:
+                # Don't leak a connection per reconnect
+                await self._close(client, pubsub)
+            await asyncio.sleep(1)
+
+    @staticmethod
+    async def _close(client: aioredis.Redis, pubsub: Any) -> None:
+        try:
+            await pubsub.aclose()
+            await client.aclose()
+        except Exception as e:
+            logger.warning(f"Failed to close event subscription: {e}")
+
+    def start(self) -> None:
+        """Start the Redis subscription task (called from the app lifespan)"""
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        for sender in list(self._senders.values()):
+            sender.cancel()
+
+
+event_publisher = EventPublisher()
+connection_manager = ConnectionManager()
@@ -0,0 +1,277 @@
+import asyncio
+import base64
+import hashlib
+import json
+import re
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+import redis.asyncio as aioredis
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.core.security import decode_token
+
+
+# Extend or drop a pending claim only if it is still ours
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class IdempotencyStore:
+    """
+    Redis records for Idempotency-Key requests
+
+    A key is first claimed as "pending" with a short TTL (so a crashed worker
+    frees it), renewed while the request runs, then overwritten with the
+    finished response for the replay window.
+    """
+
+    def __init__(self):
+        self._client: Optional[aioredis.Redis] = None
+
+    @property
+    def client(self) -> aioredis.Redis:
+        if self._client is None:
+            self._client = aioredis.from_url(settings.REDIS_URL)
+        return self._client
+
+    @staticmethod
+    def _pending(fingerprint: str, owner: str) -> str:
+        return json.dumps({"state": "pending", "fingerprint": fingerprint, "owner": owner})
+
+    @staticmethod
+    def _lock_ms() -> int:
+        return int(settings.IDEMPOTENCY_LOCK_SECONDS * 1000)
+
+    async def begin(self, key: str, fingerprint: str, owner: str) -> Optional[Dict[str, Any]]:
+        """Claim the key for owner; returns None if claimed, else the existing record"""
+        pending = self._pending(fingerprint, owner)
+        if await self.client.set(key, pending, nx=True, px=self._lock_ms()):
+            return None
+        record = await self.get(key)
+        # Expired between SET and GET: try once more
+        if record is None and await self.client.set(key, pending, nx=True, px=self._lock_ms()):
+            return None
+        return record or {"state": "pending", "fingerprint": fingerprint}
+
+    async def renew(self, key: str, fingerprint: str, owner: str) -> bool:
+        """Extend owner's pending claim; False if it expired or was replaced"""
+        return bool(await self.client.eval(_RENEW_SCRIPT, 1, key, self._pending(fingerprint, owner), self._lock_ms()))
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = await self.client.get(key)
+        return json.loads(raw) if raw else None
+
+    async def complete(self, key: str, fingerprint: str, status: int, headers: list, body: bytes) -> None:
+        await self.client.set(key, json.dumps({
+            "state": "done",
+            "fingerprint": fingerprint,
+            "status": status,
+            "headers": [[name.decode("latin-1"), value.decode("latin-1")] for name, value in headers],
+            "body": base64.b64encode(body).decode()
+        }), ex=settings.IDEMPOTENCY_TTL_SECONDS)
+
+    async def release(self, key: str, fingerprint: str, owner: str) -> None:
+        await self.client.eval(_RELEASE_SCRIPT, 1, key, self._pending(fingerprint, owner))
+
+    async def wait(self, key: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Poll until the in-flight request finishes or timeout passes
+
+        Returns the "done" record, None if the request was released without a
+        response (it failed), or the still "pending" record on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            record = await self.get(key)
+            if record is None or record["state"] == "done" or time.monotonic() >= deadline:
+                return record
+            await asyncio.sleep(0.05)
+
+
+idempotency_store = IdempotencyStore()
+
+
+async def _send_json(send: Send, status: int, detail: str) -> None:
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class IdempotencyMiddleware:
+    """
+    Replay the first response for retried requests carrying an Idempotency-Key
+
+    Keys are scoped to the authenticated user and the request fingerprint
+    (method, path, body). A duplicate arriving while the first request is
+    still running waits for it instead of repeating the work; if the first
+    one fails without a response, the duplicate runs it instead. Responses
+    with status >= 500 are not stored, so the client can retry them. If Redis
+    is unavailable, requests run normally.
+    """
+
+    def __init__(self, app: ASGIApp, path_pattern: str, methods=("POST",)):
+        self.app = app
+        self.path_pattern = re.compile(path_pattern)
+        self.methods = set(methods)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] not in self.methods
+            or not self.path_pattern.match(scope["path"])
+        ):
+            return await self.app(scope, receive, send)
+
+        headers = Headers(scope=scope)
+        idempotency_key = headers.get("idempotency-key")
+        if not idempotency_key:
+            return await self.app(scope, receive, send)
+
+        user_id = self._user_id(headers.get("authorization"))
+        if user_id is None:
+            # Unauthenticated requests are rejected downstream anyway
+            return await self.app(scope, receive, send)
+
+        if len(idempotency_key) > 255:
+            return await _send_json(send, 400, "Idempotency-Key must be at most 255 characters")
+
+        body = await self._read_body(receive)
+        fingerprint = hashlib.sha256(
+            scope["method"].encode() + b" " + scope["path"].encode() + b"\n" + body
+        ).hexdigest()
+        key = f"idempotency:{user_id}:{hashlib.sha256(idempotency_key.encode()).hexdigest()}"
+
+        owner = uuid.uuid4().hex
+        try:
+            record = await idempotency_store.begin(key, fingerprint, owner)
+        except Exception as e:
+            logger.warning(f"Idempotency store unavailable, running request unguarded: {e}")
+            return await self.app(scope, self._replay_receive(body, receive), send)
+
+        # Wait for the first request; if it fails without a stored response,
+        # claim the key and run this one in its place
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+        while record is not None and record["state"] == "pending" and record["fingerprint"] == fingerprint:
+            record = await idempotency_store.wait(key, deadline - time.monotonic())
+            if record is None:
+                record = await idempotency_store.begin(key, fingerprint, owner)
+            elif record["state"] == "pending":
+                return await _send_json(send, 409, "A request with this Idempotency-Key is still in progress")
+
+        if record is None:
+            return await self._run_and_store(scope, body, receive, send, key, fingerprint, owner)
+
+        if record["fingerprint"] != fingerprint:
+            return await _send_json(send, 422, "Idempotency-Key was already used with a different request")
+
+        await send({
+            "type": "http.response.start",
+            "status": record["status"],
+            "headers": [
+                (name.encode("latin-1"), value.encode("latin-1")) for name, value in record["headers"]
+            ] + [(b"idempotent-replayed", b"true")]
+        })
+        await send({"type": "http.response.body", "body": base64.b64decode(record["body"])})
+
+    async def _run_and_store(
+        self,
+        scope: Scope,
+        body: bytes,
+        receive: Receive,
+        send: Send,
+        key: str,
+        fingerprint: str,
+        owner: str
+    ) -> None:
+        start: Dict[str, Any] = {}
+        chunks = []
+
+        async def capture(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        # Streamed responses (bulk actions) can outlast the claim's TTL
+        heartbeat = asyncio.ensure_future(self._heartbeat(key, fingerprint, owner))
+        try:
+            await self.app(scope, self._replay_receive(body, receive), capture)
+        except Exception:
+            heartbeat.cancel()
+            await idempotency_store.release(key, fingerprint, owner)
+            raise
+        heartbeat.cancel()
+
+        try:
+            if start and start["status"] < 500:
+                await idempotency_store.complete(key, fingerprint, start["status"], start.get("headers", []), b"".join(chunks))
+            else:
+                await idempotency_store.release(key, fingerprint, owner)
+        except Exception as e:
+            logger.error(f"Failed to store idempotent response: {e}")
+
+    @staticmethod
+    async def _heartbeat(key: str, fingerprint: str, owner: str) -> None:
+        """Keep the pending claim alive while its request runs"""
+        # Renew at a third of the TTL so one missed beat is harmless
+        while True:
+            await asyncio.sleep(settings.IDEMPOTENCY_LOCK_SECONDS / 3)
+            try:
+                if not await idempotency_store.renew(key, fingerprint, owner):
+                    logger.warning(f"Idempotency claim {key} expired while its request was running")
+                    return
+            except Exception as e:
+                logger.warning(f"Failed to renew idempotency claim {key}: {e}")
+
+    @staticmethod
+    def _user_id(authorization: Optional[str]) -> Optional[str]:
+        if not authorization or not authorization.lower().startswith("bearer "):
+            return None
+        try:
+            return str(decode_token(authorization[7:]).get("sub")) or None
+        except Exception:
+            return None
+
+    @staticmethod
+    async def _read_body(receive: Receive) -> bytes:
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body", False):
+                return body
+
+    @staticmethod
+    def _replay_receive(body: bytes, receive: Receive) -> Receive:
+        """The buffered body once, then the client's own messages (http.disconnect when it leaves)"""
+        sent = False
+
+        async def replay() -> Message:
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        return replay
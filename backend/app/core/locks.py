@@ -0,0 +1,202 @@
+import functools
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+import redis
+
+from app.core.config import settings
+from app.core.logging import logger
+
+
+# Extend the lease only if we still own it
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# On completion: if a run was queued meanwhile, consume it and keep the lease
+# (returns 1); otherwise release the lease (returns 0). Atomic, so a request
+# queued just before release is never lost.
+_FINISH_SCRIPT = """
+if redis.call('get', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+if redis.call('del', KEYS[2]) == 1 then
+    redis.call('pexpire', KEYS[1], ARGV[2])
+    return 1
+end
+redis.call('del', KEYS[1])
+return 0
+"""
+
+_redis_client: Optional[redis.Redis] = None
+
+
+class LeaseLost(BaseException):
+    """
+    The running task's lease expired or was taken over by another worker
+
+    A BaseException, like Celery's time limits, so task bodies' catch-all
+    error handling can't swallow it and go on to commit.
+    """
+
+
+def get_redis() -> redis.Redis:
+    """Shared Redis client for locks"""
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.from_url(settings.REDIS_URL)
+    return _redis_client
+
+
+class RedisLease:
+    """Expiring Redis lock owned by a random token, renewed by a heartbeat thread"""
+
+    def __init__(self, name: str, ttl_seconds: int):
+        self.key = f"lock:{name}"
+        self.pending_key = f"lock:{name}:pending"
+        self.ttl_ms = ttl_seconds * 1000
+        self.token = uuid.uuid4().hex
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    def acquire(self) -> bool:
+        return bool(get_redis().set(self.key, self.token, nx=True, px=self.ttl_ms))
+
+    def renew(self) -> bool:
+        return bool(get_redis().eval(_RENEW_SCRIPT, 1, self.key, self.token, self.ttl_ms))
+
+    def queue_run(self) -> None:
+        """Ask the current holder to run once more when it finishes"""
+        get_redis().set(self.pending_key, 1, px=self.ttl_ms * 10)
+
+    def release(self) -> None:
+        get_redis().eval(_RELEASE_SCRIPT, 1, self.key, self.token)
+
+    def finish(self) -> bool:
+        """Release the lease, or keep it and return True if a run was queued"""
+        return bool(get_redis().eval(
+            _FINISH_SCRIPT, 2, self.key, self.pending_key, self.token, self.ttl_ms
+        ))
+
+    def start_heartbeat(self) -> None:
+        def beat():
+            renewed_at = time.monotonic()
+            # Renew at a third of the TTL so one missed beat is harmless
+            while not self._stop.wait(self.ttl_ms / 3000):
+                try:
+                    if not self.renew():
+                        logger.error(f"Lost lease {self.key} while running")
+                        self.lost.set()
+                        return
+                    renewed_at = time.monotonic()
+                except Exception as e:
+                    logger.error(f"Failed to renew lease {self.key}: {e}")
+                    # Unrenewed for a whole TTL: another worker may hold it by now
+                    if time.monotonic() - renewed_at >= self.ttl_ms / 1000:
+                        self.lost.set()
+                        return
+
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=beat, name=f"lease-{self.key}", daemon=True)
+        self._heartbeat.start()
+
+    def stop_heartbeat(self) -> None:
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+
+
+_current_lease: ContextVar[Optional[RedisLease]] = ContextVar("current_lease", default=None)
+
+
+def ensure_lease() -> None:
+    """
+    Raise LeaseLost if the running @singleton task no longer holds its lease
+
+    Call right before committing: once the lease is gone another worker may
+    be running the same task, and only one of them may write its results.
+    """
+    lease = _current_lease.get()
+    if lease is not None and lease.lost.is_set():
+        raise LeaseLost(f"{lease.key} was lost while running")
+
+
+def singleton(name: Optional[str] = None, ttl_seconds: int = 60, policy: str = "skip"):
+    """
+    Prevent overlapping runs of a periodic task across all workers
+
+    policy="skip": a run that finds the task already running returns immediately.
+    policy="queue": it also asks the running instance to run once more when done,
+    so work triggered meanwhile is picked up instead of dropped. Any number of
+    queued requests collapse into a single extra run.
+
+    If the heartbeat can't renew the lease, the body is told through
+    ensure_lease(), which it calls before committing; a LeaseLost escaping
+    the body ends the run with status "aborted".
+
+    Apply below @celery_app.task. If Redis is unreachable the task runs unguarded.
+    """
+    if policy not in ("skip", "queue"):
+        raise ValueError(f"Unknown singleton policy: {policy}")
+
+    def decorator(func: Callable):
+        lock_name = name or f"{func.__module__}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            lease = RedisLease(lock_name, ttl_seconds)
+
+            try:
+                acquired = lease.acquire()
+            except Exception as e:
+                logger.warning(f"Lock backend unavailable for {lock_name}, running unguarded: {e}")
+                return func(*args, **kwargs)
+
+            if not acquired:
+                if policy == "queue":
+                    lease.queue_run()
+                logger.info(f"{lock_name} is already running, {'queued' if policy == 'queue' else 'skipped'}")
+                return {
+                    "status": "skipped",
+                    "reason": "already_running",
+                    "queued": policy == "queue"
+                }
+
+            lease.start_heartbeat()
+            token = _current_lease.set(lease)
+            try:
+                while True:
+                    try:
+                        result = func(*args, **kwargs)
+                    except LeaseLost as e:
+                        logger.error(f"Aborted {lock_name}: {e}")
+                        return {"status": "aborted", "reason": "lease_lost"}
+                    except Exception:
+                        # Leave any queued run for the next scheduled one
+                        lease.release()
+                        raise
+                    if lease.lost.is_set() or not lease.finish():
+                        return result
+                    logger.info(f"Running queued {lock_name}")
+            finally:
+                _current_lease.reset(token)
+                lease.stop_heartbeat()
+
+        return wrapper
+
+    return decorator
@@ -1,28 +1,107 @@
+"""
+Non-blocking logging
+
+Records go through a QueueHandler into a bounded in-memory ring and are
+written to stdout by a QueueListener thread, so a slow log sink (container
+log driver backpressure, a full disk) never stalls a request or the event
+loop. When the ring is full the oldest record is dropped and counted;
+log_queue.dropped and log_queue.enqueued are exported as metrics.
+
+Audit events are handed over as dicts and encoded with orjson on the
+listener thread.
+"""
+import atexit
 import logging
+import logging.handlers
+import os
+import queue
 import sys
-from typing import Any
 from datetime import datetime
-import json
+from typing import Any, Optional
+
+import orjson
+
+from app.core.config import settings
+
+
+class RingQueue(queue.Queue):
+    """Bounded queue whose put_nowait drops the oldest item instead of raising Full"""
+
+    def __init__(self, maxsize: int):
+        super().__init__(maxsize)
+        self.enqueued = 0
+        self.dropped = 0
+
+    def put_nowait(self, item: Any) -> None:
+        with self.mutex:
+            if 0 < self.maxsize <= self._qsize():
+                self._get()
+                # The dropped record will never be task_done()
+                self.unfinished_tasks -= 1
+                self.dropped += 1
+            self._put(item)
+            self.enqueued += 1
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+
+class LogFormatter(logging.Formatter):
+    """Plain text lines; audit records carry a dict rendered as JSON here"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        audit = getattr(record, "audit", None)
+        if audit is not None:
+            record.msg = orjson.dumps(audit, default=str).decode()
+            record.args = None
+        return super().format(record)
+
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+log_queue = RingQueue(settings.LOG_QUEUE_SIZE)
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _start_listener() -> None:
+    global _listener
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(LogFormatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+
+
+def _restart_in_child() -> None:
+    """A forked child (Celery prefork pool) inherits the queue but not the listener thread"""
+    global log_queue
+    log_queue = RingQueue(settings.LOG_QUEUE_SIZE)
+    _queue_handler.queue = log_queue
+    _start_listener()
+
+
+def flush_logs() -> None:
+    """Stop the listener after writing out everything queued"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+_queue_handler = logging.handlers.QueueHandler(log_queue)
+# Only merges args into the message; the listener's formatter lays out the line
+_queue_handler.setFormatter(logging.Formatter("%(message)s"))
+logging.basicConfig(level=logging.INFO, handlers=[_queue_handler])
+_start_listener()
+atexit.register(flush_logs)
+os.register_at_fork(after_in_child=_restart_in_child)
 
 logger = logging.getLogger("unimanager")
 
 
 class AuditLogger:
     """Audit logger for security-sensitive operations"""
-    
+
     def __init__(self):
         self.logger = logging.getLogger("unimanager.audit")
         self.logger.setLevel(logging.INFO)
-    
+
     def log(
         self,
         action: str,
@@ -30,22 +109,20 @@ class AuditLogger:
         details: dict[str, Any] = None,
         level: str = "INFO"
     ):
-        """Log an audit event"""
+        """Log an audit event (JSON-encoded off the caller's thread)"""
         log_data = {
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": datetime.utcnow(),
             "action": action,
             "user_id": user_id,
             "details": details or {}
         }
-        
-        log_message = json.dumps(log_data)
-        
+
         if level == "ERROR":
-            self.logger.error(log_message)
+            self.logger.error(action, extra={"audit": log_data})
         elif level == "WARNING":
-            self.logger.warning(log_message)
+            self.logger.warning(action, extra={"audit": log_data})
         else:
-            self.logger.info(log_message)
+            self.logger.info(action, extra={"audit": log_data})
 
 
 audit_logger = AuditLogger()
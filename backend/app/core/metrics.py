@@ -0,0 +1,151 @@
+import os
+import shutil
+from prometheus_client import (
+    Counter,
+    Gauge,
+    Histogram,
+    CollectorRegistry,
+    REGISTRY,
+    generate_latest,
+    CONTENT_TYPE_LATEST,
+)
+from prometheus_client import multiprocess
+
+
+# Multiprocess mode writes a file per metric and process from the first
+# definition below on; the directory may not exist yet in a fresh container
+if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+
+# HTTP request metrics
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+
+# Sampled at scrape time, per process: under gunicorn each series is labelled
+# with the pid of the worker that served a scrape, dropped when it exits
+
+# Database pool metrics
+db_pool_size = Gauge("db_pool_size", "Configured size of the async DB pool", multiprocess_mode="liveall")
+db_pool_checked_out = Gauge("db_pool_checked_out", "Connections currently checked out", multiprocess_mode="liveall")
+db_pool_checked_in = Gauge("db_pool_checked_in", "Idle connections in the pool", multiprocess_mode="liveall")
+db_pool_overflow = Gauge("db_pool_overflow", "Connections opened beyond the pool size", multiprocess_mode="liveall")
+
+# Logging pipeline metrics
+log_queue_depth = Gauge("log_queue_depth", "Log records waiting for the writer thread", multiprocess_mode="liveall")
+log_records_dropped = Gauge(
+    "log_records_dropped",
+    "Log records dropped because the log queue was full",
+    multiprocess_mode="liveall"
+)
+
+# Proxmox API metrics
+proxmox_request_duration_seconds = Histogram(
+    "proxmox_request_duration_seconds",
+    "Proxmox API call latency",
+    ["server", "operation"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+proxmox_scheduler_wait_seconds = Histogram(
+    "proxmox_scheduler_wait_seconds",
+    "Time Proxmox requests queued for a rate-limit token",
+    ["priority"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+proxmox_request_errors_total = Counter(
+    "proxmox_request_errors_total",
+    "Failed Proxmox API calls",
+    ["server", "operation"]
+)
+
+# Celery metrics
+celery_task_duration_seconds = Histogram(
+    "celery_task_duration_seconds",
+    "Celery task execution time",
+    ["task", "state"],
+    buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 1800.0)
+)
+
+# Billing cycle metrics
+billing_cycle_vms_billed = Gauge(
+    "billing_cycle_vms_billed",
+    "VMs billed in the last billing cycle",
+    multiprocess_mode="livemax"
+)
+billing_cycle_amount = Gauge(
+    "billing_cycle_amount",
+    "Total amount billed in the last billing cycle",
+    multiprocess_mode="livemax"
+)
+billing_cycle_seconds = Gauge(
+    "billing_cycle_seconds",
+    "Duration of the last billing cycle",
+    multiprocess_mode="livemax"
+)
+balance_drift_users = Gauge(
+    "balance_drift_users",
+    "Users whose balance differed from the replayed snapshot in the last check",
+    multiprocess_mode="livemax"
+)
+
+
+def update_db_pool_metrics() -> None:
+    """Sample the async engine pool into the DB pool gauges"""
+    from app.core import database
+
+    # Not created yet: nothing to report, and don't build it just for a scrape
+    if database._async_engine is None:
+        return
+    pool = database._async_engine.pool
+    # NullPool/StaticPool (tests) do not expose counters
+    if not hasattr(pool, "checkedout"):
+        return
+
+    db_pool_size.set(pool.size())
+    db_pool_checked_out.set(pool.checkedout())
+    db_pool_checked_in.set(pool.checkedin())
+    db_pool_overflow.set(max(pool.overflow(), 0))
+
+
+def update_log_queue_metrics() -> None:
+    """Sample the logging ring buffer into its gauges"""
+    from app.core import logging as app_logging
+
+    log_queue_depth.set(app_logging.log_queue.qsize())
+    log_records_dropped.set(app_logging.log_queue.dropped)
+
+
+def get_registry() -> CollectorRegistry:
+    """Registry to expose, aggregating worker processes in multiprocess mode"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def reset_multiprocess_dir() -> None:
+    """Clear samples left by a previous run (call once, before any child forks)"""
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if not path:
+        return
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def mark_process_dead(pid: int) -> None:
+    """Drop an exited process's live gauges from the aggregated view"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(pid)
+
+
+def render_metrics() -> bytes:
+    """Render metrics in Prometheus text format"""
+    update_db_pool_metrics()
+    update_log_queue_metrics()
+    return generate_latest(get_registry())
+
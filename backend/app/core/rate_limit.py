@@ -8,11 +8,19 @@ class RateLimiter:
     """Redis-based rate limiter for brute force protection"""
     
     def __init__(self):
-        try:
-            self.redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
-        except Exception as e:
-            logger.error(f"Failed to connect to Redis: {e}")
-            self.redis_client = None
+        self._redis_client: Optional[redis.Redis] = None
+        self._client_failed = False
+    
+    @property
+    def redis_client(self) -> Optional[redis.Redis]:
+        """Client created on first use rather than at import"""
+        if self._redis_client is None and not self._client_failed:
+            try:
+                self._redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+            except Exception as e:
+                logger.error(f"Failed to connect to Redis: {e}")
+                self._client_failed = True
+        return self._redis_client
     
     def is_rate_limited(self, key: str, max_attempts: int, window_seconds: int) -> bool:
         """
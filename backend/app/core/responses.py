@@ -0,0 +1,36 @@
+from functools import lru_cache
+from typing import Any
+
+from fastapi import Response, status
+from fastapi.responses import ORJSONResponse
+from pydantic import TypeAdapter
+
+
+# Project-wide default response class (see app.main)
+DefaultResponse = ORJSONResponse
+
+
+@lru_cache(maxsize=None)
+def _adapter(schema: Any) -> TypeAdapter:
+    return TypeAdapter(schema)
+
+
+def serialize(schema: Any, data: Any) -> bytes:
+    """
+    Validate ORM objects against a schema once and dump JSON in Rust
+
+    FastAPI's default path validates the return value against response_model,
+    converts it with jsonable_encoder and then encodes it again. For large
+    lists that is most of the request time.
+    """
+    adapter = _adapter(schema)
+    return adapter.dump_json(adapter.validate_python(data, from_attributes=True))
+
+
+def model_response(schema: Any, data: Any, status_code: int = status.HTTP_200_OK) -> Response:
+    """Build a JSON response from ORM-backed data (keep response_model for the docs)"""
+    return Response(
+        content=serialize(schema, data),
+        status_code=status_code,
+        media_type="application/json"
+    )
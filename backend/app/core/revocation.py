@@ -0,0 +1,171 @@
+"""
+Token revocation
+
+Tokens carry a jti and an iat. A single token is revoked by its jti
+(logout). A user's tokens are revoked all at once, up to a point in time
+(ban), with a "revoked before" entry for the user. Both lists live in
+Redis, and every process keeps a copy in memory, so checking a token
+costs two dict lookups and no round trip:
+
+- A revocation made here applies in this process at once. It is also
+  broadcast on the cache bus, and other processes reload on their next
+  check.
+- Every process also reloads after TOKEN_REVOCATION_SYNC_SECONDS. This
+  bounds how long a missed broadcast can delay a revocation. If Redis is
+  down, the last copy stays in use.
+
+An exact set rather than a bloom filter: the lists only hold tokens that
+have not expired yet, so they stay small, and a false positive would log
+someone out.
+"""
+import asyncio
+import time
+from typing import Any, Dict, Iterable, Optional
+
+import redis
+import redis.asyncio as aioredis
+
+from app.core.cache_bus import cache_bus
+from app.core.config import settings
+from app.core.logging import logger
+
+
+REVOKED_TOKENS_KEY = "unimanager:revoked-tokens"  # Sorted set: jti scored by the token's exp
+REVOKED_USERS_KEY = "unimanager:revoked-users"  # Hash: user ID -> tokens issued before this are revoked
+
+
+class TokenRevocations:
+    """In-memory copy of the revocation lists, synced from Redis"""
+
+    def __init__(self):
+        self._tokens: Dict[str, float] = {}
+        self._users: Dict[int, int] = {}
+        self._synced_at: Optional[float] = None
+        # Bumped by local revocations, so a reload that started earlier can't mark them synced
+        self._generation = 0
+        self._loads: Dict[asyncio.AbstractEventLoop, asyncio.Task] = {}
+        self._clients: Dict[asyncio.AbstractEventLoop, aioredis.Redis] = {}
+        self._sync_client: Optional[redis.Redis] = None
+        cache_bus.register("token_revocations", self._invalidate)
+
+    def _invalidate(self, key: str) -> None:
+        self._synced_at = None
+
+    def reset(self) -> None:
+        self._tokens, self._users, self._synced_at = {}, {}, None
+
+    def _client(self) -> aioredis.Redis:
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = aioredis.from_url(settings.REDIS_URL)
+        return client
+
+    def is_revoked(self, claims: Dict[str, Any]) -> bool:
+        """Check claims against the in-memory lists only"""
+        if claims.get("jti") in self._tokens:
+            return True
+        try:
+            revoked_before = self._users.get(int(claims.get("sub")))
+        except (TypeError, ValueError):
+            return False
+        # Tokens issued before iat existed count as issued at 0
+        return revoked_before is not None and claims.get("iat", 0) < revoked_before
+
+    async def check(self, claims: Dict[str, Any]) -> bool:
+        """Whether the token has been revoked, syncing first if the copy is stale"""
+        await self.sync()
+        return self.is_revoked(claims)
+
+    async def sync(self) -> None:
+        """Reload from Redis if the copy is older than TOKEN_REVOCATION_SYNC_SECONDS"""
+        if self._synced_at is not None and time.monotonic() - self._synced_at < settings.TOKEN_REVOCATION_SYNC_SECONDS:
+            return
+        loop = asyncio.get_running_loop()
+        load = self._loads.get(loop)
+        if load is None or load.done():
+            load = self._loads[loop] = loop.create_task(self._load())
+        # Shared by every request waiting for it; one being cancelled must not cancel it
+        await asyncio.shield(load)
+
+    async def _load(self) -> None:
+        generation = self._generation
+        now = time.time()
+        try:
+            client = self._client()
+            pipe = client.pipeline(transaction=False)
+            pipe.zremrangebyscore(REVOKED_TOKENS_KEY, "-inf", now)
+            pipe.zrange(REVOKED_TOKENS_KEY, 0, -1, withscores=True)
+            pipe.hgetall(REVOKED_USERS_KEY)
+            _, tokens, users = await pipe.execute()
+
+            # Every token issued before these has expired by now
+            oldest = now - settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400
+            expired = [user_id for user_id, revoked_before in users.items() if int(revoked_before) < oldest]
+            if expired:
+                await client.hdel(REVOKED_USERS_KEY, *expired)
+        except Exception as e:
+            logger.warning(f"Failed to load token revocations, keeping the last copy: {e}")
+        else:
+            self._tokens = {jti.decode(): exp for jti, exp in tokens}
+            self._users = {
+                int(user_id): int(revoked_before)
+                for user_id, revoked_before in users.items()
+                if int(revoked_before) >= oldest
+            }
+        if self._generation == generation:
+            self._synced_at = time.monotonic()
+
+    def _apply_users(self, user_ids: Iterable[int], revoked_before: int) -> None:
+        self._generation += 1
+        for user_id in user_ids:
+            self._users[user_id] = max(self._users.get(user_id, 0), revoked_before)
+
+    @staticmethod
+    def _revoked_before() -> int:
+        # iat has whole seconds: include tokens issued earlier in the current one
+        return int(time.time()) + 1
+
+    async def revoke_token(self, claims: Dict[str, Any]) -> None:
+        """Revoke one token until it expires (tokens without a jti can't be)"""
+        jti, exp = claims.get("jti"), claims.get("exp")
+        if jti is None or exp is None:
+            return
+        try:
+            await self._client().zadd(REVOKED_TOKENS_KEY, {jti: exp})
+        except Exception as e:
+            logger.error(f"Failed to store token revocation: {e}")
+        self._generation += 1
+        self._tokens[jti] = exp
+        cache_bus.publish("token_revocations", jti)
+
+    async def revoke_users_async(self, user_ids: Iterable[int]) -> None:
+        """Revoke every token issued so far to these users (from the API event loop)"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        revoked_before = self._revoked_before()
+        try:
+            await self._client().hset(REVOKED_USERS_KEY, mapping={user_id: revoked_before for user_id in user_ids})
+        except Exception as e:
+            logger.error(f"Failed to store user token revocations: {e}")
+        self._apply_users(user_ids, revoked_before)
+        cache_bus.publish("token_revocations", "users")
+
+    def revoke_users(self, user_ids: Iterable[int]) -> None:
+        """Revoke every token issued so far to these users (from synchronous code)"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        revoked_before = self._revoked_before()
+        try:
+            if self._sync_client is None:
+                self._sync_client = redis.from_url(settings.REDIS_URL)
+            self._sync_client.hset(REVOKED_USERS_KEY, mapping={user_id: revoked_before for user_id in user_ids})
+        except Exception as e:
+            logger.error(f"Failed to store user token revocations: {e}")
+        self._apply_users(user_ids, revoked_before)
+        cache_bus.publish_sync("token_revocations", "users")
+
+
+token_revocations = TokenRevocations()
@@ -1,3 +1,4 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 from jose import JWTError, jwt
@@ -5,7 +6,10 @@ from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.core.config import settings
+from app.core.revocation import token_revocations
 import hashlib
+import time
+import uuid
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -39,7 +43,7 @@ def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta]
     else:
         expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     
-    to_encode.update({"exp": expire, "type": "access"})
+    to_encode.update({"exp": expire, "iat": datetime.utcnow(), "jti": uuid.uuid4().hex, "type": "access"})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
@@ -48,22 +52,58 @@ def create_refresh_token(data: Dict[str, Any]) -> str:
     """Create a JWT refresh token"""
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
-    to_encode.update({"exp": expire, "type": "refresh"})
+    to_encode.update({"exp": expire, "iat": datetime.utcnow(), "jti": uuid.uuid4().hex, "type": "refresh"})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
 
+class TokenCache:
+    """Bounded LRU of verified token claims, each kept only until its token expires"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._claims: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        claims = self._claims.get(token)
+        if claims is None:
+            return None
+        if claims["exp"] <= time.time():
+            self._claims.pop(token, None)
+            return None
+        self._claims.move_to_end(token)
+        return dict(claims)
+
+    def put(self, token: str, claims: Dict[str, Any]) -> None:
+        if self.size <= 0 or "exp" not in claims:
+            return
+        self._claims[token] = dict(claims)
+        while len(self._claims) > self.size:
+            self._claims.popitem(last=False)
+
+    def clear(self) -> None:
+        self._claims.clear()
+
+
+# Signature checks are skipped for tokens seen before; revocation is checked separately
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE)
+
+
 def decode_token(token: str) -> Dict[str, Any]:
     """Decode and validate a JWT token"""
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        return payload
     except JWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    token_cache.put(token, payload)
+    return payload
 
 
 def verify_token_type(payload: Dict[str, Any], expected_type: str) -> None:
@@ -77,6 +117,16 @@ def verify_token_type(payload: Dict[str, Any], expected_type: str) -> None:
         )
 
 
+async def verify_not_revoked(payload: Dict[str, Any]) -> None:
+    """Reject tokens revoked by logout or ban (checked in memory)"""
+    if await token_revocations.check(payload):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
 async def get_current_user_id(
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ) -> int:
@@ -84,6 +134,7 @@ async def get_current_user_id(
     token = credentials.credentials
     payload = decode_token(token)
     verify_token_type(payload, "access")
+    await verify_not_revoked(payload)
     
     user_id: Optional[int] = payload.get("sub")
     if user_id is None:
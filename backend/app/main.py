@@ -1,25 +1,48 @@
 from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from contextlib import asynccontextmanager
+import asyncio
+import os
 import time
 
+from app.core import database
+from app.core.cache_bus import cache_bus
 from app.core.config import settings
-from app.core.database import init_db
 from app.core.logging import logger
-from app.api.v1 import auth, users, vms, templates, payments, admin, monitoring
+from app.core.responses import DefaultResponse
+from app.core.metrics import http_request_duration_seconds, render_metrics, CONTENT_TYPE_LATEST
+from app.core.events import connection_manager
+from app.core.idempotency import IdempotencyMiddleware
+from app.services.proxmox import proxmox_clients
+from app.api.v1 import auth, users, vms, templates, payments, admin, monitoring, ws
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Startup and shutdown events"""
+    """
+    Startup and shutdown events
+
+    Runs once per worker process (gunicorn forks after importing the app), so
+    everything bound to an event loop or holding connections is set up here
+    rather than at import.
+    """
     # Startup
-    logger.info("Starting Uni-Manager API...")
-    # await init_db()  # Uncomment if not using Alembic
+    logger.info(f"Starting Uni-Manager API worker {os.getpid()}...")
+    # await database.init_db()  # Uncomment if not using Alembic
     logger.info("Database initialized")
+    # Keep-alive connections to Proxmox for this worker's loop
+    proxmox_clients.bind(asyncio.get_running_loop())
+    connection_manager.start()
+    cache_bus.start()
     yield
     # Shutdown
-    logger.info("Shutting down Uni-Manager API...")
+    logger.info(f"Shutting down Uni-Manager API worker {os.getpid()}...")
+    await connection_manager.stop()
+    await cache_bus.stop()
+    await proxmox_clients.aclose()
+    if database._async_engine is not None:
+        await database._async_engine.dispose()
 
 
 # Create FastAPI app
@@ -29,6 +52,7 @@ app = FastAPI(
     openapi_url=f"{settings.API_V1_PREFIX}/openapi.json",
     docs_url=f"{settings.API_V1_PREFIX}/docs",
     redoc_url=f"{settings.API_V1_PREFIX}/redoc",
+    default_response_class=DefaultResponse,
     lifespan=lifespan
 )
 
@@ -42,6 +66,12 @@ if settings.BACKEND_CORS_ORIGINS:
         allow_headers=["*"],
     )
 
+# Replay retried VM creates and actions (inside the timing middleware)
+app.add_middleware(
+    IdempotencyMiddleware,
+    path_pattern=rf"^{settings.API_V1_PREFIX}/vms(/\d+/action|/actions|/bulk-delete)?/?$"
+)
+
 
 # Request timing middleware
 @app.middleware("http")
@@ -50,6 +80,16 @@ async def add_process_time_header(request: Request, call_next):
     response = await call_next(request)
     process_time = time.time() - start_time
     response.headers["X-Process-Time"] = str(process_time)
+    
+    # Label by route template (not raw path) to keep cardinality bounded
+    route = request.scope.get("route")
+    route_path = getattr(route, "path", None) or "unmatched"
+    http_request_duration_seconds.labels(
+        method=request.method,
+        route=route_path,
+        status=str(response.status_code)
+    ).observe(process_time)
+    
     return response
 
 
@@ -74,6 +114,13 @@ async def health_check():
     }
 
 
+# Prometheus metrics
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics endpoint"""
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+
 # Root endpoint
 @app.get("/", tags=["root"])
 async def root():
@@ -93,6 +140,7 @@ app.include_router(templates.router, prefix=settings.API_V1_PREFIX, tags=["templ
 app.include_router(payments.router, prefix=settings.API_V1_PREFIX, tags=["payments"])
 app.include_router(admin.router, prefix=settings.API_V1_PREFIX, tags=["admin"])
 app.include_router(monitoring.router, prefix=settings.API_V1_PREFIX, tags=["monitoring"])
+app.include_router(ws.router, tags=["websocket"])  # Served at /ws/* (see Caddyfile)
 
 
 if __name__ == "__main__":
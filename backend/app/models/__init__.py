@@ -10,6 +10,10 @@ from app.models.vm import VM, VMState
 from app.models.transaction import Transaction, TransactionType
 from app.models.log import Log
 from app.models.task import Task, TaskStatus
+from app.models.metric import MetricSample, MetricRollup, MetricCursor
+from app.models.usage import UsageSegment, UsageDaily, UsageMonthly, UsageSegmentArchive, LedgerPeriod, ServerUsage
+from app.models.invoice import Invoice
+from app.models.balance import BalanceSnapshot
 
 __all__ = [
     "User",
@@ -25,4 +29,15 @@ __all__ = [
     "Log",
     "Task",
     "TaskStatus",
+    "MetricSample",
+    "MetricRollup",
+    "MetricCursor",
+    "UsageSegment",
+    "UsageDaily",
+    "UsageMonthly",
+    "UsageSegmentArchive",
+    "LedgerPeriod",
+    "ServerUsage",
+    "Invoice",
+    "BalanceSnapshot",
 ]
@@ -0,0 +1,28 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, Numeric, Index
+from app.core.database import Base
+
+
+class BalanceSnapshot(Base):
+    """A user's balance at a point in time, so audits only replay what came after"""
+    __tablename__ = "balance_snapshots"
+
+    id = Column(Integer, primary_key=True)
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    as_of = Column(DateTime(timezone=True), nullable=False)
+
+    balance = Column(Numeric(10, 2), nullable=False)
+    # Every transaction up to this ID is reflected in balance
+    last_txn_id = Column(Integer, nullable=False, default=0)
+    # users.usage_charged at the time
+    usage_charged = Column(Numeric(14, 2), nullable=False, default=0)
+
+    # balance minus the value replayed from the previous snapshot; NULL for a user's first
+    drift = Column(Numeric(10, 2), nullable=True)
+
+    __table_args__ = (
+        Index("ix_balance_snapshots_user", "user_id", "id"),
+    )
+
+    def __repr__(self):
+        return f"<BalanceSnapshot(user_id={self.user_id}, as_of={self.as_of}, balance={self.balance})>"
@@ -0,0 +1,29 @@
+from sqlalchemy import Column, Integer, String, Date, DateTime, Float, ForeignKey, Numeric, JSON, UniqueConstraint
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class Invoice(Base):
+    """Monthly usage invoice, generated from usage_monthly when a month is closed"""
+    __tablename__ = "invoices"
+
+    id = Column(Integer, primary_key=True)
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    # First day of the invoiced month
+    month = Column(Date, nullable=False)
+    number = Column(String(32), nullable=False, unique=True)
+
+    total = Column(Numeric(14, 2), nullable=False)
+    vm_hours = Column(Float, nullable=False, default=0)
+    # One line per VM: vm_id, name, template, hours, amount
+    lines = Column(JSON, nullable=False)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "month", name="uq_invoices_user_month"),
+    )
+
+    def __repr__(self):
+        return f"<Invoice(number={self.number}, user_id={self.user_id}, total={self.total})>"
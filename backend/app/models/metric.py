@@ -0,0 +1,85 @@
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Float, ForeignKey, Index, UniqueConstraint
+from app.core.database import Base
+
+
+class MetricSample(Base):
+    """Raw Proxmox rrddata sample (node or VM)"""
+    __tablename__ = "metric_samples"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+
+    # Resource identification
+    server_id = Column(Integer, ForeignKey("servers.id", ondelete="CASCADE"), nullable=False)
+    resource_type = Column(String(10), nullable=False)  # node, vm
+    resource_id = Column(String(100), nullable=False)  # Node name or Proxmox VMID
+
+    # Sample time (from Proxmox)
+    timestamp = Column(DateTime(timezone=True), nullable=False)
+
+    # Values
+    cpu = Column(Float, nullable=True)  # Fraction of allocated CPUs (0-1)
+    mem = Column(Float, nullable=True)  # Bytes used
+    maxmem = Column(Float, nullable=True)  # Bytes available
+    netin = Column(Float, nullable=True)  # Bytes/s
+    netout = Column(Float, nullable=True)  # Bytes/s
+    diskread = Column(Float, nullable=True)  # Bytes/s
+    diskwrite = Column(Float, nullable=True)  # Bytes/s
+
+    # Samples are appended in time order, so a BRIN index stays tiny
+    __table_args__ = (
+        Index("ix_metric_samples_timestamp_brin", "timestamp", postgresql_using="brin"),
+    )
+
+    def __repr__(self):
+        return f"<MetricSample(resource={self.resource_type}:{self.resource_id}, timestamp={self.timestamp})>"
+
+
+class MetricRollup(Base):
+    """Downsampled metrics bucket, maintained incrementally by the collector"""
+    __tablename__ = "metric_rollups"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+
+    # Resource identification
+    server_id = Column(Integer, ForeignKey("servers.id", ondelete="CASCADE"), nullable=False)
+    resource_type = Column(String(10), nullable=False)
+    resource_id = Column(String(100), nullable=False)
+
+    # Bucket
+    bucket_seconds = Column(Integer, nullable=False)  # 60, 300, 3600 (see ROLLUP_RETENTION)
+    bucket_start = Column(DateTime(timezone=True), nullable=False)
+
+    # Aggregates (averages are sum / sample_count)
+    sample_count = Column(Integer, nullable=False, default=0)
+    cpu_sum = Column(Float, nullable=False, default=0.0)
+    cpu_max = Column(Float, nullable=False, default=0.0)
+    mem_sum = Column(Float, nullable=False, default=0.0)
+    mem_max = Column(Float, nullable=False, default=0.0)
+    maxmem = Column(Float, nullable=True)
+    netin_sum = Column(Float, nullable=False, default=0.0)
+    netout_sum = Column(Float, nullable=False, default=0.0)
+    diskread_sum = Column(Float, nullable=False, default=0.0)
+    diskwrite_sum = Column(Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        UniqueConstraint(
+            "resource_type", "server_id", "resource_id", "bucket_seconds", "bucket_start",
+            name="uq_metric_rollups_bucket"
+        ),
+    )
+
+    def __repr__(self):
+        return f"<MetricRollup(resource={self.resource_type}:{self.resource_id}, bucket={self.bucket_seconds}@{self.bucket_start})>"
+
+
+class MetricCursor(Base):
+    """Newest stored sample per resource, so collection skips rrddata it already has"""
+    __tablename__ = "metric_cursors"
+
+    resource_type = Column(String(10), primary_key=True)
+    server_id = Column(Integer, ForeignKey("servers.id", ondelete="CASCADE"), primary_key=True)
+    resource_id = Column(String(100), primary_key=True)
+    latest = Column(DateTime(timezone=True), nullable=False)
+
+    def __repr__(self):
+        return f"<MetricCursor(resource={self.resource_type}:{self.resource_id}, latest={self.latest})>"
@@ -0,0 +1,127 @@
+from sqlalchemy import Column, Integer, BigInteger, Date, DateTime, Float, ForeignKey, Numeric, Index, UniqueConstraint, text
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class UsageSegment(Base):
+    """Billable interval of a VM at a fixed hourly rate"""
+    __tablename__ = "usage_segments"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+
+    # Owner (denormalized so billing never joins VMs)
+    vm_id = Column(Integer, ForeignKey("user_vms.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+
+    # Price per hour, captured when the segment opens
+    rate = Column(Numeric(10, 4), nullable=False)
+
+    # Interval; ended_at is NULL while the VM is still billable
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    ended_at = Column(DateTime(timezone=True), nullable=True)
+
+    # Charged up to here; settled once closed and fully charged
+    billed_until = Column(DateTime(timezone=True), nullable=False)
+    settled_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # At most one open segment per VM
+        Index(
+            "uq_usage_segments_open_vm", "vm_id", unique=True,
+            postgresql_where=text("ended_at IS NULL"),
+            sqlite_where=text("ended_at IS NULL")
+        ),
+        # The billing cycle only scans unsettled segments
+        Index(
+            "ix_usage_segments_unsettled", "user_id",
+            postgresql_where=text("settled_at IS NULL"),
+            sqlite_where=text("settled_at IS NULL")
+        ),
+    )
+
+    def __repr__(self):
+        return f"<UsageSegment(id={self.id}, vm_id={self.vm_id}, rate={self.rate}, ended_at={self.ended_at})>"
+
+
+class UsageDaily(Base):
+    """Amount billed per user and template per day, maintained by the billing cycle"""
+    __tablename__ = "usage_daily"
+
+    id = Column(Integer, primary_key=True)
+
+    day = Column(Date, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    template_id = Column(Integer, ForeignKey("vm_templates.id", ondelete="CASCADE"), nullable=False)
+
+    amount = Column(Numeric(14, 4), nullable=False, default=0)
+    vm_hours = Column(Float, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("day", "user_id", "template_id", name="uq_usage_daily_key"),
+    )
+
+
+class UsageMonthly(Base):
+    """Amount charged per VM in a closed month, rolled up from its usage segments"""
+    __tablename__ = "usage_monthly"
+
+    id = Column(Integer, primary_key=True)
+
+    # First day of the month
+    month = Column(Date, nullable=False)
+    vm_id = Column(Integer, ForeignKey("user_vms.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    template_id = Column(Integer, ForeignKey("vm_templates.id", ondelete="CASCADE"), nullable=False)
+
+    amount = Column(Numeric(14, 4), nullable=False, default=0)
+    vm_hours = Column(Float, nullable=False, default=0)
+    segments = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("month", "vm_id", name="uq_usage_monthly_key"),
+        Index("ix_usage_monthly_user", "user_id", "month"),
+    )
+
+
+class UsageSegmentArchive(Base):
+    """Settled usage segments of compacted months (cold storage, never read by billing)"""
+    __tablename__ = "usage_segments_archive"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+
+    vm_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    rate = Column(Numeric(10, 4), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    ended_at = Column(DateTime(timezone=True), nullable=False)
+    billed_until = Column(DateTime(timezone=True), nullable=False)
+    settled_at = Column(DateTime(timezone=True), nullable=False)
+
+    # Month whose compaction moved the segment here
+    archived_month = Column(Date, nullable=False, index=True)
+
+
+class LedgerPeriod(Base):
+    """A month whose usage has been compacted and invoiced"""
+    __tablename__ = "ledger_periods"
+
+    month = Column(Date, primary_key=True)
+
+    vms = Column(Integer, nullable=False, default=0)
+    invoices = Column(Integer, nullable=False, default=0)
+    segments_archived = Column(Integer, nullable=False, default=0)
+
+    closed_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class ServerUsage(Base):
+    """Resources allocated to running or suspended VMs per server, kept in step with VM state"""
+    __tablename__ = "server_usage"
+
+    server_id = Column(Integer, ForeignKey("servers.id", ondelete="CASCADE"), primary_key=True)
+
+    active_vms = Column(Integer, nullable=False, default=0)
+    vcpus = Column(Integer, nullable=False, default=0)
+    ram_mb = Column(BigInteger, nullable=False, default=0)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
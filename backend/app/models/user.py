@@ -29,6 +29,9 @@ class User(Base):
     password_hash = Column(String(255), nullable=False)
     role = Column(SQLEnum(UserRole), default=UserRole.USER, nullable=False)
     balance = Column(Numeric(10, 2), default=0.00, nullable=False)
+    # Running total of usage charged by the billing cycle (which writes no
+    # transactions), at the balance's precision so both round alike
+    usage_charged = Column(Numeric(14, 2), default=0, server_default="0", nullable=False)
     status = Column(SQLEnum(UserStatus), default=UserStatus.ACTIVE, nullable=False)
     
     # Ban information
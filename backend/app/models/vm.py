@@ -17,6 +17,10 @@ class VMState(str, enum.Enum):
     DELETED = "deleted"
 
 
+# States that hold resources and are billed
+BILLABLE_STATES = (VMState.RUNNING, VMState.SUSPENDED)
+
+
 class VM(Base):
     """Virtual Machine model"""
     __tablename__ = "user_vms"
@@ -49,6 +53,7 @@ class VM(Base):
     
     # State
     state = Column(SQLEnum(VMState), default=VMState.CREATING, nullable=False, index=True)
+    state_changed_at = Column(DateTime(timezone=True), nullable=True)  # Last state change made by the panel
     
     # Billing
     last_billed_at = Column(DateTime(timezone=True), nullable=True)
@@ -73,7 +78,7 @@ class VM(Base):
     @property
     def is_billable(self) -> bool:
         """Check if VM should be billed"""
-        return self.state in [VMState.RUNNING, VMState.SUSPENDED]
+        return self.state in BILLABLE_STATES
     
     @property
     def uptime_hours(self) -> float:
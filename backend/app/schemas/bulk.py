@@ -0,0 +1,70 @@
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+from decimal import Decimal
+
+
+class BulkCreditItem(BaseModel):
+    """One credit in a bulk request"""
+    user_id: int
+    amount: Decimal = Field(..., gt=0)
+    reason: Optional[str] = None
+
+
+class BulkCreditRequest(BaseModel):
+    """Credit many users at once"""
+    items: List[BulkCreditItem] = Field(..., min_length=1)
+    reason: Optional[str] = None  # Default for items without one
+
+
+class BulkBanRequest(BaseModel):
+    """Ban many users at once"""
+    user_ids: List[int] = Field(..., min_length=1)
+    reason: str
+    ban_until: Optional[datetime] = None  # None = permanent ban
+
+
+class BulkUnbanRequest(BaseModel):
+    """Unban many users at once"""
+    user_ids: List[int] = Field(..., min_length=1)
+    reason: Optional[str] = None
+
+
+class BulkVMStopRequest(BaseModel):
+    """Stop many VMs at once"""
+    vm_ids: List[int] = Field(..., min_length=1)
+    reason: Optional[str] = None
+
+
+class BulkItemResult(BaseModel):
+    """Outcome for one item"""
+    id: int
+    status: str  # ok, skipped, error (dispatched: a VM stop still running on Proxmox)
+    error: Optional[str] = None
+    balance: Optional[Decimal] = None
+
+
+class BulkResponse(BaseModel):
+    """Bulk operation outcome, or the background task running it"""
+    total: int
+    succeeded: int = 0
+    failed: int = 0
+    results: List[BulkItemResult] = []
+    task_id: Optional[int] = None
+
+
+class TaskResponse(BaseModel):
+    """Background task progress"""
+    id: int
+    type: str
+    status: str
+    progress_percent: int
+    progress_message: Optional[str]
+    result: Optional[Dict[str, Any]]
+    error_message: Optional[str]
+    created_at: datetime
+    started_at: Optional[datetime]
+    completed_at: Optional[datetime]
+    
+    class Config:
+        from_attributes = True
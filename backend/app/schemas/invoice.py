@@ -0,0 +1,27 @@
+from pydantic import BaseModel
+from typing import Optional
+from datetime import date, datetime
+from decimal import Decimal
+
+
+class InvoiceLine(BaseModel):
+    """Usage of one VM in the invoiced month"""
+    vm_id: int
+    name: Optional[str]
+    template: Optional[str]
+    hours: float
+    amount: Decimal
+
+
+class InvoiceResponse(BaseModel):
+    """Monthly usage invoice"""
+    id: int
+    number: str
+    month: date
+    total: Decimal
+    vm_hours: float
+    lines: list[InvoiceLine]
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
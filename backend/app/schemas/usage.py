@@ -0,0 +1,39 @@
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+from decimal import Decimal
+
+
+class UserSpendResponse(BaseModel):
+    """Amount billed to a user on one day"""
+    user_id: int
+    email: str
+    amount: Decimal
+    vm_hours: float
+    
+    class Config:
+        from_attributes = True
+
+
+class TemplateRevenueResponse(BaseModel):
+    """Revenue from a template on one day"""
+    template_id: int
+    name: str
+    amount: Decimal
+    vm_hours: float
+    
+    class Config:
+        from_attributes = True
+
+
+class ServerUsageResponse(BaseModel):
+    """Resources allocated to running or suspended VMs on a server"""
+    server_id: int
+    name: str
+    active_vms: int
+    vcpus: int
+    ram_mb: int
+    updated_at: Optional[datetime]
+    
+    class Config:
+        from_attributes = True
@@ -46,6 +46,19 @@ class UserCreditsResponse(BaseModel):
     currency: str = "USD"
 
 
+class BalanceAuditResponse(BaseModel):
+    """Stored balance against the one replayed from the latest snapshot"""
+    user_id: int
+    balance: Decimal
+    snapshot_as_of: Optional[datetime]
+    snapshot_balance: Optional[Decimal]
+    transactions_since: int
+    transactions_amount: Decimal
+    usage_charged_since: Decimal
+    expected: Optional[Decimal]
+    drift: Optional[Decimal]
+
+
 class AddCreditsRequest(BaseModel):
     """Add credits request"""
     amount: Decimal = Field(..., gt=0)
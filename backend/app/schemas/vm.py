@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Literal, Optional
 from datetime import datetime
 
 
@@ -32,6 +32,44 @@ class VMAction(BaseModel):
     action: str = Field(..., pattern="^(start|stop|reboot|suspend|resume)$")
 
 
+class VMSelector(BaseModel):
+    """Match the caller's VMs by attributes instead of listing IDs (all given fields must match)"""
+    name_prefix: Optional[str] = Field(None, min_length=1, max_length=100)
+    states: Optional[List[Literal["creating", "running", "stopped", "suspended", "error", "deleting"]]] = None
+    template_id: Optional[int] = None
+    
+    @model_validator(mode="after")
+    def not_empty(self):
+        if self.name_prefix is None and not self.states and self.template_id is None:
+            raise ValueError("Selector needs at least one of name_prefix, states or template_id")
+        return self
+
+
+# Largest number of VMs one bulk request may touch, by IDs or by selector
+MAX_BULK_VMS = 1000
+
+
+class VMBulkTarget(BaseModel):
+    """VMs addressed by a bulk request: explicit IDs or a selector"""
+    vm_ids: Optional[List[int]] = Field(None, min_length=1, max_length=MAX_BULK_VMS)
+    selector: Optional[VMSelector] = None
+    
+    @model_validator(mode="after")
+    def one_target(self):
+        if (self.vm_ids is None) == (self.selector is None):
+            raise ValueError("Provide exactly one of vm_ids or selector")
+        return self
+
+
+class VMBulkAction(VMBulkTarget):
+    """Bulk VM action request"""
+    action: str = Field(..., pattern="^(start|stop|reboot|suspend|resume)$")
+
+
+class VMBulkDelete(VMBulkTarget):
+    """Bulk VM delete request"""
+
+
 class VMResponse(BaseModel):
     """VM response"""
     id: int
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: GET /vms response encoding with 1,000 VMs
+
+Compares FastAPI's default response path (validate against response_model,
+jsonable_encoder, json.dumps) with app.core.responses.serialize.
+"""
+
+import json
+import sys
+import timeit
+from datetime import datetime
+
+from fastapi.encoders import jsonable_encoder
+
+from app.core.responses import serialize
+from app.models.vm import VM, VMState
+from app.schemas.vm import VMListResponse
+
+
+def build_vms(count: int) -> list:
+    """Build transient ORM objects shaped like a real GET /vms result"""
+    now = datetime.utcnow()
+    return [
+        VM(
+            id=i,
+            user_id=1,
+            template_id=1,
+            server_id=1,
+            proxmox_vm_id=100 + i,
+            node_name="pve1",
+            name=f"vm-{i}",
+            hostname=f"vm-{i}.example.com",
+            cpu_cores=2,
+            ram_mb=2048,
+            disk_gb=20,
+            ip_address=f"10.0.{i // 256}.{i % 256}",
+            state=VMState.RUNNING,
+            total_cost=i,
+            created_at=now,
+            updated_at=now
+        )
+        for i in range(count)
+    ]
+
+
+def default_path(payload: dict) -> bytes:
+    """What FastAPI does for response_model=VMListResponse with JSONResponse"""
+    model = VMListResponse.model_validate(payload, from_attributes=True)
+    content = jsonable_encoder(model.model_dump(mode="json"))
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+def fast_path(payload: dict) -> bytes:
+    return serialize(VMListResponse, payload)
+
+
+def main(count: int = 1000, number: int = 50):
+    vms = build_vms(count)
+    payload = {"vms": vms, "total": len(vms)}
+    
+    assert json.loads(default_path(payload)) == json.loads(fast_path(payload))
+    
+    before = min(timeit.repeat(lambda: default_path(payload), number=number, repeat=5)) / number
+    after = min(timeit.repeat(lambda: fast_path(payload), number=number, repeat=5)) / number
+    
+    print(f"GET /vms encoding with {count} VMs")
+    print(f"  before (response_model + jsonable_encoder): {before * 1000:.2f} ms")
+    print(f"  after  (TypeAdapter.dump_json):             {after * 1000:.2f} ms")
+    print(f"  speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,131 @@
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Tuple
+
+from sqlalchemy import select, update, insert, bindparam, func, and_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.models.server import Server
+from app.models.usage import UsageDaily, ServerUsage
+from app.models.vm import VM, BILLABLE_STATES
+
+
+class AggregateService:
+    """Maintains the usage rollups behind the admin dashboards"""
+
+    @staticmethod
+    def server_usage_update():
+        """Executemany statement applying server_deltas()"""
+        usage = ServerUsage.__table__
+        return (
+            update(usage)
+            .where(usage.c.server_id == bindparam("b_server_id"))
+            .values(
+                active_vms=usage.c.active_vms + bindparam("b_vms"),
+                vcpus=usage.c.vcpus + bindparam("b_vcpus"),
+                ram_mb=usage.c.ram_mb + bindparam("b_ram_mb"),
+                updated_at=func.now()
+            )
+        )
+
+    @staticmethod
+    def server_deltas(vms: Iterable[Any], sign: int) -> List[Dict[str, int]]:
+        """Per-server changes when the given VMs start (+1) or stop (-1) holding resources"""
+        deltas: Dict[int, List[int]] = defaultdict(lambda: [0, 0, 0])
+        for vm in vms:
+            delta = deltas[vm.server_id]
+            delta[0] += sign
+            delta[1] += sign * vm.cpu_cores
+            delta[2] += sign * vm.ram_mb
+        return [
+            {"b_server_id": server_id, "b_vms": vms_, "b_vcpus": vcpus, "b_ram_mb": ram_mb}
+            for server_id, (vms_, vcpus, ram_mb) in deltas.items()
+        ]
+
+    @staticmethod
+    def rebuild_server_usage(db: Session) -> None:
+        """
+        Recount every server from VM states (repairs drift, adds new servers)
+
+        The server_usage rows are locked before the count runs, so concurrent
+        VM changes are neither lost nor counted twice. A transaction that
+        already applied its delta has committed by the time the count starts.
+        One still waiting to apply it adds it on top of a count that doesn't
+        include it yet.
+        """
+        usage = ServerUsage.__table__
+        existing = set(db.execute(
+            select(usage.c.server_id).order_by(usage.c.server_id).with_for_update()
+        ).scalars())
+
+        counts = db.execute(
+            select(
+                Server.id,
+                func.count(VM.id),
+                func.coalesce(func.sum(VM.cpu_cores), 0),
+                func.coalesce(func.sum(VM.ram_mb), 0)
+            )
+            .outerjoin(VM, and_(VM.server_id == Server.id, VM.state.in_(BILLABLE_STATES)))
+            .group_by(Server.id)
+        ).all()
+        rows = [
+            {"b_server_id": server_id, "b_vms": vms, "b_vcpus": vcpus, "b_ram_mb": ram_mb}
+            for server_id, vms, vcpus, ram_mb in counts
+        ]
+
+        updates = [row for row in rows if row["b_server_id"] in existing]
+        if updates:
+            db.execute(
+                update(usage)
+                .where(usage.c.server_id == bindparam("b_server_id"))
+                .values(
+                    active_vms=bindparam("b_vms"),
+                    vcpus=bindparam("b_vcpus"),
+                    ram_mb=bindparam("b_ram_mb"),
+                    updated_at=func.now()
+                ),
+                updates
+            )
+        inserts = [
+            {"server_id": row["b_server_id"], "active_vms": row["b_vms"], "vcpus": row["b_vcpus"], "ram_mb": row["b_ram_mb"]}
+            for row in rows
+            if row["b_server_id"] not in existing
+        ]
+        if inserts:
+            db.execute(insert(usage), inserts)
+
+    @staticmethod
+    def spend_rows(
+        charges: Iterable[Dict[str, Any]],
+        template_ids: Dict[int, int],
+        day: date
+    ) -> List[Dict[str, Any]]:
+        """Sum billing charges per (user, template) for one day; template_ids maps segment id"""
+        totals: Dict[Tuple[int, int], List[Any]] = defaultdict(lambda: [Decimal(0), 0.0])
+        for charge in charges:
+            if charge["cost"] <= 0:
+                continue
+            total = totals[(charge["user_id"], template_ids[charge["id"]])]
+            total[0] += charge["cost"]
+            total[1] += charge["hours"]
+        return [
+            {"day": day, "user_id": user_id, "template_id": template_id, "amount": amount, "vm_hours": hours}
+            for (user_id, template_id), (amount, hours) in totals.items()
+        ]
+
+    @staticmethod
+    def spend_upsert(dialect_name: str):
+        """Executemany statement adding spend_rows() into usage_daily"""
+        # SQLite backs the test and benchmark databases
+        insert_ = sqlite_insert if dialect_name == "sqlite" else pg_insert
+        stmt = insert_(UsageDaily)
+        return stmt.on_conflict_do_update(
+            index_elements=["day", "user_id", "template_id"],
+            set_={
+                "amount": UsageDaily.amount + stmt.excluded.amount,
+                "vm_hours": UsageDaily.vm_hours + stmt.excluded.vm_hours,
+            }
+        )
@@ -0,0 +1,320 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from pydantic import BaseModel
+from sqlalchemy import select, update, insert, bindparam
+from sqlalchemy.orm import Session
+
+from app.models.log import Log
+from app.models.server import Server
+from app.models.transaction import Transaction, TransactionType
+from app.models.user import User, UserRole, UserStatus
+from app.models.vm import VM, VMState, BILLABLE_STATES
+from app.schemas.bulk import BulkCreditRequest, BulkBanRequest, BulkUnbanRequest, BulkVMStopRequest
+from app.services.aggregates import AggregateService
+from app.services.usage import UsageService
+from app.services.vm_bulk import VMBulkService
+
+
+@dataclass
+class BulkChunkResult:
+    """Per-item results of one chunk, plus follow-ups to run after commit"""
+    results: List[Dict[str, Any]] = field(default_factory=list)
+    user_ids: Set[int] = field(default_factory=set)  # Balance or burn rate changed
+    revoked: Set[int] = field(default_factory=set)  # Users whose tokens must be revoked
+    events: List[Tuple[int, str, Dict[str, Any]]] = field(default_factory=list)
+
+    def extend(self, other: "BulkChunkResult") -> None:
+        self.results.extend(other.results)
+        self.user_ids |= other.user_ids
+        self.revoked |= other.revoked
+        self.events.extend(other.events)
+
+    @property
+    def failed(self) -> int:
+        return sum(1 for result in self.results if result["status"] == "error")
+
+
+def _error(item_id: int, message: str) -> Dict[str, Any]:
+    return {"id": item_id, "status": "error", "error": message}
+
+
+def _logs(admin_id: int, action: str, resource_type: str, rows: List[Tuple[int, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "user_id": admin_id,
+            "action": action,
+            "resource_type": resource_type,
+            "resource_id": resource_id,
+            "details": details,
+            "status": "success"
+        }
+        for resource_id, details in rows
+    ]
+
+
+class BulkAdminService:
+    """
+    Set-based admin operations over many users or VMs
+
+    Each operation handles a slice of the request's items with a handful of
+    statements (bulk UPDATE, bulk Transaction and Log INSERT) and reports a
+    result per item. The caller commits, so the API can run small requests
+    inline and the bulk task can commit chunk by chunk.
+    """
+
+    # Task.type -> request schema
+    OPERATIONS: Dict[str, type] = {
+        "bulk_credit": BulkCreditRequest,
+        "bulk_ban": BulkBanRequest,
+        "bulk_unban": BulkUnbanRequest,
+        "bulk_stop_vms": BulkVMStopRequest,
+    }
+
+    # Task.type -> VM action run on Proxmox before apply()
+    PROXMOX_ACTIONS: Dict[str, str] = {
+        "bulk_stop_vms": "stop",
+    }
+
+    @staticmethod
+    def items(request: BaseModel) -> List[Any]:
+        """The list the operation iterates over"""
+        if isinstance(request, BulkCreditRequest):
+            return request.items
+        if isinstance(request, BulkVMStopRequest):
+            return request.vm_ids
+        return request.user_ids
+
+    @staticmethod
+    def proxmox_targets(operation: str, request: BaseModel, start: int, stop: int):
+        """
+        Statement selecting the VMs items[start:stop] act on in Proxmox, or None
+
+        Callers run it, pass the rows to run_proxmox() and hand the outcome to
+        apply(), which then only records what Proxmox confirmed.
+        """
+        if operation not in BulkAdminService.PROXMOX_ACTIONS:
+            return None
+        return (
+            select(
+                VM.id,
+                VM.user_id,
+                VM.server_id,
+                VM.proxmox_vm_id,
+                VM.node_name,
+                Server.name.label("server_name"),
+                Server.api_url,
+                Server.api_token_encrypted,
+                Server.verify_ssl
+            )
+            .join(Server, Server.id == VM.server_id)
+            .where(VM.id.in_(set(BulkAdminService.items(request)[start:stop])))
+            .where(VM.state.in_(BILLABLE_STATES))
+        )
+
+    @staticmethod
+    async def run_proxmox(operation: str, rows: List[Any]) -> Dict[int, Tuple[str, Optional[str]]]:
+        """Run the operation on Proxmox, grouped per server; returns (status, error) per VM ID"""
+        if not rows:
+            return {}
+        return {
+            row.id: (status, error)
+            async for row, status, _, error in VMBulkService.dispatch(BulkAdminService.PROXMOX_ACTIONS[operation], rows)
+        }
+
+    @staticmethod
+    def apply(
+        db: Session,
+        operation: str,
+        request: BaseModel,
+        admin_id: int,
+        start: int,
+        stop: int,
+        proxmox: Optional[Dict[int, Tuple[str, Optional[str]]]] = None
+    ) -> BulkChunkResult:
+        """Apply items[start:stop] of a request, given run_proxmox()'s outcome if it has one (caller commits)"""
+        items = BulkAdminService.items(request)[start:stop]
+        if operation == "bulk_stop_vms":
+            return BulkAdminService._stop_vms(db, request, items, admin_id, proxmox or {})
+        handler = {
+            "bulk_credit": BulkAdminService._credit,
+            "bulk_ban": BulkAdminService._ban,
+            "bulk_unban": BulkAdminService._unban,
+        }[operation]
+        return handler(db, request, items, admin_id)
+
+    @staticmethod
+    def _credit(db: Session, request: BulkCreditRequest, items: List[Any], admin_id: int) -> BulkChunkResult:
+        outcome = BulkChunkResult()
+        balances: Dict[int, Decimal] = {
+            user_id: Decimal(str(balance))
+            for user_id, balance in db.execute(
+                select(User.id, User.balance)
+                .where(User.id.in_({item.user_id for item in items}))
+                .with_for_update()
+            )
+        }
+
+        credits = []
+        for item in items:
+            if item.user_id not in balances:
+                outcome.results.append(_error(item.user_id, "User not found"))
+                continue
+            # Running balance, so repeated users get correct balance_after values
+            balances[item.user_id] += item.amount
+            credits.append((item, balances[item.user_id]))
+            outcome.results.append({"id": item.user_id, "status": "ok", "balance": balances[item.user_id]})
+            outcome.user_ids.add(item.user_id)
+
+        if not credits:
+            return outcome
+
+        users = User.__table__
+        db.execute(
+            update(users)
+            .where(users.c.id == bindparam("b_id"))
+            .values(balance=users.c.balance + bindparam("b_amount")),
+            [{"b_id": item.user_id, "b_amount": item.amount} for item, _ in credits]
+        )
+        db.execute(insert(Transaction), [
+            {
+                "user_id": item.user_id,
+                "amount": item.amount,
+                "type": TransactionType.ADMIN_ADJUST,
+                "description": item.reason or request.reason or "Admin credit adjustment",
+                "admin_id": admin_id,
+                "balance_after": balance_after
+            }
+            for item, balance_after in credits
+        ])
+        db.execute(insert(Log), _logs(admin_id, "admin_credit_added", "user", [
+            (item.user_id, {"amount": float(item.amount), "reason": item.reason or request.reason})
+            for item, _ in credits
+        ]))
+        for user_id in outcome.user_ids:
+            outcome.events.append((user_id, "balance", {"balance": balances[user_id]}))
+
+        return outcome
+
+    @staticmethod
+    def _ban(db: Session, request: BulkBanRequest, user_ids: List[int], admin_id: int) -> BulkChunkResult:
+        outcome = BulkChunkResult()
+        roles = dict(db.execute(select(User.id, User.role).where(User.id.in_(set(user_ids)))).all())
+
+        banned = []
+        for user_id in dict.fromkeys(user_ids):
+            if user_id not in roles:
+                outcome.results.append(_error(user_id, "User not found"))
+            elif roles[user_id] == UserRole.ADMIN:
+                outcome.results.append(_error(user_id, "Cannot ban admin users"))
+            else:
+                banned.append(user_id)
+                outcome.results.append({"id": user_id, "status": "ok"})
+                outcome.revoked.add(user_id)
+
+        if banned:
+            db.execute(
+                update(User)
+                .where(User.id.in_(banned))
+                .values(status=UserStatus.BANNED, ban_reason=request.reason, ban_until=request.ban_until)
+                .execution_options(synchronize_session=False)
+            )
+            ban_type = "temporary" if request.ban_until else "permanent"
+            db.execute(insert(Log), _logs(admin_id, "user_banned", "user", [
+                (user_id, {
+                    "ban_type": ban_type,
+                    "reason": request.reason,
+                    "ban_until": request.ban_until.isoformat() if request.ban_until else None
+                })
+                for user_id in banned
+            ]))
+
+        return outcome
+
+    @staticmethod
+    def _unban(db: Session, request: BulkUnbanRequest, user_ids: List[int], admin_id: int) -> BulkChunkResult:
+        outcome = BulkChunkResult()
+        found = set(db.execute(select(User.id).where(User.id.in_(set(user_ids)))).scalars())
+
+        unbanned = []
+        for user_id in dict.fromkeys(user_ids):
+            if user_id in found:
+                unbanned.append(user_id)
+                outcome.results.append({"id": user_id, "status": "ok"})
+            else:
+                outcome.results.append(_error(user_id, "User not found"))
+
+        if unbanned:
+            db.execute(
+                update(User)
+                .where(User.id.in_(unbanned))
+                .values(status=UserStatus.ACTIVE, ban_reason=None, ban_until=None)
+                .execution_options(synchronize_session=False)
+            )
+            db.execute(insert(Log), _logs(admin_id, "user_unbanned", "user", [
+                (user_id, {"reason": request.reason}) for user_id in unbanned
+            ]))
+
+        return outcome
+
+    @staticmethod
+    def _stop_vms(
+        db: Session,
+        request: BulkVMStopRequest,
+        vm_ids: List[int],
+        admin_id: int,
+        proxmox: Dict[int, Tuple[str, Optional[str]]]
+    ) -> BulkChunkResult:
+        outcome = BulkChunkResult()
+        vms = {
+            vm.id: vm for vm in db.execute(
+                select(VM.id, VM.user_id, VM.server_id, VM.cpu_cores, VM.ram_mb, VM.state)
+                .where(VM.id.in_(set(vm_ids)))
+                .with_for_update()
+            )
+        }
+
+        stopped = []
+        for vm_id in dict.fromkeys(vm_ids):
+            vm = vms.get(vm_id)
+            if vm is None:
+                outcome.results.append(_error(vm_id, "VM not found"))
+            elif vm.state not in BILLABLE_STATES:
+                outcome.results.append({"id": vm_id, "status": "skipped", "error": f"VM is {vm.state.value}"})
+            elif vm_id not in proxmox:
+                # Started after the Proxmox calls were made
+                outcome.results.append(_error(vm_id, "VM changed state during the request"))
+            elif proxmox[vm_id][0] == "error":
+                outcome.results.append(_error(vm_id, f"Proxmox failed to stop the VM: {proxmox[vm_id][1]}"))
+            elif proxmox[vm_id][0] == "dispatched":
+                # Still stopping: reconciliation records the final state
+                outcome.results.append({"id": vm_id, "status": "dispatched"})
+            else:
+                stopped.append(vm)
+                outcome.results.append({"id": vm_id, "status": "ok"})
+
+        if stopped:
+            now = datetime.utcnow()
+            stopped_ids = [vm.id for vm in stopped]
+            db.execute(
+                update(VM)
+                .where(VM.id.in_(stopped_ids))
+                .values(state=VMState.STOPPED, state_changed_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            db.execute(UsageService.close_segments(stopped_ids, now))
+            db.execute(AggregateService.server_usage_update(), AggregateService.server_deltas(stopped, -1))
+            db.execute(insert(Log), _logs(admin_id, "vm_stop", "vm", [
+                (vm.id, {"owner_id": vm.user_id, "reason": request.reason}) for vm in stopped
+            ]))
+            for vm in stopped:
+                outcome.user_ids.add(vm.user_id)
+                outcome.events.append((
+                    vm.user_id,
+                    "vm_state",
+                    {"vm_id": vm.id, "state": VMState.STOPPED.value, "reason": "admin"}
+                ))
+
+        return outcome
@@ -0,0 +1,155 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+import redis
+import redis.asyncio as aioredis
+from sqlalchemy import select, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.models.usage import UsageSegment
+from app.models.user import User
+
+
+# Sorted set of user_id scored by projected zero-balance time (epoch seconds)
+EXHAUSTION_KEY = "billing:exhaustion"
+
+# Pop due members atomically so concurrent pollers never enforce twice
+_POP_DUE_SCRIPT = """
+local due = redis.call('zrangebyscore', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, member in ipairs(due) do
+    redis.call('zrem', KEYS[1], member)
+end
+return due
+"""
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _score(deadline: datetime) -> float:
+    return (deadline - _EPOCH).total_seconds()
+
+
+class ExhaustionScheduler:
+    """
+    Tracks when each user's balance runs out at the current burn rate
+
+    The effective balance (stored balance minus usage not yet billed) only
+    changes when credits are added or a VM starts or stops, so deadlines are
+    recomputed on those events and not on every billing cycle.
+    """
+
+    def __init__(self):
+        self._sync_client: Optional[redis.Redis] = None
+        self._async_client: Optional[aioredis.Redis] = None
+
+    @staticmethod
+    def projection_query(user_ids: Optional[Iterable[int]] = None):
+        """Balance and unsettled segments per user (default: users with an open segment)"""
+        stmt = (
+            select(
+                User.id,
+                User.status,
+                User.balance,
+                UsageSegment.rate,
+                UsageSegment.billed_until,
+                UsageSegment.ended_at
+            )
+            .outerjoin(
+                UsageSegment,
+                and_(UsageSegment.user_id == User.id, UsageSegment.settled_at.is_(None))
+            )
+        )
+        if user_ids is not None:
+            return stmt.where(User.id.in_(list(user_ids)))
+        return stmt.where(User.id.in_(
+            select(UsageSegment.user_id).where(UsageSegment.ended_at.is_(None))
+        ))
+
+    @staticmethod
+    def project(rows: Iterable[Any], now: datetime) -> Dict[int, Optional[datetime]]:
+        """Projected zero-balance time per user, None if nothing is burning"""
+        balances: Dict[int, Decimal] = {}
+        burn: Dict[int, Decimal] = defaultdict(Decimal)
+        accrued: Dict[int, Decimal] = defaultdict(Decimal)
+
+        for row in rows:
+            balances[row.id] = Decimal(str(row.balance))
+            if row.rate is None:
+                continue
+            rate = Decimal(str(row.rate))
+            end = row.ended_at.replace(tzinfo=None) if row.ended_at else now
+            seconds = max((end - row.billed_until.replace(tzinfo=None)).total_seconds(), 0)
+            accrued[row.id] += rate * Decimal(seconds) / Decimal(3600)
+            if row.ended_at is None:
+                burn[row.id] += rate
+
+        deadlines: Dict[int, Optional[datetime]] = {}
+        for user_id, balance in balances.items():
+            if burn[user_id] <= 0:
+                deadlines[user_id] = None
+                continue
+            remaining = balance - accrued[user_id]
+            if remaining <= 0:
+                deadlines[user_id] = now
+            else:
+                deadlines[user_id] = now + timedelta(hours=float(remaining / burn[user_id]))
+        return deadlines
+
+    def update(self, deadlines: Dict[int, Optional[datetime]]) -> None:
+        """Store deadlines from synchronous code (Celery tasks)"""
+        if not deadlines:
+            return
+        try:
+            if self._sync_client is None:
+                self._sync_client = redis.from_url(settings.REDIS_URL)
+            pipe = self._sync_client.pipeline(transaction=False)
+            self._queue_updates(pipe, deadlines)
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"Failed to schedule balance deadlines: {e}")
+
+    async def update_async(self, deadlines: Dict[int, Optional[datetime]]) -> None:
+        """Store deadlines from the API event loop"""
+        if not deadlines:
+            return
+        try:
+            if self._async_client is None:
+                self._async_client = aioredis.from_url(settings.REDIS_URL)
+            pipe = self._async_client.pipeline(transaction=False)
+            self._queue_updates(pipe, deadlines)
+            await pipe.execute()
+        except Exception as e:
+            logger.error(f"Failed to schedule balance deadlines: {e}")
+
+    @staticmethod
+    def _queue_updates(pipe, deadlines: Dict[int, Optional[datetime]]) -> None:
+        scheduled = {user_id: _score(d) for user_id, d in deadlines.items() if d is not None}
+        cleared = [user_id for user_id, d in deadlines.items() if d is None]
+        if scheduled:
+            pipe.zadd(EXHAUSTION_KEY, scheduled)
+        if cleared:
+            pipe.zrem(EXHAUSTION_KEY, *cleared)
+
+    def refresh(self, db: Session, user_ids: Iterable[int]) -> None:
+        """Recompute and store deadlines for the given users (sync)"""
+        self.update(self.project(db.execute(self.projection_query(user_ids)).all(), datetime.utcnow()))
+
+    async def refresh_async(self, db: AsyncSession, user_ids: Iterable[int]) -> None:
+        """Recompute and store deadlines for the given users (async)"""
+        rows = (await db.execute(self.projection_query(user_ids))).all()
+        await self.update_async(self.project(rows, datetime.utcnow()))
+
+    def pop_due(self, now: datetime, limit: int = 1000) -> List[int]:
+        """Remove and return users whose deadline has passed"""
+        if self._sync_client is None:
+            self._sync_client = redis.from_url(settings.REDIS_URL)
+        due = self._sync_client.eval(_POP_DUE_SCRIPT, 1, EXHAUSTION_KEY, _score(now), limit)
+        return [int(user_id) for user_id in due]
+
+
+exhaustion_scheduler = ExhaustionScheduler()
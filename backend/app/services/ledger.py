@@ -0,0 +1,191 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import select, insert, delete, func, literal, or_, Date
+from sqlalchemy.orm import Session
+
+from app.models.invoice import Invoice
+from app.models.template import VMTemplate
+from app.models.usage import UsageSegment, UsageMonthly, UsageSegmentArchive, LedgerPeriod
+from app.models.vm import VM
+from app.services.usage import UsageService
+
+
+class LedgerService:
+    """
+    Closes finished months of the usage ledger
+
+    A closed month's charges are rolled up into one usage_monthly row per VM,
+    invoices are generated from those rows, and the settled segments that
+    ended in the month move to usage_segments_archive. Billing only ever
+    reads the hot usage_segments table, so it stays the size of the current
+    month. Months are closed oldest first, each in its own transaction.
+    """
+
+    @staticmethod
+    def month_start(at: datetime) -> date:
+        return date(at.year, at.month, 1)
+
+    @staticmethod
+    def next_month(month: date) -> date:
+        return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+    @staticmethod
+    def next_closable_month(db: Session, now: datetime, grace: timedelta) -> Optional[date]:
+        """Oldest month not yet closed that ended at least grace ago, if any"""
+        last_closed = db.execute(select(func.max(LedgerPeriod.month))).scalar()
+        first_segment = db.execute(select(func.min(UsageSegment.started_at))).scalar()
+        if first_segment is None:
+            return None
+
+        month = LedgerService.month_start(first_segment)
+        if last_closed is not None:
+            month = max(month, LedgerService.next_month(last_closed))
+
+        end = datetime.combine(LedgerService.next_month(month), datetime.min.time())
+        return month if end + grace <= now else None
+
+    @staticmethod
+    def summarize(segments: Iterable[Any], start: datetime, end: datetime) -> Dict[int, Dict[str, Any]]:
+        """
+        Per-VM amount charged between start and end
+
+        A segment has been charged from started_at up to billed_until; only
+        the part inside the month counts, worked out from the same running
+        totals billing charged (UsageService.charged_through) so the month's
+        amounts add up to what was debited. segments need vm_id, user_id,
+        template_id, rate, started_at and billed_until.
+        """
+        summaries: Dict[int, Dict[str, Any]] = {}
+        for segment in segments:
+            charged_from = max(segment.started_at.replace(tzinfo=None), start)
+            charged_to = min(segment.billed_until.replace(tzinfo=None), end)
+            seconds = max((charged_to - charged_from).total_seconds(), 0)
+            summary = summaries.setdefault(segment.vm_id, {
+                "vm_id": segment.vm_id,
+                "user_id": segment.user_id,
+                "template_id": segment.template_id,
+                "amount": Decimal(0),
+                "vm_hours": 0.0,
+                "segments": 0,
+            })
+            if seconds > 0:
+                summary["amount"] += UsageService.charged_through(segment, charged_to) \
+                    - UsageService.charged_through(segment, charged_from)
+            summary["vm_hours"] += seconds / 3600
+            summary["segments"] += 1
+        return summaries
+
+    @staticmethod
+    def billed_through(segments: Iterable[Any], end: datetime) -> bool:
+        """Whether the billing cycle has charged every segment up to end (or its own end)"""
+        for segment in segments:
+            due = end if segment.ended_at is None else min(segment.ended_at.replace(tzinfo=None), end)
+            if segment.billed_until.replace(tzinfo=None) < due:
+                return False
+        return True
+
+    @staticmethod
+    def invoice_rows(
+        summaries: Iterable[Dict[str, Any]],
+        names: Dict[int, Any],
+        month: date
+    ) -> List[Dict[str, Any]]:
+        """One invoice per user with a non-zero total; names maps vm_id to (vm name, template name)"""
+        lines: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+        for summary in summaries:
+            vm_name, template_name = names.get(summary["vm_id"], (None, None))
+            lines[summary["user_id"]].append({
+                "vm_id": summary["vm_id"],
+                "name": vm_name,
+                "template": template_name,
+                "hours": round(summary["vm_hours"], 4),
+                "amount": str(summary["amount"].quantize(Decimal("0.0001"))),
+            })
+
+        rows = []
+        for user_id, user_lines in lines.items():
+            total = sum((Decimal(line["amount"]) for line in user_lines), Decimal(0)).quantize(Decimal("0.01"))
+            if total <= 0:
+                continue
+            rows.append({
+                "user_id": user_id,
+                "month": month,
+                "number": f"INV-{month:%Y%m}-{user_id:06d}",
+                "total": total,
+                "vm_hours": sum(line["hours"] for line in user_lines),
+                "lines": sorted(user_lines, key=lambda line: line["vm_id"]),
+            })
+        return rows
+
+    @staticmethod
+    def close_month(db: Session, month: date) -> Optional[Dict[str, int]]:
+        """
+        Summarize, invoice and archive one month (caller commits)
+
+        Returns None without changing anything while the billing cycle has
+        not yet charged the month in full.
+        """
+        start = datetime.combine(month, datetime.min.time())
+        end = datetime.combine(LedgerService.next_month(month), datetime.min.time())
+
+        segments = db.execute(
+            select(
+                UsageSegment.vm_id,
+                UsageSegment.user_id,
+                UsageSegment.rate,
+                UsageSegment.started_at,
+                UsageSegment.ended_at,
+                UsageSegment.billed_until,
+                VM.template_id
+            )
+            .join(VM, VM.id == UsageSegment.vm_id)
+            .where(UsageSegment.started_at < end)
+            .where(or_(UsageSegment.ended_at.is_(None), UsageSegment.ended_at >= start))
+        ).all()
+
+        if not LedgerService.billed_through(segments, end):
+            return None
+
+        summaries = [
+            {**summary, "month": month, "amount": summary["amount"].quantize(Decimal("0.0001"))}
+            for summary in LedgerService.summarize(segments, start, end).values()
+        ]
+        if summaries:
+            db.execute(insert(UsageMonthly), summaries)
+
+        invoices = []
+        if summaries:
+            names = {
+                vm_id: (vm_name, template_name)
+                for vm_id, vm_name, template_name in db.execute(
+                    select(VM.id, VM.name, VMTemplate.name)
+                    .join(VMTemplate, VMTemplate.id == VM.template_id)
+                    .where(VM.id.in_([summary["vm_id"] for summary in summaries]))
+                )
+            }
+            invoices = LedgerService.invoice_rows(summaries, names, month)
+        if invoices:
+            db.execute(insert(Invoice), invoices)
+
+        # Everything that ended by the month end is fully summarized now
+        archived = (
+            UsageSegment.settled_at.is_not(None),
+            UsageSegment.ended_at <= end,
+        )
+        columns = ["id", "vm_id", "user_id", "rate", "started_at", "ended_at", "billed_until", "settled_at"]
+        db.execute(
+            insert(UsageSegmentArchive).from_select(
+                columns + ["archived_month"],
+                select(*(getattr(UsageSegment, column) for column in columns), literal(month, Date))
+                .where(*archived)
+            )
+        )
+        segments_archived = db.execute(delete(UsageSegment).where(*archived)).rowcount
+
+        db.add(LedgerPeriod(
+            month=month, vms=len(summaries), invoices=len(invoices), segments_archived=segments_archived
+        ))
+        return {"vms": len(summaries), "invoices": len(invoices), "segments_archived": segments_archived}
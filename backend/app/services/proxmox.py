@@ -1,31 +1,223 @@
+import asyncio
+import hashlib
 import httpx
-from typing import Dict, Optional, Any
+import time
+from typing import Awaitable, Callable, Dict, Optional, Any, Tuple
+from urllib.parse import urlparse
+from app.core.cache_bus import cache_bus
+from app.core.config import settings
 from app.core.logging import logger
 from app.core.encryption import encryption
+from app.core.metrics import proxmox_request_duration_seconds, proxmox_request_errors_total
+from app.services.proxmox_scheduler import proxmox_scheduler
+
+
+class ReadCoalescer:
+    """
+    Single-flight plus a short TTL cache for identical Proxmox GETs
+
+    Shared by every ProxmoxService instance in the process. Concurrent callers
+    asking for the same (server, path, params) await one upstream request, and
+    results are reused for a few seconds, so Proxmox load stays bounded however
+    many viewers poll the same VM. Any write to a server drops its entries,
+    here and, through cache_bus, in every other API and worker process.
+    Results are shared between callers and must be treated as read-only.
+    """
+
+    MAX_ENTRIES_PER_SERVER = 4096
+
+    def __init__(self):
+        self._inflight: Dict[str, Dict[Tuple, asyncio.Task]] = {}
+        self._cache: Dict[str, Dict[Tuple, Tuple[float, Any]]] = {}
+
+    async def get(self, server: str, key: Tuple, ttl: float, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        cache = self._cache.setdefault(server, {})
+        cached = cache.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
+        inflight = self._inflight.setdefault(server, {})
+        task = inflight.get(key)
+        # Tasks from another event loop (one asyncio.run per Celery task) can't be awaited here
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(fetch())
+            inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(server, key, ttl, done))
+
+        # Shielded so a cancelled caller doesn't cancel the request for the others
+        return await asyncio.shield(task)
+
+    def _finish(self, server: str, key: Tuple, ttl: float, task: asyncio.Task) -> None:
+        inflight = self._inflight.get(server, {})
+        # Not ours any more if the server was written to meanwhile
+        if inflight.get(key) is not task:
+            return
+        del inflight[key]
+        if ttl <= 0 or task.cancelled() or task.exception() is not None:
+            return
+
+        cache = self._cache.setdefault(server, {})
+        now = time.monotonic()
+        if len(cache) >= self.MAX_ENTRIES_PER_SERVER:
+            for stale in [k for k, (expires, _) in cache.items() if expires <= now]:
+                del cache[stale]
+        if len(cache) < self.MAX_ENTRIES_PER_SERVER:
+            cache[key] = (now + ttl, task.result())
+
+    def invalidate(self, server: str) -> None:
+        """Forget cached and in-flight reads for a server (after a write)"""
+        self._cache.pop(server, None)
+        self._inflight.pop(server, None)
+
+    def clear(self) -> None:
+        self._cache.clear()
+        self._inflight.clear()
+
+
+proxmox_reads = ReadCoalescer()
+cache_bus.register("proxmox_reads", proxmox_reads.invalidate)
+
+
+class ClientPool:
+    """
+    Long-lived httpx clients bound to one event loop
+
+    Outside a bound loop (API requests, tests) ProxmoxService opens a client
+    per request; on the Celery runtime's persistent loop requests reuse
+    keep-alive connections to each Proxmox server.
+    """
+
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._clients: Dict[Tuple[bool, Any], httpx.AsyncClient] = {}
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+        self._clients = {}
+
+    def get(self, verify_ssl: bool, transport: Optional[httpx.AsyncBaseTransport]) -> Optional[httpx.AsyncClient]:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+        if loop is not self.loop:
+            return None
+        key = (verify_ssl, transport)
+        client = self._clients.get(key)
+        if client is None:
+            client = self._clients[key] = httpx.AsyncClient(verify=verify_ssl, transport=transport)
+        return client
+
+    async def aclose(self) -> None:
+        clients, self._clients, self.loop = self._clients, {}, None
+        for client in clients.values():
+            await client.aclose()
+
+
+proxmox_clients = ClientPool()
 
 
 class ProxmoxService:
     """Service for interacting with Proxmox VE API"""
     
-    def __init__(self, api_url: str, api_token_encrypted: str, verify_ssl: bool = True):
+    def __init__(
+        self,
+        api_url: str,
+        api_token_encrypted: str,
+        verify_ssl: bool = True,
+        server_name: Optional[str] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
         self.api_url = api_url.rstrip('/')
         self.api_token = encryption.decrypt(api_token_encrypted)
         self.verify_ssl = verify_ssl
+        self.transport = transport  # Override for the Proxmox simulator in tests
+        self.server_name = server_name or urlparse(self.api_url).netloc or self.api_url
         self.headers = {
             "Authorization": f"PVEAPIToken={self.api_token}"
         }
+        # The token is part of the scope so a connection test with new credentials
+        # isn't served from cache; hashed, since scopes are published to Redis
+        self._read_scope = hashlib.sha256(f"{self.api_url}|{self.api_token}".encode()).hexdigest()
+    
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        operation: str,
+        timeout: float = 10.0,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """Send a request to the Proxmox API and record latency/error metrics"""
+        if method != "GET":
+            self._invalidate_reads()
+        # Rate limit and fair queuing; the wait isn't counted as Proxmox latency
+        await proxmox_scheduler.acquire(self.api_url)
+        start_time = time.perf_counter()
+        try:
+            client = proxmox_clients.get(self.verify_ssl, self.transport)
+            if client is not None:
+                return await self._send(client, method, path, timeout, **kwargs)
+            async with httpx.AsyncClient(verify=self.verify_ssl, transport=self.transport) as client:
+                return await self._send(client, method, path, timeout, **kwargs)
+        except Exception:
+            proxmox_request_errors_total.labels(
+                server=self.server_name, operation=operation
+            ).inc()
+            raise
+        finally:
+            proxmox_request_duration_seconds.labels(
+                server=self.server_name, operation=operation
+            ).observe(time.perf_counter() - start_time)
+            # Again once the write returned (or failed): a read made while it
+            # was in flight may have cached the state from before it
+            if method != "GET":
+                self._invalidate_reads()
+    
+    def _invalidate_reads(self) -> None:
+        """Drop this server's cached reads here and, through cache_bus, in every process"""
+        proxmox_reads.invalidate(self._read_scope)
+        cache_bus.publish("proxmox_reads", self._read_scope)
+    
+    async def _send(
+        self,
+        client: httpx.AsyncClient,
+        method: str,
+        path: str,
+        timeout: float,
+        **kwargs
+    ) -> Dict[str, Any]:
+        response = await client.request(
+            method,
+            f"{self.api_url}/api2/json/{path}",
+            headers=self.headers,
+            timeout=timeout,
+            **kwargs
+        )
+        response.raise_for_status()
+        return response.json()
+    
+    async def _read(
+        self,
+        path: str,
+        operation: str,
+        cache_ttl: float = 0.0,
+        timeout: float = 10.0,
+        params: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        """GET through the shared single-flight layer, cached for cache_ttl seconds"""
+        key = (path, tuple(sorted((params or {}).items())))
+        return await proxmox_reads.get(
+            self._read_scope,
+            key,
+            cache_ttl,
+            lambda: self._request("GET", path, operation, timeout=timeout, params=params)
+        )
     
     async def test_connection(self) -> Dict[str, Any]:
         """Test connection to Proxmox server"""
         try:
-            async with httpx.AsyncClient(verify=self.verify_ssl) as client:
-                response = await client.get(
-                    f"{self.api_url}/api2/json/version",
-                    headers=self.headers,
-                    timeout=10.0
-                )
-                response.raise_for_status()
-                return response.json()
+            return await self._request("GET", "version", "version")
         except Exception as e:
             logger.error(f"Proxmox connection test failed: {e}")
             raise
@@ -33,15 +225,8 @@ class ProxmoxService:
     async def get_nodes(self) -> list:
         """Get list of Proxmox nodes"""
         try:
-            async with httpx.AsyncClient(verify=self.verify_ssl) as client:
-                response = await client.get(
-                    f"{self.api_url}/api2/json/nodes",
-                    headers=self.headers,
-                    timeout=10.0
-                )
-                response.raise_for_status()
-                data = response.json()
-                return data.get("data", [])
+            data = await self._read("nodes", "get_nodes", settings.PROXMOX_READ_CACHE_SECONDS)
+            return data.get("data", [])
         except Exception as e:
             logger.error(f"Failed to get Proxmox nodes: {e}")
             return []
@@ -68,26 +253,24 @@ class ProxmoxService:
                 "scsi0": f"local-lvm:{disk_size}",
             }
             
-            async with httpx.AsyncClient(verify=self.verify_ssl) as client:
-                if template_id:
-                    # Clone from template
-                    response = await client.post(
-                        f"{self.api_url}/api2/json/nodes/{node}/qemu/{template_id}/clone",
-                        headers=self.headers,
-                        data={"newid": vmid, "name": name},
-                        timeout=30.0
-                    )
-                else:
-                    # Create new VM
-                    response = await client.post(
-                        f"{self.api_url}/api2/json/nodes/{node}/qemu",
-                        headers=self.headers,
-                        data=vm_config,
-                        timeout=30.0
-                    )
-                
-                response.raise_for_status()
-                return response.json()
+            if template_id:
+                # Clone from template
+                return await self._request(
+                    "POST",
+                    f"nodes/{node}/qemu/{template_id}/clone",
+                    "clone_vm",
+                    timeout=30.0,
+                    data={"newid": vmid, "name": name}
+                )
+            
+            # Create new VM
+            return await self._request(
+                "POST",
+                f"nodes/{node}/qemu",
+                "create_vm",
+                timeout=30.0,
+                data=vm_config
+            )
         except Exception as e:
             logger.error(f"Failed to create VM: {e}")
             raise
@@ -115,14 +298,9 @@ class ProxmoxService:
     async def delete_vm(self, node: str, vmid: int) -> Dict[str, Any]:
         """Delete a VM"""
         try:
-            async with httpx.AsyncClient(verify=self.verify_ssl) as client:
-                response = await client.delete(
-                    f"{self.api_url}/api2/json/nodes/{node}/qemu/{vmid}",
-                    headers=self.headers,
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                return response.json()
+            return await self._request(
+                "DELETE", f"nodes/{node}/qemu/{vmid}", "delete_vm", timeout=30.0
+            )
         except Exception as e:
             logger.error(f"Failed to delete VM {vmid}: {e}")
             raise
@@ -130,15 +308,12 @@ class ProxmoxService:
     async def get_vm_status(self, node: str, vmid: int) -> Dict[str, Any]:
         """Get VM status"""
         try:
-            async with httpx.AsyncClient(verify=self.verify_ssl) as client:
-                response = await client.get(
-                    f"{self.api_url}/api2/json/nodes/{node}/qemu/{vmid}/status/current",
-                    headers=self.headers,
-                    timeout=10.0
-                )
-                response.raise_for_status()
-                data = response.json()
-                return data.get("data", {})
+            data = await self._read(
+                f"nodes/{node}/qemu/{vmid}/status/current",
+                "get_vm_status",
+                settings.PROXMOX_READ_CACHE_SECONDS
+            )
+            return data.get("data", {})
         except Exception as e:
             logger.error(f"Failed to get VM status: {e}")
             return {}
@@ -146,30 +321,73 @@ class ProxmoxService:
     async def _vm_action(self, node: str, vmid: int, action: str) -> Dict[str, Any]:
         """Perform action on VM"""
         try:
-            async with httpx.AsyncClient(verify=self.verify_ssl) as client:
-                response = await client.post(
-                    f"{self.api_url}/api2/json/nodes/{node}/qemu/{vmid}/status/{action}",
-                    headers=self.headers,
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                return response.json()
+            return await self._request(
+                "POST", f"nodes/{node}/qemu/{vmid}/status/{action}", f"{action}_vm", timeout=30.0
+            )
         except Exception as e:
             logger.error(f"Failed to {action} VM {vmid}: {e}")
             raise
     
+    async def get_node_tasks(self, node: str, source: str = "active") -> list:
+        """List tasks on a node (source: active, archive or all)"""
+        data = await self._request(
+            "GET", f"nodes/{node}/tasks", "get_node_tasks", params={"source": source}
+        )
+        return data.get("data", [])
+    
+    async def get_task_status(self, node: str, upid: str) -> Dict[str, Any]:
+        """Get the status of a task by UPID"""
+        data = await self._request("GET", f"nodes/{node}/tasks/{upid}/status", "get_task_status")
+        return data.get("data", {})
+    
+    async def get_cluster_resources(self, resource_type: str = "vm") -> list:
+        """Get all cluster resources of a type in a single call"""
+        try:
+            # Coalesced but never cached: reconciliation needs the live state
+            data = await self._read(
+                "cluster/resources",
+                "get_cluster_resources",
+                timeout=30.0,
+                params={"type": resource_type}
+            )
+            return data.get("data", [])
+        except Exception as e:
+            logger.error(f"Failed to get cluster resources: {e}")
+            raise
+    
+    async def get_node_rrddata(self, node: str, timeframe: str = "hour") -> list:
+        """Get RRD time-series data for a node"""
+        try:
+            data = await self._read(
+                f"nodes/{node}/rrddata",
+                "get_node_rrddata",
+                settings.PROXMOX_READ_CACHE_SECONDS,
+                params={"timeframe": timeframe, "cf": "AVERAGE"}
+            )
+            return data.get("data", [])
+        except Exception as e:
+            logger.error(f"Failed to get rrddata for node {node}: {e}")
+            raise
+    
+    async def get_vm_rrddata(self, node: str, vmid: int, timeframe: str = "hour") -> list:
+        """Get RRD time-series data for a VM"""
+        try:
+            data = await self._read(
+                f"nodes/{node}/qemu/{vmid}/rrddata",
+                "get_vm_rrddata",
+                settings.PROXMOX_READ_CACHE_SECONDS,
+                params={"timeframe": timeframe, "cf": "AVERAGE"}
+            )
+            return data.get("data", [])
+        except Exception as e:
+            logger.error(f"Failed to get rrddata for VM {vmid}: {e}")
+            raise
+    
     async def get_next_vmid(self) -> int:
         """Get next available VMID"""
         try:
-            async with httpx.AsyncClient(verify=self.verify_ssl) as client:
-                response = await client.get(
-                    f"{self.api_url}/api2/json/cluster/nextid",
-                    headers=self.headers,
-                    timeout=10.0
-                )
-                response.raise_for_status()
-                data = response.json()
-                return int(data.get("data", 100))
+            data = await self._request("GET", "cluster/nextid", "get_next_vmid")
+            return int(data.get("data", 100))
         except Exception as e:
             logger.error(f"Failed to get next VMID: {e}")
             return 100
@@ -192,15 +410,13 @@ class ProxmoxService:
             if disk_size is not None:
                 config["scsi0"] = f"local-lvm:{disk_size}"
             
-            async with httpx.AsyncClient(verify=self.verify_ssl) as client:
-                response = await client.put(
-                    f"{self.api_url}/api2/json/nodes/{node}/qemu/{vmid}/config",
-                    headers=self.headers,
-                    data=config,
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                return response.json()
+            return await self._request(
+                "PUT",
+                f"nodes/{node}/qemu/{vmid}/config",
+                "resize_vm",
+                timeout=30.0,
+                data=config
+            )
         except Exception as e:
             logger.error(f"Failed to resize VM {vmid}: {e}")
             raise
@@ -0,0 +1,140 @@
+"""
+Per-server Proxmox request scheduling
+
+Every ProxmoxService request takes a token from its server's bucket first
+(PROXMOX_RATE_LIMIT_PER_SECOND, bursts up to PROXMOX_RATE_LIMIT_BURST), so
+one process can't flood a cluster's API. While the bucket is empty, requests
+wait in their server's queue and tokens are handed out by priority
+(interactive, then bulk, then background) and, within a priority, round-robin
+across tenants: a user mass-starting 200 VMs gets one request through per
+turn, like everyone else waiting.
+
+The request class comes from a context variable, so callers set it once
+around a unit of work instead of threading it through every call:
+
+    with request_class(tenant=user.id, priority=Priority.BULK):
+        await proxmox.start_vm(node, vmid)
+
+Unset, a request is interactive with no tenant. Limits are per process.
+"""
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Deque, Dict, Iterator, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import proxmox_scheduler_wait_seconds
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0  # Single user actions on the request path
+    BULK = 1  # Bulk actions a user is waiting on
+    BACKGROUND = 2  # Monitoring, reconciliation, metrics collection
+
+
+_request_class: ContextVar[Tuple[Optional[int], Priority]] = ContextVar(
+    "proxmox_request_class", default=(None, Priority.INTERACTIVE)
+)
+
+
+@contextmanager
+def request_class(tenant: Optional[int] = None, priority: Priority = Priority.INTERACTIVE) -> Iterator[None]:
+    """Schedule Proxmox requests made inside as this tenant and priority (also a decorator)"""
+    token = _request_class.set((tenant, priority))
+    try:
+        yield
+    finally:
+        _request_class.reset(token)
+
+
+@dataclass
+class _ServerQueue:
+    """Token bucket and waiting requests for one server"""
+    loop: asyncio.AbstractEventLoop
+    tokens: float
+    updated: float
+    # priority -> tenant -> waiters; tenants rotate to the back after each turn
+    waiting: Dict[Priority, "OrderedDict[Optional[int], Deque[asyncio.Future]]"] = field(
+        default_factory=lambda: {priority: OrderedDict() for priority in Priority}
+    )
+    size: int = 0
+    dispatcher: Optional[asyncio.Task] = None
+
+    def refill(self, rate: float, burst: int) -> None:
+        now = time.monotonic()
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+    def pop(self) -> Optional[asyncio.Future]:
+        """Next waiter: highest priority first, then the tenant whose turn it is"""
+        for tenants in self.waiting.values():
+            if not tenants:
+                continue
+            tenant, waiters = next(iter(tenants.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                tenants.move_to_end(tenant)
+            else:
+                del tenants[tenant]
+            self.size -= 1
+            return waiter
+        return None
+
+
+class ProxmoxScheduler:
+    """Token-bucket rate limiting with fair queuing, one queue per Proxmox server"""
+
+    def __init__(self):
+        self._queues: Dict[str, _ServerQueue] = {}
+
+    async def acquire(self, server: str) -> None:
+        """Wait for this request's turn to call server"""
+        rate, burst = settings.PROXMOX_RATE_LIMIT_PER_SECOND, settings.PROXMOX_RATE_LIMIT_BURST
+        if rate <= 0:
+            return
+
+        loop = asyncio.get_running_loop()
+        queue = self._queues.get(server)
+        # A queue from another event loop can't be awaited here
+        if queue is None or queue.loop is not loop:
+            queue = self._queues[server] = _ServerQueue(loop=loop, tokens=float(burst), updated=time.monotonic())
+
+        queue.refill(rate, burst)
+        if queue.size == 0 and queue.tokens >= 1:
+            queue.tokens -= 1
+            return
+
+        tenant, priority = _request_class.get()
+        waiter = loop.create_future()
+        queue.waiting[priority].setdefault(tenant, deque()).append(waiter)
+        queue.size += 1
+        if queue.dispatcher is None or queue.dispatcher.done():
+            queue.dispatcher = loop.create_task(self._dispatch(queue))
+
+        start = time.perf_counter()
+        # A cancelled waiter is skipped by the dispatcher without taking a token
+        await waiter
+        proxmox_scheduler_wait_seconds.labels(priority=priority.name.lower()).observe(time.perf_counter() - start)
+
+    async def _dispatch(self, queue: _ServerQueue) -> None:
+        while queue.size:
+            rate, burst = settings.PROXMOX_RATE_LIMIT_PER_SECOND, settings.PROXMOX_RATE_LIMIT_BURST
+            queue.refill(rate, burst)
+            if rate > 0 and queue.tokens < 1:
+                await asyncio.sleep((1 - queue.tokens) / rate)
+                continue
+            waiter = queue.pop()
+            if waiter is None or waiter.done():
+                continue
+            queue.tokens -= 1
+            waiter.set_result(None)
+
+    def clear(self) -> None:
+        self._queues.clear()
+
+
+proxmox_scheduler = ProxmoxScheduler()
@@ -0,0 +1,120 @@
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Tuple, Iterable, Any, Optional
+
+from app.models.server import Server
+from app.models.vm import VMState
+from app.services.proxmox import ProxmoxService
+from app.core.logging import logger
+
+
+# Proxmox status -> VMState
+PROXMOX_STATE_MAP = {
+    "running": VMState.RUNNING,
+    "stopped": VMState.STOPPED,
+    "paused": VMState.SUSPENDED,
+    "suspended": VMState.SUSPENDED,
+}
+
+# Only settled states are reconciled; transitional ones are owned by their tasks
+RECONCILABLE_STATES = [VMState.RUNNING, VMState.STOPPED, VMState.SUSPENDED, VMState.ERROR]
+
+# (server_id, proxmox_vm_id) -> (node, status)
+ClusterState = Dict[Tuple[int, int], Tuple[str, str]]
+
+
+class ReconciliationService:
+    """Converges VM state in the database with Proxmox cluster state"""
+
+    @staticmethod
+    async def fetch_cluster_state(servers: Iterable[Server]) -> Tuple[ClusterState, List[int]]:
+        """
+        Fetch every VM on every server with one cluster/resources call per server
+
+        Returns the cluster state and the IDs of servers that answered. VMs on
+        servers that failed are left untouched.
+        """
+        servers = list(servers)
+
+        async def fetch(server: Server) -> list:
+            proxmox = ProxmoxService(
+                api_url=server.api_url,
+                api_token_encrypted=server.api_token_encrypted,
+                verify_ssl=server.verify_ssl,
+                server_name=server.name
+            )
+            return await proxmox.get_cluster_resources("vm")
+
+        results = await asyncio.gather(
+            *(fetch(server) for server in servers),
+            return_exceptions=True
+        )
+
+        state: ClusterState = {}
+        reachable: List[int] = []
+
+        for server, resources in zip(servers, results):
+            if isinstance(resources, Exception):
+                logger.error(f"Reconciliation skipped server {server.name}: {resources}")
+                continue
+
+            reachable.append(server.id)
+            for resource in resources:
+                # Templates are listed as VMs but are never user VMs
+                if resource.get("template"):
+                    continue
+                vmid = resource.get("vmid")
+                if vmid is None:
+                    continue
+                state[(server.id, int(vmid))] = (resource.get("node"), resource.get("status"))
+
+        return state, reachable
+
+    @staticmethod
+    def compute_changes(
+        db_rows: Iterable[Any],
+        cluster_state: ClusterState,
+        reachable_servers: Iterable[int],
+        settled_before: Optional[datetime] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Diff DB rows against cluster state
+
+        db_rows need id, server_id, proxmox_vm_id, node_name and state, plus
+        state_changed_at when settled_before is given: states the panel set
+        after it are kept, since cluster/resources may not reflect them yet.
+        Returns bulk-update parameter dicts for changed rows only.
+        """
+        reachable = set(reachable_servers)
+        changes = []
+
+        for row in db_rows:
+            if row.server_id not in reachable:
+                continue
+
+            observed = cluster_state.get((row.server_id, row.proxmox_vm_id))
+
+            if observed is None:
+                # VM vanished from the cluster
+                if row.state != VMState.ERROR:
+                    changes.append({"id": row.id, "state": VMState.ERROR})
+                continue
+
+            node, status = observed
+            new_state: Optional[VMState] = PROXMOX_STATE_MAP.get(status)
+            change: Dict[str, Any] = {}
+
+            if new_state is not None and new_state != row.state and not (
+                settled_before is not None
+                and row.state_changed_at is not None
+                and row.state_changed_at.replace(tzinfo=None) >= settled_before
+            ):
+                change["state"] = new_state
+            if node and node != row.node_name:
+                change["node_name"] = node
+
+            if change:
+                change["id"] = row.id
+                changes.append(change)
+
+        return changes
@@ -0,0 +1,330 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, insert, delete, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.logging import logger
+from app.models.metric import MetricSample, MetricRollup, MetricCursor
+from app.models.server import Server
+from app.services.proxmox import ProxmoxService
+
+
+# Query range -> (window, bucket size)
+RANGES = {
+    "1h": (timedelta(hours=1), 60),
+    "24h": (timedelta(hours=24), 300),
+    "30d": (timedelta(days=30), 3600),
+}
+
+# Bucket size -> retention
+ROLLUP_RETENTION = {
+    60: timedelta(days=2),
+    300: timedelta(days=7),
+    3600: timedelta(days=400),
+}
+
+RAW_RETENTION = timedelta(hours=48)
+
+# (resource_type, server_id, resource_id)
+ResourceKey = Tuple[str, int, str]
+
+
+class TimeSeriesService:
+    """Collects Proxmox rrddata and serves downsampled range queries"""
+
+    @staticmethod
+    def normalize_points(points: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Convert rrddata points (node or VM) into sample dicts"""
+        samples = []
+        for point in points:
+            # Trailing rrd rows have a time but no values yet
+            if point.get("time") is None or point.get("cpu") is None:
+                continue
+            samples.append({
+                "timestamp": datetime.utcfromtimestamp(int(point["time"])),
+                "cpu": point.get("cpu"),
+                "mem": point.get("mem", point.get("memused")),
+                "maxmem": point.get("maxmem", point.get("memtotal")),
+                "netin": point.get("netin"),
+                "netout": point.get("netout"),
+                "diskread": point.get("diskread"),
+                "diskwrite": point.get("diskwrite"),
+            })
+        return samples
+
+    @staticmethod
+    def build_rollups(key: ResourceKey, samples: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Aggregate samples into partial buckets for every rollup size"""
+        resource_type, server_id, resource_id = key
+        buckets: Dict[Tuple[int, datetime], Dict[str, Any]] = {}
+
+        for sample in samples:
+            epoch = int((sample["timestamp"] - datetime(1970, 1, 1)).total_seconds())
+            for bucket_seconds in ROLLUP_RETENTION:
+                bucket_start = datetime.utcfromtimestamp(epoch - epoch % bucket_seconds)
+                bucket = buckets.get((bucket_seconds, bucket_start))
+                if bucket is None:
+                    bucket = buckets[(bucket_seconds, bucket_start)] = {
+                        "resource_type": resource_type,
+                        "server_id": server_id,
+                        "resource_id": resource_id,
+                        "bucket_seconds": bucket_seconds,
+                        "bucket_start": bucket_start,
+                        "sample_count": 0,
+                        "cpu_sum": 0.0,
+                        "cpu_max": 0.0,
+                        "mem_sum": 0.0,
+                        "mem_max": 0.0,
+                        "maxmem": None,
+                        "netin_sum": 0.0,
+                        "netout_sum": 0.0,
+                        "diskread_sum": 0.0,
+                        "diskwrite_sum": 0.0,
+                    }
+
+                cpu = sample["cpu"] or 0.0
+                mem = sample["mem"] or 0.0
+                bucket["sample_count"] += 1
+                bucket["cpu_sum"] += cpu
+                bucket["cpu_max"] = max(bucket["cpu_max"], cpu)
+                bucket["mem_sum"] += mem
+                bucket["mem_max"] = max(bucket["mem_max"], mem)
+                if sample["maxmem"] is not None:
+                    bucket["maxmem"] = sample["maxmem"]
+                for field in ("netin", "netout", "diskread", "diskwrite"):
+                    bucket[f"{field}_sum"] += sample[field] or 0.0
+
+        return list(buckets.values())
+
+    @staticmethod
+    async def fetch_samples(
+        servers: Iterable[Server],
+        vms: Iterable[Any],
+        concurrency: int = 20
+    ) -> Dict[ResourceKey, List[Dict[str, Any]]]:
+        """
+        Pull node and VM rrddata from all servers concurrently
+
+        vms need server_id, node_name and proxmox_vm_id.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        results: Dict[ResourceKey, List[Dict[str, Any]]] = {}
+        clients = {
+            server.id: ProxmoxService(
+                api_url=server.api_url,
+                api_token_encrypted=server.api_token_encrypted,
+                verify_ssl=server.verify_ssl,
+                server_name=server.name
+            )
+            for server in servers
+        }
+
+        async def fetch(key: ResourceKey, call) -> None:
+            async with semaphore:
+                try:
+                    results[key] = TimeSeriesService.normalize_points(await call())
+                except Exception as e:
+                    logger.warning(f"Skipping metrics for {key}: {e}")
+
+        async def fetch_nodes(server_id: int, proxmox: ProxmoxService) -> None:
+            nodes = await proxmox.get_nodes()
+            await asyncio.gather(*(
+                fetch(("node", server_id, node["node"]), lambda n=node["node"]: proxmox.get_node_rrddata(n))
+                for node in nodes if node.get("node")
+            ))
+
+        tasks = [fetch_nodes(server_id, proxmox) for server_id, proxmox in clients.items()]
+        for vm in vms:
+            proxmox = clients.get(vm.server_id)
+            if proxmox is None:
+                continue
+            tasks.append(fetch(
+                ("vm", vm.server_id, str(vm.proxmox_vm_id)),
+                lambda p=proxmox, v=vm: p.get_vm_rrddata(v.node_name, v.proxmox_vm_id)
+            ))
+
+        await asyncio.gather(*tasks)
+        return results
+
+    @staticmethod
+    def write_samples(db: Session, samples_by_key: Dict[ResourceKey, List[Dict[str, Any]]]) -> int:
+        """
+        Append new samples and fold them into rollup buckets
+
+        rrddata overlaps between collections, so only samples newer than the
+        resource's cursor (its newest stored sample) are written.
+        """
+        if not samples_by_key:
+            return 0
+
+        # One row per resource: cheap, unlike max(timestamp) over the samples
+        latest = {
+            (row.resource_type, row.server_id, row.resource_id): row.latest
+            for row in db.execute(
+                select(MetricCursor.resource_type, MetricCursor.server_id, MetricCursor.resource_id, MetricCursor.latest)
+                .where(MetricCursor.server_id.in_({server_id for _, server_id, _ in samples_by_key}))
+            )
+        }
+
+        sample_rows = []
+        rollup_rows = []
+        cursor_rows = []
+
+        for key, samples in samples_by_key.items():
+            cursor = latest.get(key)
+            if cursor is not None:
+                cursor = cursor.replace(tzinfo=None)
+                samples = [s for s in samples if s["timestamp"] > cursor]
+            if not samples:
+                continue
+
+            resource_type, server_id, resource_id = key
+            sample_rows.extend(
+                {"resource_type": resource_type, "server_id": server_id, "resource_id": resource_id, **s}
+                for s in samples
+            )
+            rollup_rows.extend(TimeSeriesService.build_rollups(key, samples))
+            cursor_rows.append({
+                "resource_type": resource_type,
+                "server_id": server_id,
+                "resource_id": resource_id,
+                "latest": max(s["timestamp"] for s in samples),
+            })
+
+        if not sample_rows:
+            return 0
+
+        dialect_name = db.get_bind().dialect.name
+        db.execute(insert(MetricSample), sample_rows)
+        db.execute(TimeSeriesService.rollup_upsert(dialect_name), rollup_rows)
+        db.execute(TimeSeriesService.cursor_upsert(dialect_name), cursor_rows)
+
+        return len(sample_rows)
+
+    @staticmethod
+    def rollup_upsert(dialect_name: str):
+        """Executemany statement merging partial buckets into existing ones"""
+        # SQLite backs the test and benchmark databases
+        insert_ = sqlite_insert if dialect_name == "sqlite" else pg_insert
+        greatest = func.max if dialect_name == "sqlite" else func.greatest
+        stmt = insert_(MetricRollup)
+        return stmt.on_conflict_do_update(
+            index_elements=["resource_type", "server_id", "resource_id", "bucket_seconds", "bucket_start"],
+            set_={
+                "sample_count": MetricRollup.sample_count + stmt.excluded.sample_count,
+                "cpu_sum": MetricRollup.cpu_sum + stmt.excluded.cpu_sum,
+                "cpu_max": greatest(MetricRollup.cpu_max, stmt.excluded.cpu_max),
+                "mem_sum": MetricRollup.mem_sum + stmt.excluded.mem_sum,
+                "mem_max": greatest(MetricRollup.mem_max, stmt.excluded.mem_max),
+                "maxmem": func.coalesce(stmt.excluded.maxmem, MetricRollup.maxmem),
+                "netin_sum": MetricRollup.netin_sum + stmt.excluded.netin_sum,
+                "netout_sum": MetricRollup.netout_sum + stmt.excluded.netout_sum,
+                "diskread_sum": MetricRollup.diskread_sum + stmt.excluded.diskread_sum,
+                "diskwrite_sum": MetricRollup.diskwrite_sum + stmt.excluded.diskwrite_sum,
+            }
+        )
+
+    @staticmethod
+    def cursor_upsert(dialect_name: str):
+        """Executemany statement moving resource cursors forward"""
+        insert_ = sqlite_insert if dialect_name == "sqlite" else pg_insert
+        greatest = func.max if dialect_name == "sqlite" else func.greatest
+        stmt = insert_(MetricCursor)
+        return stmt.on_conflict_do_update(
+            index_elements=["resource_type", "server_id", "resource_id"],
+            set_={"latest": greatest(MetricCursor.latest, stmt.excluded.latest)}
+        )
+
+    @staticmethod
+    def prune(db: Session) -> None:
+        """Delete samples and buckets past their retention"""
+        now = datetime.utcnow()
+        db.execute(delete(MetricSample).where(MetricSample.timestamp < now - RAW_RETENTION))
+        # Resources gone this long have no rrddata left that could overlap
+        db.execute(delete(MetricCursor).where(MetricCursor.latest < now - RAW_RETENTION))
+        for bucket_seconds, retention in ROLLUP_RETENTION.items():
+            db.execute(
+                delete(MetricRollup)
+                .where(MetricRollup.bucket_seconds == bucket_seconds)
+                .where(MetricRollup.bucket_start < now - retention)
+            )
+
+    @staticmethod
+    async def query_range(
+        db: AsyncSession,
+        key: ResourceKey,
+        range_name: str
+    ) -> List[Dict[str, Any]]:
+        """Serve a range query from pre-aggregated buckets"""
+        window, bucket_seconds = RANGES[range_name]
+        resource_type, server_id, resource_id = key
+
+        result = await db.execute(
+            select(MetricRollup)
+            .where(MetricRollup.resource_type == resource_type)
+            .where(MetricRollup.server_id == server_id)
+            .where(MetricRollup.resource_id == resource_id)
+            .where(MetricRollup.bucket_seconds == bucket_seconds)
+            .where(MetricRollup.bucket_start >= datetime.utcnow() - window)
+            .order_by(MetricRollup.bucket_start)
+        )
+
+        return [TimeSeriesService.rollup_to_point(bucket) for bucket in result.scalars().all()]
+
+    @staticmethod
+    def rollup_to_point(bucket: MetricRollup) -> Dict[str, Any]:
+        """Convert a bucket into averaged values"""
+        count = bucket.sample_count or 1
+        return {
+            "timestamp": bucket.bucket_start,
+            "cpu": bucket.cpu_sum / count,
+            "cpu_max": bucket.cpu_max,
+            "mem": bucket.mem_sum / count,
+            "mem_max": bucket.mem_max,
+            "maxmem": bucket.maxmem,
+            "netin": bucket.netin_sum / count,
+            "netout": bucket.netout_sum / count,
+            "diskread": bucket.diskread_sum / count,
+            "diskwrite": bucket.diskwrite_sum / count,
+        }
+
+    @staticmethod
+    async def latest_node_points(db: AsyncSession, server_ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+        """Latest 5-minute bucket for every known node"""
+        since = datetime.utcnow() - timedelta(hours=1)
+        latest = (
+            select(
+                MetricRollup.server_id,
+                MetricRollup.resource_id,
+                func.max(MetricRollup.bucket_start).label("bucket_start")
+            )
+            .where(MetricRollup.resource_type == "node")
+            .where(MetricRollup.bucket_seconds == 300)
+            .where(MetricRollup.bucket_start >= since)
+            .group_by(MetricRollup.server_id, MetricRollup.resource_id)
+        )
+        if server_ids is not None:
+            latest = latest.where(MetricRollup.server_id.in_(server_ids))
+        latest = latest.subquery()
+
+        result = await db.execute(
+            select(MetricRollup)
+            .join(
+                latest,
+                (MetricRollup.server_id == latest.c.server_id)
+                & (MetricRollup.resource_id == latest.c.resource_id)
+                & (MetricRollup.bucket_start == latest.c.bucket_start)
+            )
+            .where(MetricRollup.resource_type == "node")
+            .where(MetricRollup.bucket_seconds == 300)
+        )
+
+        return [
+            {"server_id": bucket.server_id, "node": bucket.resource_id, **TimeSeriesService.rollup_to_point(bucket)}
+            for bucket in result.scalars().all()
+        ]
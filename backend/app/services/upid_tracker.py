@@ -0,0 +1,208 @@
+import asyncio
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import update, bindparam
+
+from app.core import database
+from app.core.config import settings
+from app.core.logging import logger
+from app.models.task import Task, TaskStatus
+from app.services.proxmox import ProxmoxService
+
+
+class TaskLost(Exception):
+    """A tracked Proxmox task's outcome could not be determined"""
+
+
+@dataclass
+class _Tracked:
+    future: asyncio.Future
+    tracked_at: float
+    task_id: Optional[int] = None
+    failures: int = 0  # Consecutive polls that couldn't reach its status
+
+
+@dataclass
+class _NodeQueue:
+    """Outstanding UPIDs on one node, served by a single poller"""
+    proxmox: ProxmoxService
+    node: str
+    loop: asyncio.AbstractEventLoop
+    pending: Dict[str, _Tracked] = field(default_factory=dict)
+    wakeup: asyncio.Event = field(default_factory=asyncio.Event)
+    poller: Optional[asyncio.Task] = None
+
+
+class UPIDTracker:
+    """
+    Waits for Proxmox tasks (UPIDs) to finish
+
+    Each node gets one polling loop for all of its outstanding tasks. A round
+    lists the node's active tasks in one request and fetches the final status
+    only for UPIDs that dropped off that list, so thousands of in-flight
+    operations cost a few requests per node. The poll interval backs off
+    exponentially while nothing finishes and resets when new work arrives.
+    Finished tasks resolve their futures and, if linked, their Task rows.
+
+    A UPID whose status keeps failing (PROXMOX_TASK_MAX_POLL_FAILURES rounds
+    in a row, including rounds where the node can't be listed at all) or
+    that is still running after PROXMOX_TASK_MAX_TRACK_SECONDS is given up:
+    its future fails with TaskLost and its Task row is marked FAILED.
+    """
+
+    def __init__(self, session_factory: Optional[Callable[[], Any]] = None):
+        self._session_factory = session_factory
+        self._queues: Dict[Tuple[str, str], _NodeQueue] = {}
+
+    def track(self, proxmox: ProxmoxService, node: str, upid: str, task_id: Optional[int] = None) -> asyncio.Future:
+        """Future resolved with the task's final status dict when it stops"""
+        loop = asyncio.get_running_loop()
+        key = (proxmox.api_url, node)
+        queue = self._queues.get(key)
+        # A queue from a finished event loop (one asyncio.run per Celery task) is dead
+        if queue is None or queue.loop is not loop:
+            queue = self._queues[key] = _NodeQueue(proxmox=proxmox, node=node, loop=loop)
+
+        tracked = queue.pending.get(upid)
+        if tracked is None:
+            tracked = queue.pending[upid] = _Tracked(
+                future=loop.create_future(), tracked_at=loop.time(), task_id=task_id
+            )
+        elif task_id is not None:
+            tracked.task_id = task_id
+
+        queue.wakeup.set()
+        if queue.poller is None or queue.poller.done():
+            queue.poller = loop.create_task(self._poll(key, queue))
+        return tracked.future
+
+    async def wait(
+        self,
+        proxmox: ProxmoxService,
+        node: str,
+        upid: str,
+        task_id: Optional[int] = None,
+        timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Wait for a task to stop; a timeout leaves it tracked"""
+        return await asyncio.wait_for(asyncio.shield(self.track(proxmox, node, upid, task_id)), timeout)
+
+    @staticmethod
+    def succeeded(status: Dict[str, Any]) -> bool:
+        return status.get("exitstatus") == "OK"
+
+    async def _poll(self, key: Tuple[str, str], queue: _NodeQueue) -> None:
+        delay = settings.PROXMOX_TASK_POLL_INITIAL_SECONDS
+        while queue.pending:
+            queue.wakeup.clear()
+            try:
+                await asyncio.wait_for(queue.wakeup.wait(), delay)
+                # New work arrived: check soon, it may be a short task
+                delay = settings.PROXMOX_TASK_POLL_INITIAL_SECONDS
+            except asyncio.TimeoutError:
+                pass
+
+            finished = await self._poll_once(queue)
+            if finished:
+                delay = settings.PROXMOX_TASK_POLL_INITIAL_SECONDS
+            else:
+                delay = min(delay * 2, settings.PROXMOX_TASK_POLL_MAX_SECONDS)
+
+        if self._queues.get(key) is queue:
+            del self._queues[key]
+
+    async def _poll_once(self, queue: _NodeQueue) -> int:
+        """One round for a node; returns how many tasks finished or were given up"""
+        try:
+            active = {task["upid"] for task in await queue.proxmox.get_node_tasks(queue.node)}
+        except Exception as e:
+            logger.warning(f"Task poll failed on {queue.proxmox.server_name}/{queue.node}: {e}")
+            for tracked in queue.pending.values():
+                tracked.failures += 1
+            return await self._give_up(queue, f"task list failed: {e}")
+
+        candidates = [upid for upid in queue.pending if upid not in active]
+        statuses = await asyncio.gather(
+            *(queue.proxmox.get_task_status(queue.node, upid) for upid in candidates),
+            return_exceptions=True
+        )
+        done: List[Tuple[str, Dict[str, Any]]] = []
+        for upid, status in zip(candidates, statuses):
+            tracked = queue.pending[upid]
+            if isinstance(status, Exception):
+                tracked.failures += 1
+                logger.warning(f"Task status failed for {upid}: {status}")
+                continue
+            tracked.failures = 0
+            if status.get("status") == "stopped":
+                done.append((upid, status))
+
+        if done:
+            await self._record(queue, done)
+            for upid, status in done:
+                tracked = queue.pending.pop(upid)
+                if not tracked.future.done():
+                    tracked.future.set_result(status)
+        return len(done) + await self._give_up(queue, "task status unavailable")
+
+    async def _give_up(self, queue: _NodeQueue, reason: str) -> int:
+        """Fail UPIDs past the failure or age limit; returns how many"""
+        now = queue.loop.time()
+        lost: List[Tuple[str, Dict[str, Any]]] = []
+        for upid, tracked in queue.pending.items():
+            if tracked.failures >= settings.PROXMOX_TASK_MAX_POLL_FAILURES:
+                lost.append((upid, {"exitstatus": f"Lost track of task after {tracked.failures} polls: {reason}"}))
+            elif now - tracked.tracked_at >= settings.PROXMOX_TASK_MAX_TRACK_SECONDS:
+                lost.append((upid, {"exitstatus": "Task still running after the tracking limit"}))
+        if not lost:
+            return 0
+
+        await self._record(queue, lost)
+        for upid, status in lost:
+            logger.error(f"Giving up on Proxmox task {upid}: {status['exitstatus']}")
+            tracked = queue.pending.pop(upid)
+            if not tracked.future.done():
+                tracked.future.set_exception(TaskLost(status["exitstatus"]))
+                # Waiters that timed out are gone: don't log it as never retrieved
+                tracked.future.exception()
+        return len(lost)
+
+    async def _record(self, queue: _NodeQueue, done: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """Finish the linked Task rows in one executemany"""
+        rows = [
+            {
+                "b_id": queue.pending[upid].task_id,
+                "b_status": TaskStatus.COMPLETED if self.succeeded(status) else TaskStatus.FAILED,
+                "b_result": {"upid": upid, "exitstatus": status.get("exitstatus")},
+                "b_error": None if self.succeeded(status) else status.get("exitstatus") or "unknown error",
+            }
+            for upid, status in done
+            if queue.pending[upid].task_id is not None
+        ]
+        if not rows:
+            return
+
+        tasks = Task.__table__
+        try:
+            async with (self._session_factory or database.AsyncSessionLocal)() as db:
+                await db.execute(
+                    update(tasks)
+                    .where(tasks.c.id == bindparam("b_id"))
+                    .values(
+                        status=bindparam("b_status"),
+                        result=bindparam("b_result"),
+                        error_message=bindparam("b_error"),
+                        progress_percent=100,
+                        completed_at=datetime.utcnow()
+                    ),
+                    rows
+                )
+                await db.commit()
+        except Exception as e:
+            # Waiters still get their result; the rows stay RUNNING for the operator to see
+            logger.error(f"Failed to record finished Proxmox tasks: {e}")
+
+
+upid_tracker = UPIDTracker()
@@ -0,0 +1,129 @@
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, update, insert, exists, literal, union_all, Integer, Numeric, DateTime
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.usage import UsageSegment
+from app.models.template import VMTemplate
+from app.models.vm import VM, VMState, BILLABLE_STATES
+from app.services.aggregates import AggregateService
+
+
+class UsageService:
+    """Records billable intervals when VMs change state and turns them into charges"""
+
+    @staticmethod
+    def segment_change(previous: Optional[VMState], new: VMState) -> Tuple[bool, bool]:
+        """Return (close, open) for a state transition"""
+        was_billable = previous in BILLABLE_STATES
+        is_billable = new in BILLABLE_STATES
+        return was_billable and not is_billable, is_billable and not was_billable
+
+    @staticmethod
+    def close_segments(vm_ids: Iterable[int], at: datetime):
+        """Statement closing the open segments of the given VMs"""
+        return (
+            update(UsageSegment)
+            .where(UsageSegment.vm_id.in_(list(vm_ids)))
+            .where(UsageSegment.ended_at.is_(None))
+            .values(ended_at=at)
+        )
+
+    @staticmethod
+    def open_segments(rows: Iterable[Tuple[int, int, Any]], at: datetime):
+        """
+        Statement opening a segment per (vm_id, user_id, rate)
+
+        VMs that already have an open segment are skipped, so concurrent
+        starts of the same VM open it only once.
+        """
+        selects = [
+            select(
+                literal(vm_id, Integer),
+                literal(user_id, Integer),
+                literal(rate, Numeric(10, 4)),
+                literal(at, DateTime(timezone=True)),
+                literal(at, DateTime(timezone=True))
+            ).where(~exists().where(UsageSegment.vm_id == vm_id).where(UsageSegment.ended_at.is_(None)))
+            for vm_id, user_id, rate in rows
+        ]
+        return insert(UsageSegment).from_select(
+            ["vm_id", "user_id", "rate", "started_at", "billed_until"],
+            selects[0] if len(selects) == 1 else union_all(*selects)
+        )
+
+    @staticmethod
+    async def record_transition(
+        db: AsyncSession,
+        vm: VM,
+        previous: Optional[VMState],
+        at: Optional[datetime] = None
+    ) -> None:
+        """Close or open the VM's segment after a state change (caller commits)"""
+        close, open_ = UsageService.segment_change(previous, vm.state)
+        at = at or datetime.utcnow()
+
+        if close:
+            await db.execute(UsageService.close_segments([vm.id], at))
+        if open_:
+            rate = (await db.execute(
+                select(VMTemplate.cost_per_hour).where(VMTemplate.id == vm.template_id)
+            )).scalar_one()
+            await db.execute(UsageService.open_segments([(vm.id, vm.user_id, rate)], at))
+        if close or open_:
+            await db.execute(
+                AggregateService.server_usage_update(),
+                AggregateService.server_deltas([vm], 1 if open_ else -1)
+            )
+
+    @staticmethod
+    def charged_through(segment: Any, at: datetime) -> Decimal:
+        """
+        Amount a segment has been charged once billed up to at, rounded to the cent
+
+        Rounding the running total rather than each cycle's share keeps every
+        charge cent-exact (balances are Numeric(10,2)) without losing the
+        fractions: the charges for any stretch of a segment add up to the
+        difference between its totals at both ends, which the ledger uses to
+        invoice exactly what billing debited.
+        """
+        seconds = max((at - segment.started_at.replace(tzinfo=None)).total_seconds(), 0)
+        amount = Decimal(str(segment.rate)) * Decimal(seconds) / Decimal(3600)
+        return amount.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+    @staticmethod
+    def compute_charges(segments: Iterable[Any], now: datetime) -> List[Dict[str, Any]]:
+        """
+        Charge every unsettled segment up to its end (or now if still open)
+
+        segments need id, vm_id, user_id, rate, started_at, billed_until and ended_at.
+        """
+        charges = []
+        for segment in segments:
+            billed_until = segment.billed_until.replace(tzinfo=None)
+            end = segment.ended_at.replace(tzinfo=None) if segment.ended_at else now
+            seconds = max((end - billed_until).total_seconds(), 0)
+            cost = UsageService.charged_through(segment, max(end, billed_until)) \
+                - UsageService.charged_through(segment, billed_until)
+            charges.append({
+                "id": segment.id,
+                "vm_id": segment.vm_id,
+                "user_id": segment.user_id,
+                "cost": cost,
+                "hours": seconds / 3600,
+                "billed_until": max(end, billed_until),
+                "settled": segment.ended_at is not None,
+            })
+        return charges
+
+    @staticmethod
+    def totals(charges: Iterable[Dict[str, Any]], key: str) -> Dict[int, Decimal]:
+        """Sum charge costs by vm_id or user_id, skipping zero charges"""
+        totals: Dict[int, Decimal] = defaultdict(Decimal)
+        for charge in charges:
+            if charge["cost"] > 0:
+                totals[charge[key]] += charge["cost"]
+        return dict(totals)
@@ -0,0 +1,238 @@
+import asyncio
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.server import Server
+from app.models.template import VMTemplate
+from app.models.vm import VM, VMState
+from app.schemas.vm import VMBulkTarget, MAX_BULK_VMS
+from app.services.aggregates import AggregateService
+from app.services.proxmox import ProxmoxService
+from app.services.proxmox_scheduler import Priority, request_class
+from app.services.upid_tracker import upid_tracker
+from app.services.usage import UsageService
+
+
+# action -> (states it applies to, resulting state)
+TRANSITIONS: Dict[str, Tuple[Tuple[VMState, ...], VMState]] = {
+    "start": ((VMState.STOPPED,), VMState.RUNNING),
+    "stop": ((VMState.RUNNING, VMState.SUSPENDED), VMState.STOPPED),
+    "reboot": ((VMState.RUNNING,), VMState.RUNNING),
+    "suspend": ((VMState.RUNNING,), VMState.SUSPENDED),
+    "resume": ((VMState.SUSPENDED,), VMState.RUNNING),
+    "delete": ((VMState.CREATING, VMState.RUNNING, VMState.STOPPED, VMState.SUSPENDED, VMState.ERROR), VMState.DELETED),
+}
+
+PROXMOX_CALLS = {
+    "start": ProxmoxService.start_vm,
+    "stop": ProxmoxService.stop_vm,
+    "reboot": ProxmoxService.reboot_vm,
+    "suspend": ProxmoxService.suspend_vm,
+    "resume": ProxmoxService.resume_vm,
+    "delete": ProxmoxService.delete_vm,
+}
+
+
+class VMBulkService:
+    """Lifecycle actions over many of one user's VMs"""
+
+    @staticmethod
+    def select_vms(user_id: int, target: VMBulkTarget):
+        """The user's VMs matched by the request, with their server's API details"""
+        stmt = (
+            select(
+                VM.id,
+                VM.user_id,
+                VM.template_id,
+                VM.server_id,
+                VM.proxmox_vm_id,
+                VM.node_name,
+                VM.state,
+                VM.cpu_cores,
+                VM.ram_mb,
+                Server.name.label("server_name"),
+                Server.api_url,
+                Server.api_token_encrypted,
+                Server.verify_ssl
+            )
+            .join(Server, Server.id == VM.server_id)
+            .where(VM.user_id == user_id)
+            .where(VM.state != VMState.DELETED)
+            .order_by(VM.id)
+        )
+        if target.vm_ids is not None:
+            return stmt.where(VM.id.in_(set(target.vm_ids)))
+
+        selector = target.selector
+        if selector.name_prefix is not None:
+            stmt = stmt.where(VM.name.startswith(selector.name_prefix, autoescape=True))
+        if selector.states:
+            stmt = stmt.where(VM.state.in_([VMState(state) for state in selector.states]))
+        if selector.template_id is not None:
+            stmt = stmt.where(VM.template_id == selector.template_id)
+        # One past the cap, so the caller can tell an oversized selector apart
+        return stmt.limit(MAX_BULK_VMS + 1)
+
+    @staticmethod
+    def plan(action: str, target: VMBulkTarget, rows: List[Any]) -> Tuple[List[Any], List[Dict[str, Any]]]:
+        """Split matched VMs into those to act on and per-VM results for the rest"""
+        allowed, _ = TRANSITIONS[action]
+        found = {row.id: row for row in rows}
+        todo: List[Any] = []
+        results: List[Dict[str, Any]] = []
+
+        # Unknown IDs and other users' VMs look the same to the caller
+        for vm_id in dict.fromkeys(target.vm_ids or []):
+            if vm_id not in found:
+                results.append({"id": vm_id, "status": "error", "error": "VM not found"})
+
+        for row in rows:
+            if row.state in allowed:
+                todo.append(row)
+            else:
+                results.append({"id": row.id, "status": "skipped", "error": f"VM is {row.state.value}"})
+        return todo, results
+
+    @staticmethod
+    async def dispatch(
+        action: str,
+        rows: List[Any],
+        priority: Priority = Priority.BULK
+    ) -> AsyncIterator[Tuple[Any, str, Optional[str], Optional[str]]]:
+        """
+        Run the action on Proxmox, yielding (row, status, upid, error) as each VM finishes
+
+        Calls are grouped per server, with at most PROXMOX_BULK_CONCURRENCY in
+        flight on each, so a large request can't flood a single cluster, and
+        are scheduled as the owner's work at priority (see proxmox_scheduler). Each
+        accepted call is then followed through upid_tracker: status is "ok"
+        once the Proxmox task succeeded, "error" if it failed and "dispatched"
+        if it is still running after PROXMOX_BULK_TASK_TIMEOUT_SECONDS. VMs
+        not provisioned yet (no Proxmox VMID) only change in the database.
+        """
+        call = PROXMOX_CALLS[action]
+        by_server: Dict[int, List[Any]] = defaultdict(list)
+        for row in rows:
+            by_server[row.server_id].append(row)
+
+        done: asyncio.Queue = asyncio.Queue()
+
+        async def run_vm(proxmox: ProxmoxService, semaphore: asyncio.Semaphore, row: Any) -> None:
+            if row.proxmox_vm_id is None:
+                return await done.put((row, "ok", None, None))
+            with request_class(tenant=row.user_id, priority=priority):
+                await run_proxmox(proxmox, semaphore, row)
+
+        async def run_proxmox(proxmox: ProxmoxService, semaphore: asyncio.Semaphore, row: Any) -> None:
+            try:
+                async with semaphore:
+                    upid = (await call(proxmox, row.node_name, row.proxmox_vm_id)).get("data")
+            except Exception as e:
+                return await done.put((row, "error", None, str(e) or type(e).__name__))
+            if not upid:
+                return await done.put((row, "ok", None, None))
+
+            try:
+                status = await upid_tracker.wait(
+                    proxmox, row.node_name, upid, timeout=settings.PROXMOX_BULK_TASK_TIMEOUT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                return await done.put((row, "dispatched", upid, None))
+            except Exception as e:
+                return await done.put((row, "error", upid, str(e) or type(e).__name__))
+            if upid_tracker.succeeded(status):
+                await done.put((row, "ok", upid, None))
+            else:
+                await done.put((row, "error", upid, status.get("exitstatus") or "Proxmox task failed"))
+
+        async def run_server(server_rows: List[Any]) -> None:
+            first = server_rows[0]
+            try:
+                proxmox = ProxmoxService(
+                    api_url=first.api_url,
+                    api_token_encrypted=first.api_token_encrypted,
+                    verify_ssl=first.verify_ssl,
+                    server_name=first.server_name
+                )
+            except Exception as e:
+                # e.g. a token that no longer decrypts: every VM on the server fails
+                for row in server_rows:
+                    await done.put((row, "error", None, f"Server {first.server_name} unavailable: {e}"))
+                return
+            semaphore = asyncio.Semaphore(settings.PROXMOX_BULK_CONCURRENCY)
+            await asyncio.gather(*(run_vm(proxmox, semaphore, row) for row in server_rows))
+
+        async def run_all() -> None:
+            try:
+                await asyncio.gather(
+                    *(run_server(server_rows) for server_rows in by_server.values()),
+                    return_exceptions=True
+                )
+            finally:
+                # End of results, however the workers finished
+                done.put_nowait(None)
+
+        runner = asyncio.ensure_future(run_all())
+        try:
+            while (item := await done.get()) is not None:
+                yield item
+        finally:
+            runner.cancel()
+
+    @staticmethod
+    async def apply(db: AsyncSession, action: str, vm_ids: List[int], at: datetime) -> List[Any]:
+        """
+        Move VMs to the action's resulting state with usage and allocation updates
+
+        States are re-read under lock, so VMs changed by another request while
+        Proxmox was working are left alone. Returns the rows that moved (caller commits).
+        """
+        if not vm_ids:
+            return []
+        allowed, new_state = TRANSITIONS[action]
+        rows = (await db.execute(
+            select(VM.id, VM.user_id, VM.template_id, VM.server_id, VM.state, VM.cpu_cores, VM.ram_mb)
+            .where(VM.id.in_(vm_ids))
+            .where(VM.state.in_(allowed))
+            .with_for_update()
+        )).all()
+        if not rows:
+            return []
+
+        values: Dict[str, Any] = {"state": new_state, "state_changed_at": at}
+        if new_state == VMState.DELETED:
+            values["deleted_at"] = at
+        await db.execute(
+            update(VM)
+            .where(VM.id.in_([row.id for row in rows]))
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+
+        to_close, to_open = [], []
+        for row in rows:
+            close, open_ = UsageService.segment_change(row.state, new_state)
+            if close:
+                to_close.append(row)
+            if open_:
+                to_open.append(row)
+
+        if to_close:
+            await db.execute(UsageService.close_segments([row.id for row in to_close], at))
+        if to_open:
+            rates = dict((await db.execute(
+                select(VMTemplate.id, VMTemplate.cost_per_hour)
+                .where(VMTemplate.id.in_({row.template_id for row in to_open}))
+            )).all())
+            await db.execute(UsageService.open_segments(
+                [(row.id, row.user_id, rates[row.template_id]) for row in to_open], at
+            ))
+        deltas = AggregateService.server_deltas(to_close, -1) + AggregateService.server_deltas(to_open, 1)
+        if deltas:
+            await db.execute(AggregateService.server_usage_update(), deltas)
+        return rows
@@ -0,0 +1,94 @@
+from app.tasks.celery_app import celery_app
+from app.tasks.runtime import task_runtime
+from app.core.database import SessionLocal
+from app.core.config import settings
+from app.core.logging import logger, audit_logger
+from app.core.events import event_publisher
+from app.core.revocation import token_revocations
+from app.models.task import Task, TaskStatus
+from app.services.bulk import BulkAdminService, BulkChunkResult
+from app.services.exhaustion import exhaustion_scheduler
+from datetime import datetime
+
+
+@celery_app.task(name="app.tasks.admin.run_bulk_operation")
+def run_bulk_operation(task_id: int):
+    """Apply a queued bulk admin operation chunk by chunk, reporting progress"""
+    
+    db = SessionLocal()
+    task = None
+    
+    try:
+        task = db.get(Task, task_id)
+        if task is None or task.status != TaskStatus.PENDING:
+            return {"status": "skipped", "reason": "not_pending"}
+        
+        task.status = TaskStatus.RUNNING
+        task.started_at = datetime.utcnow()
+        db.commit()
+        
+        admin_id = task.payload["admin_id"]
+        request = BulkAdminService.OPERATIONS[task.type].model_validate(task.payload["request"])
+        total = len(BulkAdminService.items(request))
+        outcome = BulkChunkResult()
+        
+        # Commit per chunk: locks stay short and progress is visible
+        for start in range(0, total, settings.BULK_CHUNK_SIZE):
+            stop = min(start + settings.BULK_CHUNK_SIZE, total)
+            proxmox = None
+            targets = BulkAdminService.proxmox_targets(task.type, request, start, stop)
+            if targets is not None:
+                rows = db.execute(targets).all()
+                # Don't hold the snapshot open while Proxmox works
+                db.rollback()
+                proxmox = task_runtime.run(BulkAdminService.run_proxmox(task.type, rows))
+            chunk = BulkAdminService.apply(db, task.type, request, admin_id, start, stop, proxmox)
+            
+            task.progress_percent = int(stop * 100 / total)
+            task.progress_message = f"{stop}/{total} items processed"
+            db.commit()
+            
+            exhaustion_scheduler.refresh(db, chunk.user_ids)
+            token_revocations.revoke_users(chunk.revoked)
+            for event in chunk.events:
+                event_publisher.publish(*event)
+            outcome.extend(chunk)
+        
+        task.status = TaskStatus.COMPLETED
+        task.completed_at = datetime.utcnow()
+        task.result = {
+            "total": total,
+            "succeeded": total - outcome.failed,
+            "failed": outcome.failed,
+            "results": [
+                {**result, "balance": str(result["balance"])} if "balance" in result else result
+                for result in outcome.results
+            ]
+        }
+        db.commit()
+        
+        audit_logger.log(
+            task.type,
+            user_id=admin_id,
+            details={"task_id": task.id, "items": total, "failed": outcome.failed}
+        )
+        logger.info(f"Bulk task {task.id} ({task.type}) complete: {total} items, {outcome.failed} failed")
+        
+        return {"status": "success", "total": total, "failed": outcome.failed}
+    
+    except Exception as e:
+        logger.error(f"Error in bulk task {task_id}: {e}")
+        db.rollback()
+        if task is not None:
+            # Chunks committed so far stay applied; the message says how far it got
+            task.status = TaskStatus.FAILED
+            task.error_message = str(e)
+            task.completed_at = datetime.utcnow()
+            db.commit()
+        return {
+            "status": "error",
+            "error": str(e)
+        }
+    
+    finally:
+        db.close()
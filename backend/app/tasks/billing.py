@@ -1,18 +1,35 @@
 from app.tasks.celery_app import celery_app
+from app.tasks.runtime import task_runtime
 from app.core.database import SessionLocal
 from app.core.config import settings
-from app.core.logging import logger
+from app.core.logging import logger, audit_logger
+from app.core.events import event_publisher
+from app.core.locks import ensure_lease, singleton
+from app.core.metrics import billing_cycle_vms_billed, billing_cycle_amount, billing_cycle_seconds, balance_drift_users
 from app.models.user import User, UserStatus
-from app.models.vm import VM, VMState
-from app.models.template import VMTemplate
-from app.services.billing import BillingService
-from sqlalchemy import select
-from datetime import datetime
+from app.models.vm import VM, VMState, BILLABLE_STATES
+from app.models.usage import UsageSegment
+from app.models.server import Server
+from app.services.usage import UsageService
+from app.services.aggregates import AggregateService
+from app.services.ledger import LedgerService
+from app.services.balances import BalanceService
+from app.services.exhaustion import ExhaustionScheduler, exhaustion_scheduler
+from app.services.vm_bulk import VMBulkService
+from sqlalchemy import select, update, bindparam
+from datetime import datetime, timedelta
+from decimal import Decimal
+import time
 
 
-@celery_app.task(name="app.tasks.billing.process_vm_billing")
+@celery_app.task(
+    name="app.tasks.billing.process_vm_billing",
+    acks_late=True,  # Redeliver if the worker dies mid-cycle
+    reject_on_worker_lost=True
+)
+@singleton(ttl_seconds=120, policy="queue")
 def process_vm_billing():
-    """Process billing for all running VMs"""
+    """Charge unsettled usage segments and settle the closed ones"""
     
     if not settings.ENABLE_AUTO_BILLING:
         logger.info("Auto-billing is disabled, skipping")
@@ -20,63 +37,97 @@ def process_vm_billing():
     
     logger.info("Starting VM billing cycle")
     
+    cycle_start = time.perf_counter()
     db = SessionLocal()
-    billed_count = 0
-    total_amount = 0
     
     try:
-        # Get all billable VMs (running or suspended)
-        result = db.execute(
-            select(VM)
-            .where(VM.state.in_([VMState.RUNNING, VMState.SUSPENDED]))
+        now = datetime.utcnow()
+        
+        # Segments are opened and closed by VM state changes, so the cycle
+        # only reads the ledger: no per-VM user/template lookups
+        segments = db.execute(
+            select(
+                UsageSegment.id,
+                UsageSegment.vm_id,
+                UsageSegment.user_id,
+                UsageSegment.rate,
+                UsageSegment.started_at,
+                UsageSegment.billed_until,
+                UsageSegment.ended_at,
+                VM.template_id
+            )
+            .join(VM, VM.id == UsageSegment.vm_id)
+            .where(UsageSegment.settled_at.is_(None))
+        ).all()
+        
+        logger.info(f"Found {len(segments)} unsettled usage segments")
+        
+        charges = UsageService.compute_charges(segments, now)
+        vm_totals = UsageService.totals(charges, "vm_id")
+        user_totals = UsageService.totals(charges, "user_id")
+        
+        if charges:
+            # ORM bulk UPDATE by primary key
+            db.execute(update(UsageSegment), [
+                {
+                    "id": charge["id"],
+                    "billed_until": charge["billed_until"],
+                    "settled_at": now if charge["settled"] else None
+                }
+                for charge in charges
+            ])
+        
+        if vm_totals:
+            vms = VM.__table__
+            db.execute(
+                update(vms)
+                .where(vms.c.id == bindparam("vm_id"))
+                .values(total_cost=vms.c.total_cost + bindparam("cents"), last_billed_at=now),
+                [{"vm_id": vm_id, "cents": int(cost * 100)} for vm_id, cost in vm_totals.items()]
+            )
+        
+        spend = AggregateService.spend_rows(
+            charges, {segment.id: segment.template_id for segment in segments}, now.date()
         )
-        vms = result.scalars().all()
-        
-        logger.info(f"Found {len(vms)} billable VMs")
-        
-        for vm in vms:
-            try:
-                # Get user
-                user = db.query(User).filter(User.id == vm.user_id).first()
-                if not user:
-                    logger.error(f"User {vm.user_id} not found for VM {vm.id}")
-                    continue
-                
-                # Get template
-                template = db.query(VMTemplate).filter(VMTemplate.id == vm.template_id).first()
-                if not template:
-                    logger.error(f"Template {vm.template_id} not found for VM {vm.id}")
-                    continue
-                
-                # Bill the VM (synchronous version)
-                hours = vm.uptime_hours
-                if hours > 0:
-                    cost = float(template.cost_per_hour) * hours
-                    
-                    # Update user balance
-                    user.balance -= cost
-                    
-                    # Update VM
-                    vm.last_billed_at = datetime.utcnow()
-                    vm.total_cost += int(cost * 100)
-                    
-                    billed_count += 1
-                    total_amount += cost
-                    
-                    logger.info(f"Billed VM {vm.id}: {hours:.2f}h * ${template.cost_per_hour} = ${cost:.2f}")
-            
-            except Exception as e:
-                logger.error(f"Error billing VM {vm.id}: {e}")
-                continue
+        if spend:
+            db.execute(AggregateService.spend_upsert(db.get_bind().dialect.name), spend)
+        
+        if user_totals:
+            users = User.__table__
+            db.execute(
+                update(users)
+                .where(users.c.id == bindparam("user_id"))
+                .values(
+                    balance=users.c.balance - bindparam("amount"),
+                    usage_charged=users.c.usage_charged + bindparam("amount")
+                ),
+                [{"user_id": user_id, "amount": cost} for user_id, cost in user_totals.items()]
+            )
         
+        ensure_lease()
         db.commit()
         
-        logger.info(f"Billing cycle complete: {billed_count} VMs billed for ${total_amount:.2f}")
+        total_amount = sum(user_totals.values(), Decimal(0))
+        
+        billing_cycle_vms_billed.set(len(vm_totals))
+        billing_cycle_amount.set(float(total_amount))
+        billing_cycle_seconds.set(time.perf_counter() - cycle_start)
+        
+        # Notify connected clients once per user, after the commit
+        if user_totals:
+            balances = db.execute(
+                select(User.id, User.balance).where(User.id.in_(list(user_totals)))
+            ).all()
+            for user_id, balance in balances:
+                event_publisher.publish(user_id, "balance", {"balance": balance})
+        
+        logger.info(f"Billing cycle complete: {len(vm_totals)} VMs billed for ${total_amount:.2f}")
         
         return {
             "status": "success",
-            "vms_billed": billed_count,
-            "total_amount": total_amount
+            "vms_billed": len(vm_totals),
+            "segments_settled": sum(1 for charge in charges if charge["settled"]),
+            "total_amount": float(total_amount)
         }
     
     except Exception as e:
@@ -91,9 +142,141 @@ def process_vm_billing():
         db.close()
 
 
+async def _stop_on_proxmox(rows) -> list:
+    """Stop VMs on Proxmox, grouped per server; returns (row, status, upid, error) per VM"""
+    return [result async for result in VMBulkService.dispatch("stop", rows)]
+
+
+def _enforce_balances(db, user_ids=None) -> dict:
+    """
+    Stop billable VMs of users whose effective balance is exhausted and
+    reschedule everyone else
+    
+    VMs are stopped on Proxmox first; only those it confirmed stop billing
+    here. Stops still running are recorded by reconciliation, and users
+    with a failed stop are kept due so the next run retries them.
+    """
+    now = datetime.utcnow()
+    rows = db.execute(ExhaustionScheduler.projection_query(user_ids)).all()
+    deadlines = ExhaustionScheduler.project(rows, now)
+    statuses = {row.id: row.status for row in rows}
+    
+    exhausted = []
+    for user_id, deadline in deadlines.items():
+        if deadline is None or deadline > now:
+            continue
+        # Only active accounts are auto-stopped; drop the others from the schedule
+        if statuses[user_id] == UserStatus.ACTIVE:
+            exhausted.append(user_id)
+        deadlines[user_id] = None
+    
+    targets = []
+    if exhausted:
+        targets = db.execute(
+            select(
+                VM.id,
+                VM.user_id,
+                VM.server_id,
+                VM.proxmox_vm_id,
+                VM.node_name,
+                Server.name.label("server_name"),
+                Server.api_url,
+                Server.api_token_encrypted,
+                Server.verify_ssl
+            )
+            .join(Server, Server.id == VM.server_id)
+            .where(VM.user_id.in_(exhausted))
+            .where(VM.state.in_(BILLABLE_STATES))
+        ).all()
+        # Don't hold the snapshot open while Proxmox works
+        db.rollback()
+    
+    confirmed, failed = [], 0
+    for row, outcome, upid, error in (task_runtime.run(_stop_on_proxmox(targets)) if targets else []):
+        if outcome == "ok":
+            confirmed.append(row.id)
+        elif outcome == "error":
+            failed += 1
+            deadlines[row.user_id] = now
+            logger.error(f"Auto-stop of VM {row.id} for user {row.user_id} failed: {error}")
+    
+    stopped = []
+    if confirmed:
+        # Re-read under lock: VMs stopped meanwhile by someone else are left alone
+        stopped = db.execute(
+            select(VM.id, VM.user_id, VM.server_id, VM.cpu_cores, VM.ram_mb)
+            .where(VM.id.in_(confirmed))
+            .where(VM.state.in_(BILLABLE_STATES))
+            .with_for_update()
+        ).all()
+    
+    if stopped:
+        vm_ids = [vm.id for vm in stopped]
+        now = datetime.utcnow()
+        db.execute(update(VM).where(VM.id.in_(vm_ids)).values(state=VMState.STOPPED, state_changed_at=now))
+        db.execute(UsageService.close_segments(vm_ids, now))
+        db.execute(AggregateService.server_usage_update(), AggregateService.server_deltas(stopped, -1))
+    
+    ensure_lease()
+    db.commit()
+    
+    exhaustion_scheduler.update(deadlines)
+    
+    for vm in stopped:
+        logger.info(f"Auto-stopped VM {vm.id} for user {vm.user_id} (balance exhausted)")
+        event_publisher.publish(
+            vm.user_id,
+            "vm_state",
+            {"vm_id": vm.id, "state": VMState.STOPPED.value, "reason": "insufficient_balance"}
+        )
+    
+    return {
+        "users_checked": len(deadlines),
+        "users_affected": len({vm.user_id for vm in stopped}),
+        "vms_stopped": len(stopped),
+        "vms_failed": failed
+    }
+
+
+@celery_app.task(name="app.tasks.billing.enforce_balance_deadlines")
+@singleton()
+def enforce_balance_deadlines():
+    """Enforce users whose projected zero-balance time has passed"""
+    
+    if not settings.ENABLE_AUTO_SHUTDOWN:
+        return {"status": "skipped", "reason": "auto_shutdown_disabled"}
+    
+    db = SessionLocal()
+    
+    try:
+        # Popped users are re-projected from the database, so a top-up since
+        # scheduling just moves the deadline instead of stopping VMs
+        due = exhaustion_scheduler.pop_due(datetime.utcnow())
+        if not due:
+            return {"status": "success", "users_checked": 0, "users_affected": 0, "vms_stopped": 0}
+        
+        result = _enforce_balances(db, due)
+        
+        logger.info(f"Balance deadlines: {result['vms_stopped']} VMs stopped for {result['users_affected']} users")
+        
+        return {"status": "success", **result}
+    
+    except Exception as e:
+        logger.error(f"Error enforcing balance deadlines: {e}")
+        db.rollback()
+        return {
+            "status": "error",
+            "error": str(e)
+        }
+    
+    finally:
+        db.close()
+
+
 @celery_app.task(name="app.tasks.billing.check_user_balances")
+@singleton()
 def check_user_balances():
-    """Check user balances and enforce policies"""
+    """Rebuild the balance deadline schedule and enforce anything overdue"""
     
     if not settings.ENABLE_AUTO_SHUTDOWN:
         logger.info("Auto-shutdown is disabled, skipping")
@@ -102,55 +285,118 @@ def check_user_balances():
     logger.info("Checking user balances")
     
     db = SessionLocal()
-    users_affected = 0
-    vms_stopped = 0
     
     try:
-        # Get users with zero or negative balance
-        result = db.execute(
-            select(User)
-            .where(User.balance <= 0)
-            .where(User.status == UserStatus.ACTIVE)
+        # Only users with a running meter; catches deadlines lost from Redis
+        result = _enforce_balances(db)
+        
+        logger.info(
+            f"Balance check complete: {result['vms_stopped']} VMs stopped for "
+            f"{result['users_affected']} users"
         )
-        users = result.scalars().all()
-        
-        logger.info(f"Found {len(users)} users with insufficient balance")
-        
-        for user in users:
-            try:
-                # Get running VMs for this user
-                result = db.execute(
-                    select(VM)
-                    .where(VM.user_id == user.id)
-                    .where(VM.state == VMState.RUNNING)
-                )
-                running_vms = result.scalars().all()
-                
-                if running_vms:
-                    users_affected += 1
-                    
-                    for vm in running_vms:
-                        # Stop the VM
-                        vm.state = VMState.STOPPED
-                        vms_stopped += 1
-                        logger.info(f"Auto-stopped VM {vm.id} for user {user.id} (balance: ${user.balance})")
-            
-            except Exception as e:
-                logger.error(f"Error processing user {user.id}: {e}")
-                continue
         
-        db.commit()
+        return {"status": "success", **result}
+    
+    except Exception as e:
+        logger.error(f"Error checking balances: {e}")
+        db.rollback()
+        return {
+            "status": "error",
+            "error": str(e)
+        }
+    
+    finally:
+        db.close()
+
+
+@celery_app.task(name="app.tasks.billing.compact_usage_ledger")
+@singleton(ttl_seconds=300)
+def compact_usage_ledger():
+    """Roll closed months into per-VM summaries, invoice them and archive their segments"""
+    
+    db = SessionLocal()
+    
+    try:
+        grace = timedelta(hours=settings.LEDGER_CLOSE_GRACE_HOURS)
+        closed = []
         
-        logger.info(f"Balance check complete: {vms_stopped} VMs stopped for {users_affected} users")
+        # Oldest first, one transaction per month
+        while True:
+            month = LedgerService.next_closable_month(db, datetime.utcnow(), grace)
+            if month is None:
+                break
+            
+            result = LedgerService.close_month(db, month)
+            if result is None:
+                logger.info(f"Usage for {month:%Y-%m} is not fully billed yet, not closing it")
+                db.rollback()
+                break
+            
+            ensure_lease()
+            db.commit()
+            
+            logger.info(
+                f"Closed {month:%Y-%m}: {result['vms']} VMs, {result['invoices']} invoices, "
+                f"{result['segments_archived']} segments archived"
+            )
+            closed.append(month.isoformat())
         
+        return {"status": "success", "months_closed": closed}
+    
+    except Exception as e:
+        logger.error(f"Error compacting usage ledger: {e}")
+        db.rollback()
         return {
-            "status": "success",
-            "users_affected": users_affected,
-            "vms_stopped": vms_stopped
+            "status": "error",
+            "error": str(e)
         }
     
+    finally:
+        db.close()
+
+
+@celery_app.task(name="app.tasks.billing.snapshot_balances")
+@singleton(ttl_seconds=300)
+def snapshot_balances():
+    """Snapshot every user's balance and flag drift from the previous snapshot"""
+    
+    db = SessionLocal()
+    
+    try:
+        now = datetime.utcnow()
+        tolerance = Decimal(str(settings.BALANCE_DRIFT_TOLERANCE))
+        after_user_id = 0
+        users = 0
+        drifted = []
+        
+        # Keyset batches, one transaction each, so user rows are locked briefly
+        while True:
+            rows = BalanceService.take_snapshots(db, after_user_id, settings.BALANCE_SNAPSHOT_BATCH_SIZE, now)
+            if not rows:
+                break
+            ensure_lease()
+            db.commit()
+            
+            users += len(rows)
+            after_user_id = rows[-1]["user_id"]
+            drifted.extend(row for row in rows if row["drift"] is not None and abs(row["drift"]) > tolerance)
+        
+        balance_drift_users.set(len(drifted))
+        for row in drifted:
+            logger.warning(f"Balance drift for user {row['user_id']}: {row['drift']} (balance {row['balance']})")
+            audit_logger.log(
+                "balance_drift",
+                user_id=row["user_id"],
+                details={"balance": row["balance"], "drift": row["drift"], "last_txn_id": row["last_txn_id"]},
+                level="WARNING"
+            )
+        
+        logger.info(f"Balance snapshots: {users} users, {len(drifted)} with drift")
+        
+        return {"status": "success", "users": users, "drifted": [row["user_id"] for row in drifted]}
+    
     except Exception as e:
-        logger.error(f"Error checking balances: {e}")
+        logger.error(f"Error snapshotting balances: {e}")
         db.rollback()
         return {
             "status": "error",
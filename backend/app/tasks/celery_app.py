@@ -1,6 +1,18 @@
+import os
+import time
+from datetime import timedelta
 from celery import Celery
-from celery.schedules import crontab
+from celery.schedules import crontab, schedule
+from kombu import Queue
+from celery.signals import task_prerun, task_postrun, worker_init, worker_process_shutdown
+from prometheus_client import start_http_server
 from app.core.config import settings
+from app.core.metrics import (
+    celery_task_duration_seconds,
+    get_registry,
+    mark_process_dead,
+    reset_multiprocess_dir,
+)
 
 # Create Celery app
 celery_app = Celery(
@@ -9,7 +21,8 @@ celery_app = Celery(
     backend=settings.REDIS_URL,
     include=[
         "app.tasks.billing",
-        "app.tasks.monitoring"
+        "app.tasks.monitoring",
+        "app.tasks.admin"
     ]
 )
 
@@ -23,7 +36,36 @@ celery_app.conf.update(
     task_track_started=True,
     task_time_limit=30 * 60,  # 30 minutes
     task_soft_time_limit=25 * 60,  # 25 minutes
+    # One reserved message per process: long tasks never hold others hostage.
+    # Workers override this per queue with --prefetch-multiplier.
+    worker_prefetch_multiplier=1,
+    # acks_late tasks are redelivered if unacked after this; must exceed task_time_limit
+    broker_transport_options={"visibility_timeout": 2 * 60 * 60},
+)
+
+# ==================== Queues & Routing ====================
+
+QUEUE_BILLING = "billing"  # Money-moving, serial, acks_late
+QUEUE_MONITORING = "monitoring"  # Latency-sensitive health checks and reconciliation
+QUEUE_PROVISIONING = "provisioning"  # User-facing VM operations
+QUEUE_MAINTENANCE = "maintenance"  # Bulk/background work and anything unrouted
+
+celery_app.conf.task_queues = (
+    Queue(QUEUE_BILLING),
+    Queue(QUEUE_MONITORING),
+    Queue(QUEUE_PROVISIONING),
+    Queue(QUEUE_MAINTENANCE),
 )
+celery_app.conf.task_default_queue = QUEUE_MAINTENANCE
+
+# Matched in order; first match wins
+celery_app.conf.task_routes = {
+    "app.tasks.monitoring.collect_metrics": {"queue": QUEUE_MAINTENANCE},
+    "app.tasks.billing.*": {"queue": QUEUE_BILLING},
+    "app.tasks.monitoring.*": {"queue": QUEUE_MONITORING},
+    "app.tasks.provisioning.*": {"queue": QUEUE_PROVISIONING},
+    "app.tasks.admin.*": {"queue": QUEUE_MAINTENANCE},
+}
 
 # Periodic tasks schedule
 celery_app.conf.beat_schedule = {
@@ -31,12 +73,68 @@ celery_app.conf.beat_schedule = {
         "task": "app.tasks.billing.process_vm_billing",
         "schedule": crontab(minute=f"*/{settings.BILLING_CYCLE_MINUTES}"),  # Every N minutes
     },
+    "compact-usage-ledger": {
+        "task": "app.tasks.billing.compact_usage_ledger",
+        "schedule": crontab(hour=3, minute=30),  # Daily; closes a month once its grace period is over
+    },
+    "snapshot-balances": {
+        "task": "app.tasks.billing.snapshot_balances",
+        "schedule": schedule(timedelta(hours=settings.BALANCE_SNAPSHOT_HOURS)),
+    },
     "update-server-status": {
         "task": "app.tasks.monitoring.update_server_status",
         "schedule": crontab(minute="*/5"),  # Every 5 minutes
     },
     "check-user-balances": {
         "task": "app.tasks.billing.check_user_balances",
-        "schedule": crontab(minute="*/10"),  # Every 10 minutes
+        # Safety net; an interval, since crontab's */N only divides the hour
+        "schedule": schedule(timedelta(minutes=settings.BALANCE_SWEEP_MINUTES)),
+    },
+    "enforce-balance-deadlines": {
+        "task": "app.tasks.billing.enforce_balance_deadlines",
+        "schedule": float(settings.BALANCE_ENFORCE_INTERVAL_SECONDS),
+    },
+    "reconcile-vm-states": {
+        "task": "app.tasks.monitoring.reconcile_vm_states",
+        "schedule": float(settings.VM_RECONCILE_INTERVAL_SECONDS),
+    },
+    "collect-metrics": {
+        "task": "app.tasks.monitoring.collect_metrics",
+        "schedule": float(settings.METRICS_COLLECT_INTERVAL_SECONDS),
     },
 }
+
+
+# ==================== Metrics ====================
+
+_task_start_times = {}
+
+
+@task_prerun.connect
+def _record_task_start(task_id=None, **kwargs):
+    _task_start_times[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def _record_task_duration(task_id=None, task=None, state=None, **kwargs):
+    start_time = _task_start_times.pop(task_id, None)
+    if start_time is None or task is None:
+        return
+    celery_task_duration_seconds.labels(
+        task=task.name,
+        state=state or "UNKNOWN"
+    ).observe(time.perf_counter() - start_time)
+
+
+@worker_init.connect
+def _start_metrics_server(**kwargs):
+    """Expose worker metrics (set PROMETHEUS_MULTIPROC_DIR for prefork pools)"""
+    # Runs in the parent before the pool forks: start from an empty directory
+    reset_multiprocess_dir()
+    if settings.CELERY_METRICS_PORT:
+        start_http_server(settings.CELERY_METRICS_PORT, registry=get_registry())
+
+
+@worker_process_shutdown.connect
+def _mark_metrics_process_dead(pid=None, **kwargs):
+    mark_process_dead(pid or os.getpid())
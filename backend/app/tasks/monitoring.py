@@ -1,55 +1,84 @@
 from app.tasks.celery_app import celery_app
-from app.core.database import SessionLocal
+from app.tasks.runtime import async_task, task_runtime
 from app.core.logging import logger
-from app.core.encryption import encryption
+from app.core.events import event_publisher
+from app.core.locks import ensure_lease, singleton
 from app.models.server import Server, ServerStatus
+from app.models.vm import VM, VMState
+from app.models.template import VMTemplate
 from app.services.proxmox import ProxmoxService
-from sqlalchemy import select
-from datetime import datetime
+from app.services.proxmox_scheduler import Priority, request_class
+from app.services.reconciliation import ReconciliationService, RECONCILABLE_STATES
+from app.services.timeseries import TimeSeriesService
+from app.services.usage import UsageService
+from app.services.aggregates import AggregateService
+from app.services.exhaustion import exhaustion_scheduler
+from app.core.config import settings
+from sqlalchemy import select, update
+from datetime import datetime, timedelta
+import asyncio
 
 
-@celery_app.task(name="app.tasks.monitoring.update_server_status")
-def update_server_status():
+@celery_app.task(
+    name="app.tasks.monitoring.update_server_status",
+    soft_time_limit=240,
+    time_limit=300
+)
+@singleton()
+@request_class(priority=Priority.BACKGROUND)
+@async_task
+async def update_server_status():
     """Update status of all Proxmox servers"""
     
     logger.info("Updating server status")
     
-    db = SessionLocal()
-    updated_count = 0
+    db = task_runtime.session()
     
     try:
         # Get all active servers
-        result = db.execute(
+        result = await db.execute(
             select(Server).where(Server.is_active == True)
         )
         servers = result.scalars().all()
         
         logger.info(f"Checking {len(servers)} servers")
         
-        for server in servers:
-            try:
-                # Create Proxmox service
-                proxmox = ProxmoxService(
-                    api_url=server.api_url,
-                    api_token_encrypted=server.api_token_encrypted,
-                    verify_ssl=server.verify_ssl
-                )
-                
-                # Test connection (synchronous - needs to be adapted for async)
-                # For now, just mark as online
-                server.status = ServerStatus.ONLINE
-                server.last_seen_at = datetime.utcnow()
-                server.last_error = None
-                
-                updated_count += 1
-                logger.info(f"Server {server.name} is online")
-            
-            except Exception as e:
+        async def check(server: Server) -> None:
+            proxmox = ProxmoxService(
+                api_url=server.api_url,
+                api_token_encrypted=server.api_token_encrypted,
+                verify_ssl=server.verify_ssl,
+                server_name=server.name
+            )
+            await proxmox.test_connection()
+        
+        # Probe every server at once instead of one after another
+        results = await asyncio.gather(
+            *(check(server) for server in servers),
+            return_exceptions=True
+        )
+        
+        updated_count = 0
+        now = datetime.utcnow()
+        
+        for server, error in zip(servers, results):
+            if isinstance(error, Exception):
                 server.status = ServerStatus.ERROR
-                server.last_error = str(e)
-                logger.error(f"Server {server.name} check failed: {e}")
+                server.last_error = str(error)
+                logger.error(f"Server {server.name} check failed: {error}")
+                continue
+            
+            server.status = ServerStatus.ONLINE
+            server.last_seen_at = now
+            server.last_error = None
+            updated_count += 1
+            logger.info(f"Server {server.name} is online")
+        
+        # Recount allocations so incremental updates cannot drift for long
+        await db.run_sync(AggregateService.rebuild_server_usage)
         
-        db.commit()
+        ensure_lease()
+        await db.commit()
         
         logger.info(f"Server status update complete: {updated_count}/{len(servers)} online")
         
@@ -61,11 +90,178 @@ def update_server_status():
     
     except Exception as e:
         logger.error(f"Error updating server status: {e}")
-        db.rollback()
+        await db.rollback()
+        return {
+            "status": "error",
+            "error": str(e)
+        }
+    
+    finally:
+        await db.close()
+
+
+@celery_app.task(
+    name="app.tasks.monitoring.reconcile_vm_states",
+    soft_time_limit=240,
+    time_limit=300
+)
+@singleton()
+@request_class(priority=Priority.BACKGROUND)
+@async_task
+async def reconcile_vm_states():
+    """Converge VM states with Proxmox using one cluster/resources call per server"""
+    
+    db = task_runtime.session()
+    
+    try:
+        servers = (await db.execute(
+            select(Server).where(Server.is_active == True)
+        )).scalars().all()
+        
+        if not servers:
+            return {"status": "success", "servers": 0, "vms_updated": 0}
+        
+        cluster_state, reachable = await ReconciliationService.fetch_cluster_state(servers)
+        
+        # Load only the columns needed for the diff
+        rows = (await db.execute(
+            select(VM.id, VM.user_id, VM.server_id, VM.proxmox_vm_id, VM.node_name, VM.state, VM.state_changed_at)
+            .where(VM.proxmox_vm_id.isnot(None))
+            .where(VM.state.in_(RECONCILABLE_STATES))
+            .where(VM.server_id.in_(reachable))
+        )).all()
+        
+        # A stop or start the panel just made must not be undone by a stale listing
+        settled_before = datetime.utcnow() - timedelta(seconds=settings.VM_RECONCILE_GRACE_SECONDS)
+        changes = ReconciliationService.compute_changes(rows, cluster_state, reachable, settled_before)
+        
+        if changes:
+            rows_by_id = {row.id: row for row in rows}
+            now = datetime.utcnow()
+            
+            to_close = []
+            to_open = []
+            for change in changes:
+                if "state" not in change:
+                    continue
+                # Started or stopped outside the panel: the usage ledger follows
+                close, open_ = UsageService.segment_change(rows_by_id[change["id"]].state, change["state"])
+                if close:
+                    to_close.append(change["id"])
+                if open_:
+                    to_open.append(change["id"])
+            
+            # ORM bulk UPDATE by primary key
+            await db.execute(update(VM), changes)
+            
+            if to_close:
+                await db.execute(UsageService.close_segments(to_close, now))
+            if to_open:
+                rates = (await db.execute(
+                    select(VM.id, VM.user_id, VMTemplate.cost_per_hour)
+                    .join(VMTemplate, VMTemplate.id == VM.template_id)
+                    .where(VM.id.in_(to_open))
+                )).all()
+                await db.execute(UsageService.open_segments(rates, now))
+            
+            if to_close or to_open:
+                sizes = {
+                    vm.id: vm for vm in await db.execute(
+                        select(VM.id, VM.server_id, VM.cpu_cores, VM.ram_mb)
+                        .where(VM.id.in_(to_close + to_open))
+                    )
+                }
+                deltas = (
+                    AggregateService.server_deltas([sizes[vm_id] for vm_id in to_close], -1)
+                    + AggregateService.server_deltas([sizes[vm_id] for vm_id in to_open], 1)
+                )
+                await db.execute(AggregateService.server_usage_update(), deltas)
+            
+            ensure_lease()
+            await db.commit()
+            
+            if to_close or to_open:
+                await exhaustion_scheduler.refresh_async(db, {
+                    rows_by_id[vm_id].user_id for vm_id in to_close + to_open
+                })
+            
+            for change in changes:
+                if "state" in change:
+                    await event_publisher.publish_async(
+                        rows_by_id[change["id"]].user_id,
+                        "vm_state",
+                        {"vm_id": change["id"], "state": change["state"].value, "reason": "reconciled"}
+                    )
+        
+        logger.info(
+            f"Reconciled {len(rows)} VMs on {len(reachable)}/{len(servers)} servers: "
+            f"{len(changes)} updated"
+        )
+        
+        return {
+            "status": "success",
+            "servers": len(servers),
+            "servers_reachable": len(reachable),
+            "vms_checked": len(rows),
+            "vms_updated": len(changes)
+        }
+    
+    except Exception as e:
+        logger.error(f"Error reconciling VM states: {e}")
+        await db.rollback()
+        return {
+            "status": "error",
+            "error": str(e)
+        }
+    
+    finally:
+        await db.close()
+
+
+@celery_app.task(name="app.tasks.monitoring.collect_metrics")
+@singleton(ttl_seconds=120)
+@request_class(priority=Priority.BACKGROUND)
+@async_task
+async def collect_metrics():
+    """Collect node and VM rrddata into the metrics store"""
+    
+    db = task_runtime.session()
+    
+    try:
+        servers = (await db.execute(
+            select(Server).where(Server.is_active == True)
+        )).scalars().all()
+        
+        vms = (await db.execute(
+            select(VM.server_id, VM.node_name, VM.proxmox_vm_id)
+            .where(VM.proxmox_vm_id.isnot(None))
+            .where(VM.state.in_([VMState.RUNNING, VMState.SUSPENDED]))
+        )).all()
+        
+        samples_by_key = await TimeSeriesService.fetch_samples(
+            servers, vms, concurrency=settings.METRICS_COLLECT_CONCURRENCY
+        )
+        
+        written = await db.run_sync(TimeSeriesService.write_samples, samples_by_key)
+        await db.run_sync(TimeSeriesService.prune)
+        ensure_lease()
+        await db.commit()
+        
+        logger.info(f"Collected {written} metric samples from {len(samples_by_key)} resources")
+        
+        return {
+            "status": "success",
+            "resources": len(samples_by_key),
+            "samples_written": written
+        }
+    
+    except Exception as e:
+        logger.error(f"Error collecting metrics: {e}")
+        await db.rollback()
         return {
             "status": "error",
             "error": str(e)
         }
     
     finally:
-        db.close()
+        await db.close()
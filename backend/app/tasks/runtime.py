@@ -0,0 +1,127 @@
+"""
+Async runtime for Celery task bodies
+
+Each worker process gets one event loop, started lazily on a daemon thread
+and kept for the life of the process, with a shared async engine and pooled
+Proxmox clients bound to it. Task bodies written as `async def` run on it via
+@async_task:
+
+    @celery_app.task(name="app.tasks.monitoring.reconcile_vm_states")
+    @singleton()
+    @async_task
+    async def reconcile_vm_states():
+        async with task_runtime.session() as db:
+            ...
+
+Background work started by one task (Proxmox UPID pollers, coalesced reads)
+keeps running between tasks instead of dying with a per-task asyncio.run().
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from typing import Any, Callable, Coroutine, Optional
+
+from celery.signals import worker_process_shutdown, worker_shutdown
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+
+from app.core import database
+from app.core.cache_bus import cache_bus
+from app.core.logging import logger
+from app.services.proxmox import proxmox_clients
+
+
+class AsyncTaskRuntime:
+    """The worker process's persistent event loop and the resources bound to it"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._engine: Optional[AsyncEngine] = None
+        self._sessionmaker: Optional[async_sessionmaker] = None
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            # A forked pool child inherits the parent's object but not its thread
+            if self._loop is None or self._pid != os.getpid():
+                self._start()
+            return self._loop
+
+    def _start(self) -> None:
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, name="celery-async-runtime", daemon=True)
+        thread.start()
+        if self._pid is not None:
+            # Pooled connections belong to the parent process
+            self._engine = None
+            self._sessionmaker = None
+        self._loop, self._thread, self._pid = loop, thread, os.getpid()
+        proxmox_clients.bind(loop)
+
+    def session(self) -> AsyncSession:
+        """New session from the runtime's shared async engine"""
+        if self._sessionmaker is None:
+            self._engine = create_async_engine(database.ASYNC_DATABASE_URL, pool_pre_ping=True)
+            self._sessionmaker = async_sessionmaker(self._engine, class_=AsyncSession, expire_on_commit=False)
+        return self._sessionmaker()
+
+    def run(self, coro: Coroutine[Any, Any, Any]) -> Any:
+        """Run a coroutine on the runtime loop and block until it finishes"""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result()
+        except BaseException:
+            # Soft time limit or worker shutdown: don't leave the body running
+            future.cancel()
+            raise
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                return
+            loop, thread = self._loop, self._thread
+            self._loop = None
+
+        try:
+            asyncio.run_coroutine_threadsafe(self._aclose(), loop).result(timeout=10)
+        except Exception as e:
+            logger.warning(f"Async task runtime did not close cleanly: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        loop.close()
+
+    async def _aclose(self) -> None:
+        await proxmox_clients.aclose()
+        await cache_bus.stop()
+        if self._engine is not None:
+            await self._engine.dispose()
+
+
+task_runtime = AsyncTaskRuntime()
+
+
+def async_task(func: Callable[..., Coroutine[Any, Any, Any]]) -> Callable[..., Any]:
+    """Run an async def task body on the worker's shared event loop"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        context = contextvars.copy_context()
+
+        async def body():
+            # Runtime tasks start from the loop thread's context: carry the
+            # caller's over (e.g. the @singleton lease checked by ensure_lease)
+            for var, value in context.items():
+                var.set(value)
+            return await func(*args, **kwargs)
+
+        return task_runtime.run(body())
+    return wrapper
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def _shutdown_runtime(**kwargs):
+    task_runtime.shutdown()
@@ -0,0 +1,84 @@
+"""
+API load benchmarks (run explicitly):
+
+    pytest app/tests/benchmarks/bench_api.py -p no:cacheprovider
+
+Results are merged into BENCH_OUTPUT; set BENCH_BASELINE to gate regressions.
+"""
+import os
+import pytest
+
+from app.tests.benchmarks.loadgen import run_load, record, check_regression
+
+
+BENCH_REQUESTS = int(os.environ.get("BENCH_REQUESTS", "500"))
+BENCH_CONCURRENCY = int(os.environ.get("BENCH_CONCURRENCY", "20"))
+
+
+def auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.mark.asyncio
+async def test_list_vms_load(bench_env, api_client):
+    """GET /vms for random users"""
+    tokens = bench_env.tokens
+    
+    async def request(i: int) -> bool:
+        response = await api_client.get("/api/v1/vms", headers=auth(tokens[i % len(tokens)]))
+        return response.status_code == 200
+    
+    async with api_client:
+        result = await run_load("api.list_vms", request, BENCH_REQUESTS, BENCH_CONCURRENCY)
+    
+    record(result)
+    assert result.errors == 0
+    check_regression(result)
+
+
+@pytest.mark.asyncio
+async def test_vm_action_load(bench_env, api_client):
+    """POST /vms/{id}/action alternating stop/start"""
+    tokens = bench_env.tokens
+    vm_ids = bench_env.vm_ids_by_user
+    
+    async def request(i: int) -> bool:
+        user_index = i % len(tokens)
+        user_vms = vm_ids[user_index]
+        vm_id = user_vms[(i // len(tokens)) % len(user_vms)]
+        # Each VM sees stop, then start on its next turn
+        action = "stop" if (i // (len(tokens) * len(user_vms))) % 2 == 0 else "start"
+        response = await api_client.post(
+            f"/api/v1/vms/{vm_id}/action",
+            json={"action": action},
+            headers=auth(tokens[user_index])
+        )
+        return response.status_code == 200
+    
+    async with api_client:
+        result = await run_load("api.vm_action", request, BENCH_REQUESTS, BENCH_CONCURRENCY)
+    
+    record(result)
+    assert result.errors == 0
+    check_regression(result)
+
+
+@pytest.mark.asyncio
+async def test_create_vm_load(bench_env, api_client):
+    """POST /vms"""
+    tokens = bench_env.tokens
+    
+    async def request(i: int) -> bool:
+        response = await api_client.post(
+            "/api/v1/vms",
+            json={"template_id": bench_env.template_id, "name": f"load-{i}"},
+            headers=auth(tokens[i % len(tokens)])
+        )
+        return response.status_code == 201
+    
+    async with api_client:
+        result = await run_load("api.create_vm", request, BENCH_REQUESTS, BENCH_CONCURRENCY)
+    
+    record(result)
+    assert result.errors == 0
+    check_regression(result)
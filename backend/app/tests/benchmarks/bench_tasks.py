@@ -0,0 +1,56 @@
+"""
+Celery task benchmarks, run in-process (run explicitly):
+
+    pytest app/tests/benchmarks/bench_tasks.py -p no:cacheprovider
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from app.models.vm import VM, VMState
+from app.models.usage import UsageSegment
+from app.tasks.billing import process_vm_billing
+from app.tasks.monitoring import reconcile_vm_states
+from app.tests.benchmarks.loadgen import summarize, record, check_regression
+
+
+def record_benchmark(name: str, benchmark, items: int) -> None:
+    """Convert pytest-benchmark round times into a LoadResult"""
+    rounds = list(benchmark.stats.stats.data)
+    result = summarize(name, rounds, errors=0, concurrency=1, duration=sum(rounds))
+    result.extra["items_per_second"] = items / benchmark.stats.stats.median
+    record(result)
+    check_regression(result)
+
+
+def test_billing_cycle(benchmark, bench_env):
+    """process_vm_billing over an open usage segment per seeded VM"""
+    
+    def setup():
+        with bench_env.sync_session() as db:
+            db.execute(update(UsageSegment).values(billed_until=datetime.utcnow() - timedelta(hours=1)))
+            db.commit()
+    
+    result = benchmark.pedantic(process_vm_billing, setup=setup, rounds=5)
+    
+    assert result["status"] == "success"
+    assert result["vms_billed"] == bench_env.vm_count
+    record_benchmark("tasks.billing_cycle", benchmark, bench_env.vm_count)
+
+
+def test_reconcile_vm_states(benchmark, bench_env):
+    """reconcile_vm_states against the simulator with 10% drift"""
+    vms = list(bench_env.simulator.vms.values())
+    
+    def setup():
+        with bench_env.sync_session() as db:
+            db.execute(update(VM).values(state=VMState.RUNNING))
+            db.commit()
+        for i, vm in enumerate(vms):
+            vm["status"] = "stopped" if i % 10 == 0 else "running"
+    
+    result = benchmark.pedantic(reconcile_vm_states, setup=setup, rounds=5)
+    
+    assert result["status"] == "success"
+    assert result["vms_updated"] == len(vms[::10])
+    record_benchmark("tasks.reconcile_vm_states", benchmark, bench_env.vm_count)
@@ -0,0 +1,208 @@
+"""
+Benchmark fixtures: a seeded SQLite database, the Proxmox simulator and an
+in-process API client
+
+Sizes come from the environment:
+    BENCH_USERS, BENCH_VMS_PER_USER, BENCH_PROXMOX_LATENCY
+"""
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from decimal import Decimal
+from functools import partial
+from typing import List
+
+import httpx
+import pytest
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+import app.models  # noqa: F401 - register all tables
+from app.main import app
+from app.core.database import Base, get_async_db
+from app.core.encryption import encryption
+from app.core.events import event_publisher
+from app.core.security import get_password_hash, create_access_token
+from app.models.user import User, UserRole, UserStatus
+from app.models.server import Server, ServerStatus
+from app.models.template import VMTemplate
+from app.models.vm import VM, VMState
+from app.models.usage import UsageSegment
+from app.services.exhaustion import exhaustion_scheduler
+from app.services.proxmox import ProxmoxService
+from app.tasks.runtime import task_runtime
+from app.tests.proxmox_simulator import ProxmoxSimulator
+
+
+BENCH_USERS = int(os.environ.get("BENCH_USERS", "50"))
+BENCH_VMS_PER_USER = int(os.environ.get("BENCH_VMS_PER_USER", "20"))
+BENCH_PROXMOX_LATENCY = float(os.environ.get("BENCH_PROXMOX_LATENCY", "0.005"))
+
+
+@dataclass
+class BenchEnv:
+    """Handles on the seeded benchmark environment"""
+    sync_session: sessionmaker
+    async_session: async_sessionmaker
+    simulator: ProxmoxSimulator
+    user_ids: List[int]
+    tokens: List[str]
+    vm_ids_by_user: List[List[int]]
+    template_id: int
+
+    @property
+    def vm_count(self) -> int:
+        return sum(len(vm_ids) for vm_ids in self.vm_ids_by_user)
+
+
+def seed_benchmark_data(db, simulator: ProxmoxSimulator, users: int, vms_per_user: int) -> dict:
+    """Seed users, a template, a server and VMs (mirrors app/scripts/seed_db.py)"""
+
+    template = VMTemplate(
+        name="Ubuntu 22.04 - Small",
+        cpu_cores=2,
+        ram_mb=2048,
+        disk_gb=20,
+        os_type="linux",
+        os_name="Ubuntu 22.04 LTS",
+        cost_per_hour=Decimal("0.05"),
+        is_public=True,
+        is_active=True
+    )
+    server = Server(
+        name="pve-sim",
+        api_url="https://pve-sim:8006",
+        api_token_encrypted=encryption.encrypt("root@pam!bench=secret"),
+        status=ServerStatus.ONLINE,
+        is_active=True,
+        allow_vm_creation=True
+    )
+    db.add_all([template, server])
+    db.flush()
+
+    # Hash once; bcrypt would dominate seeding time
+    password_hash = get_password_hash("password123")
+    db.execute(insert(User), [
+        {
+            "email": f"bench{i}@example.com",
+            "password_hash": password_hash,
+            "role": UserRole.USER,
+            "status": UserStatus.ACTIVE,
+            "balance": Decimal("100000.00"),
+        }
+        for i in range(users)
+    ])
+    user_ids = [row[0] for row in db.execute(User.__table__.select().with_only_columns(User.id).order_by(User.id))]
+
+    last_billed = datetime.utcnow() - timedelta(hours=1)
+    vm_rows = []
+    for user_index, user_id in enumerate(user_ids):
+        for i in range(vms_per_user):
+            vm = simulator.add_vm(name=f"bench-{user_index}-{i}", status="running")
+            vm_rows.append({
+                "user_id": user_id,
+                "template_id": template.id,
+                "server_id": server.id,
+                "proxmox_vm_id": vm["vmid"],
+                "node_name": vm["node"],
+                "name": vm["name"],
+                "cpu_cores": 2,
+                "ram_mb": 2048,
+                "disk_gb": 20,
+                "state": VMState.RUNNING,
+                "last_billed_at": last_billed,
+                "total_cost": 0,
+            })
+    db.execute(insert(VM), vm_rows)
+
+    vm_ids_by_user = {user_id: [] for user_id in user_ids}
+    for vm_id, user_id in db.execute(VM.__table__.select().with_only_columns(VM.id, VM.user_id)):
+        vm_ids_by_user[user_id].append(vm_id)
+
+    # Every running VM has an open usage segment
+    db.execute(insert(UsageSegment), [
+        {
+            "vm_id": vm_id,
+            "user_id": user_id,
+            "rate": template.cost_per_hour,
+            "started_at": last_billed,
+            "billed_until": last_billed,
+        }
+        for user_id, vm_ids in vm_ids_by_user.items()
+        for vm_id in vm_ids
+    ])
+    db.commit()
+
+    return {
+        "template_id": template.id,
+        "user_ids": user_ids,
+        "vm_ids_by_user": [vm_ids_by_user[user_id] for user_id in user_ids],
+    }
+
+
+@pytest.fixture
+def bench_env(tmp_path, monkeypatch) -> BenchEnv:
+    """Seeded database shared by the API and Celery tasks"""
+    path = tmp_path / "bench.db"
+
+    sync_engine = create_engine(f"sqlite:///{path}", poolclass=NullPool)
+    Base.metadata.create_all(sync_engine)
+    SyncSession = sessionmaker(bind=sync_engine, autocommit=False, autoflush=False)
+
+    # SQLite serializes writers; wait for the lock instead of failing under load
+    async_engine = create_async_engine(
+        f"sqlite+aiosqlite:///{path}", poolclass=NullPool, connect_args={"timeout": 30}
+    )
+    AsyncSessionBench = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+    simulator = ProxmoxSimulator(nodes=3, latency=BENCH_PROXMOX_LATENCY)
+
+    with SyncSession() as db:
+        seeded = seed_benchmark_data(db, simulator, BENCH_USERS, BENCH_VMS_PER_USER)
+
+    # Celery tasks run in-process against the benchmark database
+    monkeypatch.setattr("app.tasks.billing.SessionLocal", SyncSession)
+    monkeypatch.setattr(task_runtime, "_sessionmaker", AsyncSessionBench)
+
+    # Every ProxmoxService talks to the simulator
+    simulated = partial(ProxmoxService, transport=simulator.transport())
+    monkeypatch.setattr("app.services.reconciliation.ProxmoxService", simulated)
+    monkeypatch.setattr("app.services.timeseries.ProxmoxService", simulated)
+    monkeypatch.setattr("app.services.vm_bulk.ProxmoxService", simulated)
+
+    # Redis is not part of the benchmark
+    monkeypatch.setattr(event_publisher, "publish", lambda *args, **kwargs: None)
+
+    async def noop_async(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr(event_publisher, "publish_async", noop_async)
+    monkeypatch.setattr(exhaustion_scheduler, "update", lambda *args, **kwargs: None)
+    monkeypatch.setattr(exhaustion_scheduler, "update_async", noop_async)
+
+    async def override_get_db():
+        async with AsyncSessionBench() as session:
+            yield session
+
+    app.dependency_overrides[get_async_db] = override_get_db
+
+    yield BenchEnv(
+        sync_session=SyncSession,
+        async_session=AsyncSessionBench,
+        simulator=simulator,
+        user_ids=seeded["user_ids"],
+        tokens=[create_access_token({"sub": str(user_id)}) for user_id in seeded["user_ids"]],
+        vm_ids_by_user=seeded["vm_ids_by_user"],
+        template_id=seeded["template_id"]
+    )
+
+    app.dependency_overrides.clear()
+    sync_engine.dispose()
+
+
+@pytest.fixture
+def api_client() -> httpx.AsyncClient:
+    """In-process HTTP client for the FastAPI app"""
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
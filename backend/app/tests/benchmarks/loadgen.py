@@ -0,0 +1,132 @@
+"""
+Async load generator and result recording for the benchmark suite
+"""
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import time
+from dataclasses import dataclass, asdict, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+
+@dataclass
+class LoadResult:
+    """Latency percentiles and throughput of one scenario"""
+    name: str
+    requests: int
+    errors: int
+    concurrency: int
+    duration_seconds: float
+    throughput_rps: float
+    p50_ms: float
+    p99_ms: float
+    mean_ms: float
+    extra: Dict[str, float] = field(default_factory=dict)
+
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(percent / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(name: str, latencies: List[float], errors: int, concurrency: int, duration: float) -> LoadResult:
+    """Build a LoadResult from per-request latencies in seconds"""
+    ordered = sorted(latencies)
+    total = len(latencies)
+    return LoadResult(
+        name=name,
+        requests=total,
+        errors=errors,
+        concurrency=concurrency,
+        duration_seconds=duration,
+        throughput_rps=total / duration if duration > 0 else 0.0,
+        p50_ms=_percentile(ordered, 50) * 1000,
+        p99_ms=_percentile(ordered, 99) * 1000,
+        mean_ms=(statistics.fmean(ordered) * 1000) if ordered else 0.0,
+    )
+
+
+async def run_load(
+    name: str,
+    request: Callable[[int], Awaitable[bool]],
+    total_requests: int,
+    concurrency: int
+) -> LoadResult:
+    """
+    Run request(i) total_requests times with a fixed number of workers
+
+    request returns True on success. Exceptions count as errors.
+    """
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(total_requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                ok = await request(i)
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            if not ok:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(name, latencies, errors, concurrency, time.perf_counter() - start)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+def record(result: LoadResult, path: Optional[str] = None) -> None:
+    """Merge a result into the JSON results file (BENCH_OUTPUT)"""
+    path = path or os.environ.get("BENCH_OUTPUT", "bench_results.json")
+
+    data = {"commit": None, "results": {}}
+    if os.path.exists(path):
+        with open(path) as f:
+            data = json.load(f)
+
+    data["commit"] = _git_commit()
+    data["results"][result.name] = asdict(result)
+
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+def check_regression(result: LoadResult, baseline_path: Optional[str] = None) -> None:
+    """
+    Fail if a result regressed against a baseline file (BENCH_BASELINE)
+
+    Throughput may drop and p99 may grow by at most BENCH_TOLERANCE (default 20%).
+    """
+    baseline_path = baseline_path or os.environ.get("BENCH_BASELINE")
+    if not baseline_path or not os.path.exists(baseline_path):
+        return
+
+    with open(baseline_path) as f:
+        baseline = json.load(f).get("results", {}).get(result.name)
+    if not baseline:
+        return
+
+    tolerance = float(os.environ.get("BENCH_TOLERANCE", "0.2"))
+    assert result.throughput_rps >= baseline["throughput_rps"] * (1 - tolerance), (
+        f"{result.name}: throughput {result.throughput_rps:.1f} rps regressed "
+        f"from {baseline['throughput_rps']:.1f} rps"
+    )
+    assert result.p99_ms <= baseline["p99_ms"] * (1 + tolerance), (
+        f"{result.name}: p99 {result.p99_ms:.1f} ms regressed from {baseline['p99_ms']:.1f} ms"
+    )
@@ -1,14 +1,32 @@
 import pytest
 import asyncio
+import fakeredis
+import fakeredis.aioredis
+from decimal import Decimal
+from functools import partial
+from types import SimpleNamespace
 from typing import Generator, AsyncGenerator
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 
 from app.main import app
 from app.core.database import Base, get_async_db
 from app.core.config import settings
+from app.core.encryption import encryption
+from app.core.security import create_access_token
+from app.core.events import event_publisher
+from app.core.idempotency import idempotency_store
+from app.core import locks, revocation
+from app.models.server import Server
+from app.models.template import VMTemplate
+from app.models.user import User, UserRole, UserStatus
+from app.models.vm import VM, VMState
+from app.services.exhaustion import exhaustion_scheduler
+from app.services.proxmox import ProxmoxService, proxmox_reads
+from app.tests.proxmox_simulator import ProxmoxSimulator
 
 # Test database URL
 TEST_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
@@ -28,6 +46,30 @@ def event_loop():
     loop.close()
 
 
+@pytest.fixture(autouse=True)
+def no_proxmox_rate_limit(monkeypatch):
+    """Simulated clusters answer instantly; scheduler tests turn the limit back on"""
+    monkeypatch.setattr(settings, "PROXMOX_RATE_LIMIT_PER_SECOND", 0)
+
+
+@pytest.fixture(autouse=True)
+def clear_proxmox_reads():
+    """Simulators reuse one API URL, so cached reads must not leak between tests"""
+    proxmox_reads.clear()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def token_revocations(monkeypatch):
+    """User IDs restart at 1 in every test: revocations must not carry over"""
+    server = fakeredis.FakeServer()
+    client = fakeredis.aioredis.FakeRedis(server=server)
+    monkeypatch.setattr(revocation.token_revocations, "_client", lambda: client)
+    monkeypatch.setattr(revocation.token_revocations, "_sync_client", fakeredis.FakeRedis(server=server))
+    revocation.token_revocations.reset()
+    yield revocation.token_revocations
+
+
 @pytest.fixture(scope="function")
 async def db_session() -> AsyncGenerator[AsyncSession, None]:
     """Create test database session"""
@@ -54,3 +96,110 @@ def client(db_session: AsyncSession) -> Generator:
         yield test_client
     
     app.dependency_overrides.clear()
+
+
+@pytest.fixture(scope="function")
+def sync_db(monkeypatch) -> Generator:
+    """In-memory database for Celery tasks (replaces their SessionLocal)"""
+    engine = create_engine(
+        "sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False}
+    )
+    Base.metadata.create_all(engine)
+    SyncSession = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+    
+    monkeypatch.setattr("app.tasks.billing.SessionLocal", SyncSession)
+    monkeypatch.setattr(event_publisher, "publish", lambda *args, **kwargs: None)
+    
+    yield SyncSession
+    
+    engine.dispose()
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """One fake Redis behind locks, idempotency keys and the exhaustion schedule"""
+    server = fakeredis.FakeServer()
+    client = fakeredis.FakeRedis(server=server)
+    monkeypatch.setattr(locks, "get_redis", lambda: client)
+    monkeypatch.setattr(idempotency_store, "_client", fakeredis.aioredis.FakeRedis(server=server))
+    monkeypatch.setattr(exhaustion_scheduler, "_sync_client", client)
+    return client
+
+
+@pytest.fixture
+def simulator(monkeypatch):
+    """Simulated Proxmox cluster behind VMBulkService"""
+    simulator = ProxmoxSimulator(nodes=1)
+    monkeypatch.setattr(settings, "PROXMOX_TASK_POLL_INITIAL_SECONDS", 0.01)
+    monkeypatch.setattr(
+        "app.services.vm_bulk.ProxmoxService", partial(ProxmoxService, transport=simulator.transport())
+    )
+
+    async def noop_async(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr(event_publisher, "publish_async", noop_async)
+    monkeypatch.setattr(exhaustion_scheduler, "update_async", noop_async)
+    return simulator
+
+
+@pytest.fixture
+def make_user():
+    """Build an active user (not added to the session)"""
+    def make(email="u@example.com", balance="10.00", role=UserRole.USER, **fields):
+        return User(email=email, password_hash="x", role=role, status=UserStatus.ACTIVE,
+                    balance=Decimal(balance), **fields)
+    return make
+
+
+@pytest.fixture
+def make_template():
+    """Build a VM template (not added to the session)"""
+    def make(name="small", cost_per_hour="1.00", cpu_cores=1, ram_mb=512, disk_gb=10):
+        return VMTemplate(name=name, cpu_cores=cpu_cores, ram_mb=ram_mb, disk_gb=disk_gb, os_type="linux",
+                          os_name="Linux", cost_per_hour=Decimal(cost_per_hour))
+    return make
+
+
+@pytest.fixture
+def make_server():
+    """Build a server the simulator answers for (not added to the session)"""
+    def make(name="pve", api_url="https://pve.example.com:8006"):
+        return Server(name=name, api_url=api_url, api_token_encrypted=encryption.encrypt("root@pam!test=secret"))
+    return make
+
+
+@pytest.fixture
+def make_vm():
+    """Build a VM sized like its template; user, template and server must be flushed"""
+    def make(user, template, server, state=VMState.STOPPED, name="vm", node_name="pve1", **fields):
+        return VM(user_id=user.id, template_id=template.id, server_id=server.id, node_name=node_name,
+                  name=name, cpu_cores=template.cpu_cores, ram_mb=template.ram_mb, disk_gb=template.disk_gb,
+                  state=state, total_cost=0, **fields)
+    return make
+
+
+@pytest.fixture
+async def owned_vms(db_session, simulator, make_user, make_template, make_server, make_vm):
+    """An owner with four VMs (ci-1..3, web) and another user's VM, all on the simulator"""
+    owner = make_user("owner@example.com")
+    other = make_user("other@example.com")
+    template, server = make_template(), make_server()
+    db_session.add_all([owner, other, template, server])
+    await db_session.flush()
+
+    def vm(user, name, state):
+        proxmox = simulator.add_vm(node="pve1", status="stopped")
+        return make_vm(user, template, server, state, name=name, proxmox_vm_id=proxmox["vmid"])
+
+    vms = [
+        vm(owner, "ci-1", VMState.STOPPED),
+        vm(owner, "ci-2", VMState.STOPPED),
+        vm(owner, "ci-3", VMState.RUNNING),
+        vm(owner, "web", VMState.STOPPED),
+        vm(other, "ci-theirs", VMState.STOPPED),
+    ]
+    db_session.add_all(vms)
+    await db_session.commit()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': str(owner.id)})}"}
+    return headers, [SimpleNamespace(id=vm.id, proxmox_vm_id=vm.proxmox_vm_id) for vm in vms]
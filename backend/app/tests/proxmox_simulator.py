@@ -0,0 +1,377 @@
+"""
+Proxmox VE API simulator for tests, load tests and benchmarks
+
+Implements the subset of api2/json used by ProxmoxService. Use it in-process
+through an httpx transport:
+
+    simulator = ProxmoxSimulator(latency=0.02, error_rate=0.01)
+    simulator.seed_vms(5000)
+    proxmox = ProxmoxService(..., transport=simulator.transport())
+
+or out-of-process as an ASGI app:
+
+    uvicorn app.tests.proxmox_simulator:app --port 8006
+"""
+import asyncio
+import os
+import random
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+import httpx
+
+
+ROUTES: List[Tuple[str, re.Pattern, str]] = [
+    ("GET", re.compile(r"^version$"), "version"),
+    ("GET", re.compile(r"^nodes$"), "nodes"),
+    ("GET", re.compile(r"^cluster/nextid$"), "nextid"),
+    ("GET", re.compile(r"^cluster/resources$"), "resources"),
+    ("GET", re.compile(r"^nodes/(?P<node>[^/]+)/rrddata$"), "node_rrddata"),
+    ("GET", re.compile(r"^nodes/(?P<node>[^/]+)/tasks$"), "tasks"),
+    ("GET", re.compile(r"^nodes/(?P<node>[^/]+)/tasks/(?P<upid>[^/]+)/status$"), "task_status"),
+    ("POST", re.compile(r"^nodes/(?P<node>[^/]+)/qemu$"), "create"),
+    ("POST", re.compile(r"^nodes/(?P<node>[^/]+)/qemu/(?P<vmid>\d+)/clone$"), "clone"),
+    ("GET", re.compile(r"^nodes/(?P<node>[^/]+)/qemu/(?P<vmid>\d+)/status/current$"), "status"),
+    ("POST", re.compile(r"^nodes/(?P<node>[^/]+)/qemu/(?P<vmid>\d+)/status/(?P<action>\w+)$"), "action"),
+    ("GET", re.compile(r"^nodes/(?P<node>[^/]+)/qemu/(?P<vmid>\d+)/rrddata$"), "vm_rrddata"),
+    ("PUT", re.compile(r"^nodes/(?P<node>[^/]+)/qemu/(?P<vmid>\d+)/config$"), "config"),
+    ("DELETE", re.compile(r"^nodes/(?P<node>[^/]+)/qemu/(?P<vmid>\d+)$"), "delete"),
+]
+
+ACTION_STATES = {
+    "start": "running",
+    "stop": "stopped",
+    "shutdown": "stopped",
+    "reboot": "running",
+    "reset": "running",
+    "suspend": "paused",
+    "resume": "running",
+}
+
+
+class SimulatorError(Exception):
+    """Error returned to the client as a Proxmox-style error response"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+class ProxmoxSimulator:
+    """In-memory Proxmox cluster with configurable latency and error injection"""
+
+    def __init__(
+        self,
+        nodes: int = 3,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        task_duration: float = 0.0,
+        seed: Optional[int] = 0
+    ):
+        self.node_names = [f"pve{i + 1}" for i in range(nodes)]
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.task_duration = task_duration
+        self.random = random.Random(seed)
+
+        self.vms: Dict[int, Dict[str, Any]] = {}
+        self.tasks: Dict[str, Dict[str, Any]] = {}
+        self.next_vmid = 100
+        self.request_count = 0
+        self.requests_by_route: Dict[str, int] = {}
+        self._pid = 0
+
+    # ==================== Setup ====================
+
+    def add_vm(
+        self,
+        vmid: Optional[int] = None,
+        node: Optional[str] = None,
+        name: Optional[str] = None,
+        status: str = "running",
+        cores: int = 1,
+        memory: int = 1024,
+        template: bool = False
+    ) -> Dict[str, Any]:
+        """Add a VM (or template) to the cluster"""
+        if vmid is None:
+            vmid = self.next_vmid
+        self.next_vmid = max(self.next_vmid, vmid + 1)
+
+        vm = {
+            "vmid": vmid,
+            "node": node or self.node_names[vmid % len(self.node_names)],
+            "name": name or f"vm-{vmid}",
+            "status": status,
+            "cores": cores,
+            "memory": memory,
+            "template": 1 if template else 0,
+        }
+        self.vms[vmid] = vm
+        return vm
+
+    def seed_vms(self, count: int, status: str = "running") -> List[int]:
+        """Add count VMs spread round-robin over the nodes"""
+        return [self.add_vm(status=status)["vmid"] for _ in range(count)]
+
+    # ==================== Transports ====================
+
+    def transport(self) -> httpx.MockTransport:
+        """httpx transport serving requests from this simulator in-process"""
+        return httpx.MockTransport(self.handle_httpx)
+
+    async def handle_httpx(self, request: httpx.Request) -> httpx.Response:
+        form = dict(parse_qsl(request.content.decode())) if request.content else {}
+        status_code, body = await self.dispatch(
+            request.method,
+            request.url.path,
+            dict(request.url.params),
+            form
+        )
+        return httpx.Response(status_code, json=body)
+
+    # ==================== Dispatch ====================
+
+    async def dispatch(
+        self,
+        method: str,
+        path: str,
+        params: Dict[str, str],
+        form: Dict[str, str]
+    ) -> Tuple[int, Dict[str, Any]]:
+        """Route an api2/json request and return (status, body)"""
+        self.request_count += 1
+
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + self.random.uniform(0, self.jitter))
+
+        path = path.split("/api2/json/", 1)[-1].strip("/")
+
+        for route_method, pattern, handler_name in ROUTES:
+            if route_method != method:
+                continue
+            match = pattern.match(path)
+            if not match:
+                continue
+
+            self.requests_by_route[handler_name] = self.requests_by_route.get(handler_name, 0) + 1
+
+            if self.error_rate and self.random.random() < self.error_rate:
+                return self.error_status, {"data": None, "errors": {"simulator": "injected error"}}
+
+            try:
+                handler = getattr(self, f"_handle_{handler_name}")
+                return 200, {"data": handler(params=params, form=form, **match.groupdict())}
+            except SimulatorError as e:
+                return e.status_code, {"data": None, "message": e.message}
+
+        return 501, {"data": None, "message": f"Method '{method} /{path}' not implemented"}
+
+    def _get_vm(self, node: str, vmid: str) -> Dict[str, Any]:
+        vm = self.vms.get(int(vmid))
+        if vm is None or vm["node"] != node:
+            raise SimulatorError(500, f"Configuration file 'nodes/{node}/qemu-server/{vmid}.conf' does not exist")
+        return vm
+
+    def _new_task(self, node: str, task_type: str, vmid: Any) -> str:
+        self._pid += 1
+        started = int(time.time())
+        upid = f"UPID:{node}:{self._pid:08X}:00000000:{started:08X}:{task_type}:{vmid}:root@pam:"
+        self.tasks[upid] = {"node": node, "started": time.monotonic(), "type": task_type}
+        return upid
+
+    # ==================== Handlers ====================
+
+    def _handle_version(self, **kwargs) -> Dict[str, Any]:
+        return {"version": "8.1.4", "release": "8.1", "repoid": "simulator"}
+
+    def _handle_nodes(self, **kwargs) -> List[Dict[str, Any]]:
+        nodes = []
+        for name in self.node_names:
+            vms = [vm for vm in self.vms.values() if vm["node"] == name and vm["status"] == "running"]
+            nodes.append({
+                "node": name,
+                "status": "online",
+                "cpu": min(1.0, 0.01 * len(vms)),
+                "maxcpu": 64,
+                "mem": sum(vm["memory"] for vm in vms) * 1024 * 1024,
+                "maxmem": 512 * 1024 ** 3,
+                "uptime": 86400,
+            })
+        return nodes
+
+    def _handle_nextid(self, **kwargs) -> str:
+        return str(self.next_vmid)
+
+    def _handle_resources(self, params: Dict[str, str], **kwargs) -> List[Dict[str, Any]]:
+        if params.get("type") not in (None, "vm"):
+            return []
+        return [
+            {
+                "id": f"qemu/{vm['vmid']}",
+                "type": "qemu",
+                "vmid": vm["vmid"],
+                "node": vm["node"],
+                "name": vm["name"],
+                "status": vm["status"],
+                "maxcpu": vm["cores"],
+                "maxmem": vm["memory"] * 1024 * 1024,
+                "template": vm["template"],
+            }
+            for vm in self.vms.values()
+        ]
+
+    def _rrd_points(self, timeframe: str) -> List[Dict[str, Any]]:
+        step = 60 if timeframe == "hour" else 1800
+        now = int(time.time()) // step * step
+        return [
+            {
+                "time": now - step * i,
+                "cpu": self.random.random(),
+                "mem": self.random.randint(1, 1024) * 1024 * 1024,
+                "maxmem": 1024 * 1024 * 1024,
+                "netin": self.random.random() * 1000,
+                "netout": self.random.random() * 1000,
+                "diskread": self.random.random() * 1000,
+                "diskwrite": self.random.random() * 1000,
+            }
+            for i in range(70, 0, -1)
+        ]
+
+    def _handle_node_rrddata(self, node: str, params: Dict[str, str], **kwargs) -> List[Dict[str, Any]]:
+        if node not in self.node_names:
+            raise SimulatorError(500, f"hostname lookup '{node}' failed")
+        return self._rrd_points(params.get("timeframe", "hour"))
+
+    def _handle_vm_rrddata(self, node: str, vmid: str, params: Dict[str, str], **kwargs) -> List[Dict[str, Any]]:
+        self._get_vm(node, vmid)
+        return self._rrd_points(params.get("timeframe", "hour"))
+
+    def _task_running(self, task: Dict[str, Any]) -> bool:
+        return time.monotonic() - task["started"] < self.task_duration
+
+    def _handle_tasks(self, node: str, params: Dict[str, str], **kwargs) -> List[Dict[str, Any]]:
+        active_only = params.get("source", "archive") == "active"
+        return [
+            {"upid": upid, "node": node, "type": task["type"]}
+            for upid, task in self.tasks.items()
+            if task["node"] == node and (self._task_running(task) or not active_only)
+        ]
+
+    def _handle_task_status(self, node: str, upid: str, **kwargs) -> Dict[str, Any]:
+        task = self.tasks.get(upid)
+        if task is None:
+            raise SimulatorError(500, f"no such task '{upid}'")
+        if self._task_running(task):
+            return {"upid": upid, "node": node, "status": "running", "type": task["type"]}
+        return {
+            "upid": upid,
+            "node": node,
+            "status": "stopped",
+            "exitstatus": task.get("exitstatus", "OK"),
+            "type": task["type"]
+        }
+
+    def _handle_create(self, node: str, form: Dict[str, str], **kwargs) -> str:
+        vmid = int(form.get("vmid") or self.next_vmid)
+        if vmid in self.vms:
+            raise SimulatorError(500, f"VM {vmid} already exists")
+        self.add_vm(
+            vmid=vmid,
+            node=node,
+            name=form.get("name"),
+            status="stopped",
+            cores=int(form.get("cores", 1)),
+            memory=int(form.get("memory", 1024))
+        )
+        return self._new_task(node, "qmcreate", vmid)
+
+    def _handle_clone(self, node: str, vmid: str, form: Dict[str, str], **kwargs) -> str:
+        source = self._get_vm(node, vmid)
+        newid = int(form["newid"])
+        if newid in self.vms:
+            raise SimulatorError(500, f"VM {newid} already exists")
+        self.add_vm(
+            vmid=newid,
+            node=node,
+            name=form.get("name"),
+            status="stopped",
+            cores=source["cores"],
+            memory=source["memory"]
+        )
+        return self._new_task(node, "qmclone", vmid)
+
+    def _handle_status(self, node: str, vmid: str, **kwargs) -> Dict[str, Any]:
+        vm = self._get_vm(node, vmid)
+        return {
+            "vmid": vm["vmid"],
+            "name": vm["name"],
+            "status": "running" if vm["status"] == "paused" else vm["status"],
+            "qmpstatus": vm["status"],
+            "cpus": vm["cores"],
+            "maxmem": vm["memory"] * 1024 * 1024,
+        }
+
+    def _handle_action(self, node: str, vmid: str, action: str, **kwargs) -> str:
+        vm = self._get_vm(node, vmid)
+        if action not in ACTION_STATES:
+            raise SimulatorError(501, f"Method 'POST status/{action}' not implemented")
+        vm["status"] = ACTION_STATES[action]
+        return self._new_task(node, f"qm{action}", vmid)
+
+    def _handle_config(self, node: str, vmid: str, form: Dict[str, str], **kwargs) -> None:
+        vm = self._get_vm(node, vmid)
+        if "cores" in form:
+            vm["cores"] = int(form["cores"])
+        if "memory" in form:
+            vm["memory"] = int(form["memory"])
+        return None
+
+    def _handle_delete(self, node: str, vmid: str, **kwargs) -> str:
+        self._get_vm(node, vmid)
+        del self.vms[int(vmid)]
+        return self._new_task(node, "qmdestroy", vmid)
+
+
+def create_app(simulator: Optional[ProxmoxSimulator] = None):
+    """ASGI app serving the simulator over HTTP"""
+    from starlette.applications import Starlette
+    from starlette.requests import Request
+    from starlette.responses import JSONResponse
+    from starlette.routing import Route
+
+    simulator = simulator or ProxmoxSimulator(
+        latency=float(os.environ.get("SIM_LATENCY", "0")),
+        jitter=float(os.environ.get("SIM_JITTER", "0")),
+        error_rate=float(os.environ.get("SIM_ERROR_RATE", "0")),
+    )
+    if not simulator.vms:
+        simulator.seed_vms(int(os.environ.get("SIM_VMS", "1000")))
+
+    async def endpoint(request: Request) -> JSONResponse:
+        form = dict(await request.form()) if request.method in ("POST", "PUT") else {}
+        status_code, body = await simulator.dispatch(
+            request.method,
+            request.url.path,
+            dict(request.query_params),
+            form
+        )
+        return JSONResponse(body, status_code=status_code)
+
+    return Starlette(routes=[
+        Route("/api2/json/{path:path}", endpoint, methods=["GET", "POST", "PUT", "DELETE"])
+    ])
+
+
+def __getattr__(name: str):
+    # Lazily build the module-level ASGI app for uvicorn
+    if name == "app":
+        return create_app()
+    raise AttributeError(name)
@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import select
+
+from app.core.security import create_access_token
+from app.models.user import UserRole
+from app.models.usage import UsageSegment, UsageDaily, ServerUsage
+from app.models.vm import VM, VMState
+from app.services.aggregates import AggregateService
+from app.services.usage import UsageService
+from app.tasks.billing import process_vm_billing
+
+
+@pytest.fixture
+def seed(make_user, make_template, make_server, make_vm):
+    """One user, template and server with a VM per state"""
+    def seed(db, states):
+        user = make_user(balance="100.00", role=UserRole.ADMIN)
+        template, server = make_template(cpu_cores=2, ram_mb=2048), make_server()
+        db.add_all([user, template, server])
+        db.flush()
+        vms = [make_vm(user, template, server, state, name=f"vm{i}") for i, state in enumerate(states)]
+        db.add_all(vms)
+        db.flush()
+        return user, template, server, vms
+    return seed
+
+
+def test_server_deltas_group_by_server():
+    """Test that deltas are summed per server with the given sign"""
+    vms = [
+        SimpleNamespace(server_id=1, cpu_cores=2, ram_mb=2048),
+        SimpleNamespace(server_id=1, cpu_cores=4, ram_mb=4096),
+        SimpleNamespace(server_id=2, cpu_cores=1, ram_mb=512),
+    ]
+    
+    deltas = AggregateService.server_deltas(vms, -1)
+    
+    assert deltas == [
+        {"b_server_id": 1, "b_vms": -2, "b_vcpus": -6, "b_ram_mb": -6144},
+        {"b_server_id": 2, "b_vms": -1, "b_vcpus": -1, "b_ram_mb": -512},
+    ]
+
+
+def test_rebuild_and_incremental_server_usage_agree(sync_db, seed):
+    """Test that incremental updates match a full recount"""
+    with sync_db() as db:
+        _, _, server, vms = seed(db, [VMState.RUNNING, VMState.SUSPENDED, VMState.STOPPED])
+        AggregateService.rebuild_server_usage(db)
+        
+        usage = db.get(ServerUsage, server.id)
+        assert (usage.active_vms, usage.vcpus, usage.ram_mb) == (2, 4, 4096)
+        
+        # Start the stopped VM
+        db.execute(AggregateService.server_usage_update(), AggregateService.server_deltas([vms[2]], 1))
+        db.expire_all()
+        usage = db.get(ServerUsage, server.id)
+        assert (usage.active_vms, usage.vcpus, usage.ram_mb) == (3, 6, 6144)
+
+
+def test_rebuild_updates_rows_in_place(sync_db, make_server, seed):
+    """Test that a recount repairs existing rows without deleting them and adds missing servers"""
+    with sync_db() as db:
+        _, _, server, _ = seed(db, [VMState.RUNNING])
+        other = make_server("pve2", "https://pve2.example.com:8006")
+        db.add_all([other, ServerUsage(server_id=server.id, active_vms=7, vcpus=70, ram_mb=7000)])
+        db.flush()
+        # Rows the recount locks and updates stay the same rows
+        drifted = db.get(ServerUsage, server.id)
+        
+        AggregateService.rebuild_server_usage(db)
+        db.expire_all()
+        
+        assert db.get(ServerUsage, server.id) is drifted
+        assert (drifted.active_vms, drifted.vcpus, drifted.ram_mb) == (1, 2, 2048)
+        added = db.get(ServerUsage, other.id)
+        assert (added.active_vms, added.vcpus, added.ram_mb) == (0, 0, 0)
+
+
+def test_billing_cycle_accumulates_daily_spend(sync_db, seed):
+    """Test that each billing cycle adds its charges to the day's row"""
+    now = datetime.utcnow()
+    
+    with sync_db() as db:
+        user, template, _, vms = seed(db, [VMState.RUNNING, VMState.RUNNING])
+        db.execute(UsageService.open_segments(
+            [(vm.id, user.id, Decimal("1.00")) for vm in vms], now - timedelta(hours=1)
+        ))
+        db.commit()
+        user_id, template_id = user.id, template.id
+    
+    assert process_vm_billing()["status"] == "success"
+    
+    with sync_db() as db:
+        # Charge another half hour on top
+        db.execute(
+            UsageService.close_segments([vm.id for vm in db.execute(select(VM)).scalars()], datetime.utcnow())
+        )
+        db.execute(
+            UsageSegment.__table__.update().values(billed_until=datetime.utcnow() - timedelta(minutes=30))
+        )
+        db.commit()
+    
+    assert process_vm_billing()["status"] == "success"
+    
+    with sync_db() as db:
+        row = db.execute(select(UsageDaily)).scalar_one()
+        assert (row.user_id, row.template_id) == (user_id, template_id)
+        assert float(row.amount) == pytest.approx(3.0, abs=0.01)
+        assert row.vm_hours == pytest.approx(3.0, abs=0.01)
+
+
+@pytest.mark.asyncio
+async def test_admin_usage_endpoints(client, db_session, make_user, make_template, make_server):
+    """Test that the admin usage endpoints read the rollups"""
+    user = make_user("admin@example.com", "0", UserRole.ADMIN)
+    template, server = make_template(cpu_cores=2, ram_mb=2048), make_server()
+    db_session.add_all([user, template, server])
+    await db_session.flush()
+    day = datetime.utcnow().date()
+    db_session.add_all([
+        UsageDaily(day=day, user_id=user.id, template_id=template.id, amount=Decimal("2.5"), vm_hours=2.5),
+        ServerUsage(server_id=server.id, active_vms=3, vcpus=6, ram_mb=6144),
+    ])
+    await db_session.commit()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}"}
+    
+    users = client.get("/api/v1/admin/usage/users", headers=headers).json()
+    templates = client.get("/api/v1/admin/usage/templates", headers=headers).json()
+    servers = client.get("/api/v1/admin/usage/servers", headers=headers).json()
+    
+    assert users[0]["email"] == "admin@example.com"
+    assert float(users[0]["amount"]) == 2.5
+    assert templates[0]["name"] == "small"
+    assert servers[0]["active_vms"] == 3
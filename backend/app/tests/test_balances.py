@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select, update
+
+from app.core.metrics import balance_drift_users
+from app.core.security import create_access_token
+from app.models.balance import BalanceSnapshot
+from app.models.transaction import Transaction, TransactionType
+from app.models.user import User, UserRole
+from app.services.usage import UsageService
+from app.tasks.billing import process_vm_billing, snapshot_balances
+
+
+def test_snapshots_flag_balance_changes_without_a_record(
+    sync_db, make_user, make_template, make_server, make_vm
+):
+    """Test that credits and billing replay cleanly while an unrecorded change is flagged"""
+    now = datetime.utcnow()
+    
+    with sync_db() as db:
+        credited, billed, tampered = (make_user(f"{name}@example.com") for name in "abc")
+        template, server = make_template(), make_server()
+        db.add_all([credited, billed, tampered, template, server])
+        db.flush()
+        vm = make_vm(billed, template, server)
+        db.add(vm)
+        db.flush()
+        db.execute(UsageService.open_segments([(vm.id, billed.id, Decimal("1.00"))], now - timedelta(hours=2)))
+        db.execute(UsageService.close_segments([vm.id], now))
+        db.commit()
+        ids = credited.id, billed.id, tampered.id
+    
+    # First snapshot is the baseline: nothing to compare against
+    first = snapshot_balances()
+    assert first == {"status": "success", "users": 3, "drifted": []}
+    
+    with sync_db() as db:
+        db.execute(update(User).where(User.id == ids[0]).values(balance=Decimal("15.00")))
+        db.add(Transaction(user_id=ids[0], amount=Decimal("5.00"), type=TransactionType.CREDIT,
+                           balance_after=Decimal("15.00")))
+        db.execute(update(User).where(User.id == ids[2]).values(balance=Decimal("13.00")))
+        db.commit()
+    assert process_vm_billing()["total_amount"] == pytest.approx(2.0)
+    
+    result = snapshot_balances()
+    
+    assert result["drifted"] == [ids[2]]
+    assert balance_drift_users._value.get() == 1
+    with sync_db() as db:
+        assert db.get(User, ids[1]).usage_charged == Decimal("2.00")
+        drift = dict(db.execute(
+            select(BalanceSnapshot.user_id, BalanceSnapshot.drift).where(BalanceSnapshot.drift.is_not(None))
+        ).all())
+        assert drift == {ids[0]: 0, ids[1]: 0, ids[2]: Decimal("3.00")}
+
+
+async def test_balance_audit_replays_from_latest_snapshot(client, db_session, make_user):
+    """Test the admin audit adds transactions since the snapshot and reports drift"""
+    admin, target = make_user("admin@example.com", "0", UserRole.ADMIN), make_user("u@example.com", "12.00")
+    db_session.add_all([admin, target])
+    await db_session.flush()
+    db_session.add(Transaction(user_id=target.id, amount=Decimal("1.00"), type=TransactionType.CREDIT,
+                               balance_after=Decimal("1.00")))
+    await db_session.flush()
+    db_session.add(BalanceSnapshot(user_id=target.id, as_of=datetime.utcnow(), balance=Decimal("1.00"),
+                                   last_txn_id=1, usage_charged=Decimal("0")))
+    db_session.add(Transaction(user_id=target.id, amount=Decimal("10.00"), type=TransactionType.CREDIT,
+                               balance_after=Decimal("11.00")))
+    await db_session.commit()
+    target_id = target.id
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': str(admin.id)})}"}
+    
+    response = client.get(f"/api/v1/admin/users/{target_id}/balance-audit", headers=headers)
+    
+    assert response.status_code == 200
+    audit = response.json()
+    assert audit["transactions_since"] == 1
+    assert Decimal(audit["expected"]) == Decimal("11.00")
+    assert Decimal(audit["drift"]) == Decimal("1.00")
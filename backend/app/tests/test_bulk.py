@@ -0,0 +1,199 @@
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select, func
+
+from app.core.config import settings
+from app.core.security import create_access_token
+from app.models.log import Log
+from app.models.task import Task, TaskStatus
+from app.models.transaction import Transaction
+from app.models.usage import UsageSegment
+from app.models.user import UserRole, UserStatus
+from app.models.vm import VM, VMState
+from app.schemas.bulk import BulkCreditRequest, BulkBanRequest, BulkVMStopRequest
+from app.services.bulk import BulkAdminService
+from app.services.usage import UsageService
+from app.tasks.admin import run_bulk_operation
+from app.tasks.runtime import task_runtime
+
+
+def test_bulk_credit_reports_per_item_results(sync_db, make_user):
+    """Test credits, repeated users and unknown users in one statement set"""
+    with sync_db() as db:
+        admin, user = make_user("admin@example.com", role=UserRole.ADMIN), make_user("u@example.com")
+        db.add_all([admin, user])
+        db.commit()
+        
+        request = BulkCreditRequest(reason="Promo", items=[
+            {"user_id": user.id, "amount": "5.00"},
+            {"user_id": 999, "amount": "5.00"},
+            {"user_id": user.id, "amount": "1.50", "reason": "Bonus"},
+        ])
+        outcome = BulkAdminService.apply(db, "bulk_credit", request, admin.id, 0, 3)
+        db.commit()
+        
+        assert [r["status"] for r in outcome.results] == ["ok", "error", "ok"]
+        assert outcome.results[2]["balance"] == Decimal("16.50")
+        assert outcome.user_ids == {user.id}
+        
+        db.refresh(user)
+        assert user.balance == Decimal("16.50")
+        transactions = db.execute(select(Transaction).order_by(Transaction.id)).scalars().all()
+        assert [t.balance_after for t in transactions] == [Decimal("15.00"), Decimal("16.50")]
+        assert [t.description for t in transactions] == ["Promo", "Bonus"]
+        assert db.execute(select(func.count(Log.id))).scalar() == 2
+
+
+def test_bulk_ban_skips_admins(sync_db, make_user):
+    """Test that admins are reported, not banned"""
+    with sync_db() as db:
+        admin, user = make_user("admin@example.com", role=UserRole.ADMIN), make_user("u@example.com")
+        db.add_all([admin, user])
+        db.commit()
+        
+        request = BulkBanRequest(user_ids=[user.id, admin.id, user.id], reason="Abuse")
+        outcome = BulkAdminService.apply(db, "bulk_ban", request, admin.id, 0, 3)
+        db.commit()
+        
+        assert outcome.results == [
+            {"id": user.id, "status": "ok"},
+            {"id": admin.id, "status": "error", "error": "Cannot ban admin users"},
+        ]
+        db.refresh(user)
+        db.refresh(admin)
+        assert user.status == UserStatus.BANNED
+        assert admin.status == UserStatus.ACTIVE
+
+
+def test_bulk_stop_closes_usage_segments(
+    sync_db, simulator, make_user, make_template, make_server, make_vm
+):
+    """Test that VMs stopped on Proxmox stop billing, refused ones don't and stopped ones are skipped"""
+    with sync_db() as db:
+        user = make_user("u@example.com", role=UserRole.ADMIN)
+        template, server = make_template(), make_server()
+        db.add_all([user, template, server])
+        db.flush()
+        running, stopped, refused = [
+            make_vm(user, template, server, state, name=f"vm{i}",
+                    proxmox_vm_id=simulator.add_vm(node="pve1", status="running")["vmid"])
+            for i, state in enumerate([VMState.RUNNING, VMState.STOPPED, VMState.RUNNING])
+        ]
+        db.add_all([running, stopped, refused])
+        db.flush()
+        db.execute(UsageService.open_segments(
+            [(running.id, user.id, Decimal("1.00")), (refused.id, user.id, Decimal("1.00"))], datetime.utcnow()
+        ))
+        db.commit()
+        del simulator.vms[refused.proxmox_vm_id]
+        
+        request = BulkVMStopRequest(vm_ids=[running.id, stopped.id, refused.id])
+        rows = db.execute(BulkAdminService.proxmox_targets("bulk_stop_vms", request, 0, 3)).all()
+        proxmox = task_runtime.run(BulkAdminService.run_proxmox("bulk_stop_vms", rows))
+        outcome = BulkAdminService.apply(db, "bulk_stop_vms", request, user.id, 0, 3, proxmox)
+        db.commit()
+        
+        assert [r["status"] for r in outcome.results] == ["ok", "skipped", "error"]
+        assert outcome.results[2]["error"].startswith("Proxmox failed to stop the VM")
+        assert outcome.events == [(user.id, "vm_state", {"vm_id": running.id, "state": "stopped", "reason": "admin"})]
+        assert simulator.vms[running.proxmox_vm_id]["status"] == "stopped"
+        db.refresh(running)
+        db.refresh(refused)
+        assert running.state == VMState.STOPPED
+        assert refused.state == VMState.RUNNING
+        ended = dict(db.execute(select(UsageSegment.vm_id, UsageSegment.ended_at)).all())
+        assert ended[running.id] is not None
+        assert ended[refused.id] is None
+
+
+def test_bulk_task_runs_in_chunks(sync_db, monkeypatch, make_user):
+    """Test that the background task commits chunks and stores results"""
+    monkeypatch.setattr(settings, "BULK_CHUNK_SIZE", 2)
+    monkeypatch.setattr("app.tasks.admin.SessionLocal", sync_db)
+    
+    with sync_db() as db:
+        admin = make_user("admin@example.com", role=UserRole.ADMIN)
+        users = [make_user(f"u{i}@example.com") for i in range(5)]
+        db.add_all([admin, *users])
+        db.flush()
+        request = BulkCreditRequest(items=[{"user_id": u.id, "amount": "1.00"} for u in users])
+        task = Task(
+            type="bulk_credit",
+            status=TaskStatus.PENDING,
+            payload={"admin_id": admin.id, "request": request.model_dump(mode="json")}
+        )
+        db.add(task)
+        db.commit()
+        task_id = task.id
+    
+    assert run_bulk_operation(task_id) == {"status": "success", "total": 5, "failed": 0}
+    
+    with sync_db() as db:
+        task = db.get(Task, task_id)
+        assert task.status == TaskStatus.COMPLETED
+        assert task.progress_percent == 100
+        assert task.result["succeeded"] == 5
+        assert task.result["results"][0]["balance"] == "11.00"
+        assert db.execute(select(func.count(Transaction.id))).scalar() == 5
+
+
+@pytest.mark.asyncio
+async def test_bulk_credit_csv_endpoint(client, db_session, make_user):
+    """Test the CSV upload applies credits inline for small files"""
+    admin = make_user("admin@example.com", role=UserRole.ADMIN)
+    user = make_user("u@example.com")
+    db_session.add_all([admin, user])
+    await db_session.commit()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': str(admin.id)})}"}
+    
+    response = client.post(
+        "/api/v1/admin/bulk/credits/csv",
+        headers=headers,
+        files={"file": ("credits.csv", f"user_id,amount\n{user.id},2.50\n12345,1\n", "text/csv")},
+        data={"reason": "Migration"}
+    )
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert (data["total"], data["succeeded"], data["failed"]) == (2, 1, 1)
+    assert data["results"][1]["error"] == "User not found"
+    
+    bad = client.post(
+        "/api/v1/admin/bulk/credits/csv",
+        headers=headers,
+        files={"file": ("credits.csv", "id,value\n1,2\n", "text/csv")}
+    )
+    assert bad.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_bulk_stop_endpoint_stops_on_proxmox(
+    client, db_session, simulator, make_user, make_template, make_server, make_vm
+):
+    """Test that the inline admin stop reaches Proxmox and reports a refused VM as failed"""
+    admin = make_user("admin@example.com", role=UserRole.ADMIN)
+    template, server = make_template(), make_server()
+    db_session.add_all([admin, template, server])
+    await db_session.flush()
+    vms = [
+        make_vm(admin, template, server, VMState.RUNNING, name=f"vm{i}",
+                proxmox_vm_id=simulator.add_vm(node="pve1", status="running")["vmid"])
+        for i in range(2)
+    ]
+    db_session.add_all(vms)
+    await db_session.commit()
+    del simulator.vms[vms[1].proxmox_vm_id]
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': str(admin.id)})}"}
+    
+    response = client.post("/api/v1/admin/bulk/vms/stop", headers=headers,
+                           json={"vm_ids": [vm.id for vm in vms], "reason": "abuse"})
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert (data["succeeded"], data["failed"]) == (1, 1)
+    assert [r["status"] for r in data["results"]] == ["ok", "error"]
+    assert simulator.vms[vms[0].proxmox_vm_id]["status"] == "stopped"
+    states = dict((await db_session.execute(select(VM.id, VM.state))).all())
+    assert states == {vms[0].id: VMState.STOPPED, vms[1].id: VMState.RUNNING}
@@ -0,0 +1,70 @@
+import asyncio
+
+import fakeredis
+import orjson
+import pytest
+
+from app.core import cache_bus as cache_bus_module
+from app.core.cache_bus import CacheInvalidationBus
+from app.tests.proxmox_simulator import ProxmoxSimulator
+from app.tests.test_proxmox import make_service
+
+
+@pytest.fixture
+def fake_server(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        cache_bus_module.aioredis, "from_url", lambda url: fakeredis.aioredis.FakeRedis(server=server)
+    )
+    return server
+
+
+async def until(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+async def test_invalidations_reach_other_processes_only(fake_server):
+    """Test that a published key is dropped by other subscribers but not by the publisher"""
+    first, second = CacheInvalidationBus(), CacheInvalidationBus()
+    dropped = {"first": [], "second": []}
+    first.register("reads", dropped["first"].append)
+    second.register("reads", dropped["second"].append)
+    first.start()
+    second.start()
+    try:
+        # Let both subscriptions register before publishing
+        await asyncio.sleep(0.05)
+        first.publish("reads", "scope-1")
+        await until(lambda: dropped["second"])
+    finally:
+        await first.stop()
+        await second.stop()
+    
+    assert dropped == {"first": [], "second": ["scope-1"]}
+
+
+async def test_proxmox_writes_publish_hashed_scope(monkeypatch):
+    """Test that a Proxmox write announces its read scope without the API token"""
+    published = []
+    monkeypatch.setattr(cache_bus_module.cache_bus, "publish", lambda cache, key: published.append((cache, key)))
+    simulator = ProxmoxSimulator(nodes=1)
+    simulator.add_vm(vmid=100, node="pve1", status="stopped")
+    proxmox = make_service(simulator)
+    
+    await proxmox.start_vm("pve1", 100)
+    
+    # Before the write is sent and again once it returned
+    assert published == [("proxmox_reads", proxmox._read_scope)] * 2
+    assert proxmox.api_token not in orjson.dumps(published).decode()
+
+
+def test_malformed_messages_are_ignored():
+    """Test that garbage on the channel doesn't break the listener"""
+    bus = CacheInvalidationBus()
+    bus.register("reads", lambda key: pytest.fail("should not be called"))
+    
+    bus.apply(b"not json")
+    bus.apply(orjson.dumps({"cache": "reads"}))
@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from app.core.events import ConnectionManager
+from app.core.security import get_password_hash, create_access_token
+from app.models.user import User, UserRole, UserStatus
+
+
+class FakeWebSocket:
+    """Minimal WebSocket stand-in recording sent messages"""
+    
+    def __init__(self, fail: bool = False, gate: asyncio.Event = None):
+        self.fail = fail
+        self.gate = gate
+        self.sent = []
+    
+    async def send_text(self, message: str):
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.fail:
+            raise RuntimeError("connection closed")
+        self.sent.append(message)
+
+
+@pytest.mark.asyncio
+async def test_deliver_only_reaches_owner():
+    """Test that events are delivered to the owning user's sockets only"""
+    manager = ConnectionManager()
+    owner_ws, other_ws = FakeWebSocket(), FakeWebSocket()
+    manager.connect(1, owner_ws)
+    manager.connect(2, other_ws)
+    
+    manager.deliver(1, "event")
+    await asyncio.sleep(0)
+    
+    assert owner_ws.sent == ["event"]
+    assert other_ws.sent == []
+
+
+@pytest.mark.asyncio
+async def test_deliver_drops_dead_sockets():
+    """Test that sockets failing to send are unregistered"""
+    manager = ConnectionManager()
+    manager.connect(1, FakeWebSocket(fail=True))
+    
+    manager.deliver(1, "event")
+    await asyncio.sleep(0)
+    
+    assert manager.connection_count == 0
+    assert manager._senders == {} and manager._outboxes == {}
+
+
+@pytest.mark.asyncio
+async def test_slow_socket_does_not_block_others(monkeypatch):
+    """Test that queued delivery keeps going past a stalled socket, dropping its oldest events"""
+    monkeypatch.setattr("app.core.events.settings.WS_SEND_QUEUE_SIZE", 2)
+    manager = ConnectionManager()
+    gate = asyncio.Event()
+    slow_ws, fast_ws = FakeWebSocket(gate=gate), FakeWebSocket()
+    manager.connect(1, slow_ws)
+    manager.connect(2, fast_ws)
+    
+    for n in range(4):
+        manager.deliver(1, f"slow-{n}")
+        manager.deliver(2, f"fast-{n}")
+        await asyncio.sleep(0)
+    
+    assert fast_ws.sent == ["fast-0", "fast-1", "fast-2", "fast-3"]
+    assert slow_ws.sent == []
+    
+    gate.set()
+    await asyncio.sleep(0.01)
+    # slow-0 was already being sent; slow-1 fell off the full queue
+    assert slow_ws.sent == ["slow-0", "slow-2", "slow-3"]
+    assert manager._senders == {} and manager._outboxes == {}
+
+
+@pytest.mark.asyncio
+async def test_listener_closes_connection_before_reconnecting(monkeypatch):
+    """Test that a failed subscription's client and pubsub are closed"""
+    closed = []
+    
+    class FakePubSub:
+        async def subscribe(self, channel):
+            raise ConnectionError("redis down")
+        
+        async def aclose(self):
+            closed.append("pubsub")
+    
+    class FakeClient:
+        def pubsub(self):
+            return FakePubSub()
+        
+        async def aclose(self):
+            closed.append("client")
+    
+    monkeypatch.setattr("app.core.events.aioredis.from_url", lambda url: FakeClient())
+    manager = ConnectionManager()
+    manager.start()
+    await asyncio.sleep(0.01)
+    await manager.stop()
+    
+    assert closed == ["pubsub", "client"]
+
+
+@pytest.mark.asyncio
+async def test_ws_rejects_invalid_token(client):
+    """Test WebSocket authentication with an invalid token"""
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect("/ws/vms?token=invalid") as websocket:
+            websocket.receive_text()
+
+
+@pytest.mark.asyncio
+async def test_ws_accepts_active_user(client, db_session):
+    """Test WebSocket connection for an active user"""
+    user = User(
+        email="test@example.com",
+        password_hash=get_password_hash("testpassword123"),
+        role=UserRole.USER,
+        status=UserStatus.ACTIVE
+    )
+    db_session.add(user)
+    await db_session.commit()
+    
+    token = create_access_token({"sub": str(user.id)})
+    
+    with client.websocket_connect(f"/ws/vms?token={token}") as websocket:
+        websocket.send_text("ping")
@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import select
+
+from app.models.user import UserStatus
+from app.models.usage import UsageSegment
+from app.models.vm import VM, VMState
+from app.services.exhaustion import ExhaustionScheduler, EXHAUSTION_KEY, exhaustion_scheduler
+from app.services.usage import UsageService
+from app.tasks.billing import enforce_balance_deadlines
+
+
+NOW = datetime(2026, 1, 1, 12, 0)
+
+
+def make_row(user_id, balance, rate=None, billed_until=None, ended_at=None):
+    return SimpleNamespace(
+        id=user_id,
+        status=UserStatus.ACTIVE,
+        balance=Decimal(balance),
+        rate=Decimal(rate) if rate else None,
+        billed_until=billed_until,
+        ended_at=ended_at
+    )
+
+
+def test_project_accounts_for_unbilled_usage():
+    """Test that the deadline uses the balance minus usage not yet billed"""
+    rows = [
+        # 2/h for one unbilled hour, then 10 - 2 = 8 left at 2/h
+        make_row(1, "10.00", "1.50", NOW - timedelta(hours=1)),
+        make_row(1, "10.00", "0.50", NOW - timedelta(hours=1)),
+        # Stopped VM still owes its closed segment but does not burn
+        make_row(2, "1.00", "2.00", NOW - timedelta(hours=1), NOW - timedelta(minutes=30)),
+        make_row(3, "5.00"),
+        make_row(4, "0.10", "1.00", NOW - timedelta(hours=1)),
+    ]
+    
+    deadlines = ExhaustionScheduler.project(rows, NOW)
+    
+    assert deadlines[1] == NOW + timedelta(hours=4)
+    assert deadlines[2] is None
+    assert deadlines[3] is None
+    assert deadlines[4] == NOW
+
+
+def test_pop_due_returns_each_user_once(fake_redis):
+    """Test that due users are removed from the schedule when popped"""
+    exhaustion_scheduler.update({1: NOW - timedelta(seconds=1), 2: NOW + timedelta(hours=1), 3: None})
+    
+    assert exhaustion_scheduler.pop_due(NOW) == [1]
+    assert exhaustion_scheduler.pop_due(NOW) == []
+    assert exhaustion_scheduler.pop_due(NOW + timedelta(hours=2)) == [2]
+
+
+@pytest.fixture
+def seed_users(simulator, make_user, make_template, make_server, make_vm):
+    """A user who ran out of credit and one topped up since, each with a running VM"""
+    def seed(db, now):
+        template, server = make_template(), make_server()
+        broke = make_user("broke@example.com", "0.50")
+        # Topped up after the deadline was scheduled
+        topped = make_user("topped@example.com", "50.00")
+        db.add_all([template, server, broke, topped])
+        db.flush()
+        
+        vms = {}
+        for user in (broke, topped):
+            proxmox = simulator.add_vm(node="pve1", status="running")
+            vm = make_vm(user, template, server, VMState.RUNNING, proxmox_vm_id=proxmox["vmid"])
+            db.add(vm)
+            db.flush()
+            db.execute(UsageService.open_segments([(vm.id, user.id, Decimal("1.00"))], now - timedelta(hours=1)))
+            vms[user.id] = SimpleNamespace(id=vm.id, proxmox_vm_id=vm.proxmox_vm_id)
+        db.commit()
+        return broke.id, topped.id, vms
+    return seed
+
+
+def test_enforce_stops_only_exhausted_users(sync_db, fake_redis, simulator, seed_users):
+    """Test that popped users are re-projected before their VMs are stopped on Proxmox"""
+    now = datetime.utcnow()
+    with sync_db() as db:
+        broke_id, topped_id, vms = seed_users(db, now)
+    
+    exhaustion_scheduler.update({broke_id: now, topped_id: now})
+    
+    result = enforce_balance_deadlines()
+    
+    assert result["status"] == "success"
+    assert result["vms_stopped"] == 1
+    assert simulator.vms[vms[broke_id].proxmox_vm_id]["status"] == "stopped"
+    assert simulator.vms[vms[topped_id].proxmox_vm_id]["status"] == "running"
+    
+    with sync_db() as db:
+        assert db.get(VM, vms[broke_id].id).state == VMState.STOPPED
+        assert db.get(VM, vms[topped_id].id).state == VMState.RUNNING
+        assert db.execute(
+            select(UsageSegment.ended_at).where(UsageSegment.vm_id == vms[broke_id].id)
+        ).scalar_one() is not None
+    
+    # The topped-up user is rescheduled about 49 hours out, the other dropped
+    assert fake_redis.zscore(EXHAUSTION_KEY, broke_id) is None
+    assert fake_redis.zscore(EXHAUSTION_KEY, topped_id) == pytest.approx(
+        (now + timedelta(hours=49) - datetime(1970, 1, 1)).total_seconds(), abs=60
+    )
+
+
+def test_enforce_keeps_billing_when_proxmox_refuses(sync_db, fake_redis, simulator, seed_users):
+    """Test that a VM Proxmox failed to stop stays running and billed, and its owner is retried"""
+    now = datetime.utcnow()
+    with sync_db() as db:
+        broke_id, topped_id, vms = seed_users(db, now)
+    del simulator.vms[vms[broke_id].proxmox_vm_id]
+    
+    exhaustion_scheduler.update({broke_id: now})
+    
+    result = enforce_balance_deadlines()
+    
+    assert result["vms_stopped"] == 0
+    assert result["vms_failed"] == 1
+    with sync_db() as db:
+        assert db.get(VM, vms[broke_id].id).state == VMState.RUNNING
+        assert db.execute(
+            select(UsageSegment.ended_at).where(UsageSegment.vm_id == vms[broke_id].id)
+        ).scalar_one() is None
+    assert fake_redis.zscore(EXHAUSTION_KEY, broke_id) is not None
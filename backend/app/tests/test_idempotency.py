@@ -0,0 +1,145 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from httpx import AsyncClient, ASGITransport
+
+from app.core.config import settings
+from app.core.idempotency import IdempotencyMiddleware
+from app.core.security import create_access_token
+
+
+@pytest.fixture
+def counting_app():
+    app = FastAPI()
+    app.add_middleware(IdempotencyMiddleware, path_pattern=r"^/vms(/\d+/action)?$")
+    calls = []
+
+    @app.post("/vms")
+    async def create(payload: dict):
+        calls.append(payload)
+        # Long enough for a concurrent duplicate to arrive mid-request
+        await asyncio.sleep(0.2)
+        return {"id": len(calls), **payload}
+
+    @app.post("/vms/{vm_id}/action")
+    async def action(vm_id: int):
+        calls.append(vm_id)
+        raise HTTPException(status_code=503, detail="Proxmox unavailable")
+
+    app.state.calls = calls
+    return app
+
+
+def _headers(key: str, user_id: int = 1) -> dict:
+    token = create_access_token({"sub": str(user_id)})
+    return {"Authorization": f"Bearer {token}", "Idempotency-Key": key}
+
+
+async def test_duplicate_replays_first_response(fake_redis, counting_app):
+    """Test that a retry gets the stored response without re-running the handler"""
+    async with AsyncClient(transport=ASGITransport(app=counting_app), base_url="http://test") as ac:
+        first = await ac.post("/vms", json={"name": "a"}, headers=_headers("k1"))
+        second = await ac.post("/vms", json={"name": "a"}, headers=_headers("k1"))
+
+    assert first.status_code == second.status_code == 200
+    assert second.json() == first.json() == {"id": 1, "name": "a"}
+    assert second.headers["idempotent-replayed"] == "true"
+    assert len(counting_app.state.calls) == 1
+
+
+async def test_concurrent_duplicate_waits_for_first(fake_redis, counting_app):
+    """Test that an in-flight duplicate waits and replays instead of running twice"""
+    async with AsyncClient(transport=ASGITransport(app=counting_app), base_url="http://test") as ac:
+        responses = await asyncio.gather(*[
+            ac.post("/vms", json={"name": "a"}, headers=_headers("k2")) for _ in range(3)
+        ])
+
+    assert {r.json()["id"] for r in responses} == {1}
+    assert len(counting_app.state.calls) == 1
+
+
+async def test_key_scoping_and_mismatch(fake_redis, counting_app):
+    """Test that keys are per user and reuse with another body is rejected"""
+    async with AsyncClient(transport=ASGITransport(app=counting_app), base_url="http://test") as ac:
+        await ac.post("/vms", json={"name": "a"}, headers=_headers("k3", user_id=1))
+        other_user = await ac.post("/vms", json={"name": "a"}, headers=_headers("k3", user_id=2))
+        mismatch = await ac.post("/vms", json={"name": "b"}, headers=_headers("k3", user_id=1))
+        no_key = await ac.post("/vms", json={"name": "a"}, headers={"Authorization": _headers("x")["Authorization"]})
+
+    assert other_user.status_code == 200 and "idempotent-replayed" not in other_user.headers
+    assert mismatch.status_code == 422
+    assert no_key.status_code == 200
+    assert len(counting_app.state.calls) == 3
+
+
+async def test_server_errors_are_not_stored(fake_redis, counting_app):
+    """Test that a 5xx frees the key so the client can retry"""
+    async with AsyncClient(transport=ASGITransport(app=counting_app), base_url="http://test") as ac:
+        for _ in range(2):
+            response = await ac.post("/vms/7/action", headers=_headers("k4"))
+            assert response.status_code == 503
+
+    assert counting_app.state.calls == [7, 7]
+    assert fake_redis.keys("idempotency:*") == []
+
+
+async def test_duplicate_runs_when_first_fails(fake_redis):
+    """Test that a duplicate waiting on a request that failed with a 5xx runs it itself"""
+    app = FastAPI()
+    app.add_middleware(IdempotencyMiddleware, path_pattern=r"^/vms$")
+    calls = []
+
+    @app.post("/vms")
+    async def create():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            await asyncio.sleep(0.2)
+            raise HTTPException(status_code=503, detail="Proxmox unavailable")
+        return {"id": len(calls)}
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        first = asyncio.ensure_future(ac.post("/vms", headers=_headers("k5")))
+        await asyncio.sleep(0.05)
+        second = await ac.post("/vms", headers=_headers("k5"))
+        first = await first
+
+    assert first.status_code == 503
+    assert second.status_code == 200 and second.json() == {"id": 2}
+    assert "idempotent-replayed" not in second.headers
+    assert calls == [0, 1]
+
+
+async def test_claim_is_renewed_while_request_runs(fake_redis, monkeypatch):
+    """Test that a request outliving the claim's TTL still holds its key"""
+    monkeypatch.setattr(settings, "IDEMPOTENCY_LOCK_SECONDS", 0.3)
+    app = FastAPI()
+    app.add_middleware(IdempotencyMiddleware, path_pattern=r"^/vms$")
+    calls = []
+
+    @app.post("/vms")
+    async def create():
+        calls.append(1)
+        await asyncio.sleep(0.8)
+        return {"id": len(calls)}
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        first = asyncio.ensure_future(ac.post("/vms", headers=_headers("k6")))
+        await asyncio.sleep(0.5)
+        second = await ac.post("/vms", headers=_headers("k6"))
+        first = await first
+
+    assert first.json() == second.json() == {"id": 1}
+    assert second.headers["idempotent-replayed"] == "true"
+    assert calls == [1]
+
+
+async def test_replayed_body_is_followed_by_client_messages():
+    """Test that after the buffered body the app sees the client's disconnect instead of blocking"""
+    async def client_receive():
+        return {"type": "http.disconnect"}
+
+    receive = IdempotencyMiddleware._replay_receive(b"{}", client_receive)
+
+    assert await receive() == {"type": "http.request", "body": b"{}", "more_body": False}
+    assert await asyncio.wait_for(receive(), timeout=1) == {"type": "http.disconnect"}
@@ -0,0 +1,160 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select
+
+from app.core.security import create_access_token
+from app.models.invoice import Invoice
+from app.models.usage import UsageSegment, UsageMonthly, UsageSegmentArchive, LedgerPeriod
+from app.models.user import User
+from app.models.vm import VMState
+from app.services.ledger import LedgerService
+from app.services.usage import UsageService
+from app.tasks.billing import compact_usage_ledger, process_vm_billing
+
+
+@pytest.fixture
+def seed(make_user, make_template, make_server, make_vm):
+    def seed(db):
+        user, template, server = make_user(balance="100.00"), make_template(), make_server()
+        db.add_all([user, template, server])
+        db.flush()
+        vm = make_vm(user, template, server, VMState.RUNNING, name="web")
+        db.add(vm)
+        db.flush()
+        return user, vm
+    return seed
+
+
+def segment(vm, started_at, ended_at, billed_until):
+    return UsageSegment(vm_id=vm.id, user_id=vm.user_id, rate=Decimal("1.00"), started_at=started_at,
+                        ended_at=ended_at, billed_until=billed_until,
+                        settled_at=billed_until if ended_at == billed_until else None)
+
+
+def test_closed_months_are_summarized_invoiced_and_archived(sync_db, monkeypatch, seed):
+    """Test that segments spanning months are split and archived once fully summarized"""
+    monkeypatch.setattr("app.tasks.billing.datetime", type("frozen", (datetime,), {
+        "utcnow": staticmethod(lambda: datetime(2026, 10, 3))
+    }))
+    
+    with sync_db() as db:
+        user, vm = seed(db)
+        db.add_all([
+            # Aug 31 22:00 - Sep 2: 2h in August, 24h in September
+            segment(vm, datetime(2026, 8, 31, 22), datetime(2026, 9, 2), datetime(2026, 9, 2)),
+            # Still running, billed into October: 1h in September
+            segment(vm, datetime(2026, 9, 30, 23), None, datetime(2026, 10, 2)),
+        ])
+        db.commit()
+        user_id, vm_id = user.id, vm.id
+    
+    result = compact_usage_ledger()
+    
+    assert result == {"status": "success", "months_closed": ["2026-08-01", "2026-09-01"]}
+    with sync_db() as db:
+        monthly = {
+            row.month: (row.amount, row.vm_hours, row.segments)
+            for row in db.execute(select(UsageMonthly)).scalars()
+        }
+        assert monthly == {
+            date(2026, 8, 1): (Decimal("2.0000"), 2.0, 1),
+            date(2026, 9, 1): (Decimal("25.0000"), 25.0, 2),
+        }
+        
+        invoices = db.execute(select(Invoice).order_by(Invoice.month)).scalars().all()
+        assert [(invoice.number, invoice.total) for invoice in invoices] == [
+            (f"INV-202608-{user_id:06d}", Decimal("2.00")),
+            (f"INV-202609-{user_id:06d}", Decimal("25.00")),
+        ]
+        assert invoices[1].lines == [
+            {"vm_id": vm_id, "name": "web", "template": "small", "hours": 25.0, "amount": "25.0000"}
+        ]
+        
+        # The finished segment moved out when September closed; the open one stays
+        assert db.execute(select(UsageSegmentArchive.archived_month)).scalars().all() == [date(2026, 9, 1)]
+        assert db.execute(select(UsageSegment.ended_at)).scalars().all() == [None]
+    
+    # October has not ended: nothing more to close
+    assert compact_usage_ledger()["months_closed"] == []
+
+
+def test_month_waits_for_billing(sync_db, seed):
+    """Test that a month is not closed while charges inside it are still pending"""
+    with sync_db() as db:
+        _, vm = seed(db)
+        # Billing stopped before the month end
+        db.add(segment(vm, datetime(2026, 9, 10), None, datetime(2026, 9, 29)))
+        db.commit()
+        
+        month = LedgerService.next_closable_month(db, datetime(2026, 10, 3), timedelta(hours=24))
+        assert month == date(2026, 9, 1)
+        assert LedgerService.close_month(db, month) is None
+        db.rollback()
+        
+        assert db.execute(select(LedgerPeriod)).first() is None
+        # Within the grace period nothing is closable yet
+        assert LedgerService.next_closable_month(db, datetime(2026, 10, 1, 12), timedelta(hours=24)) is None
+
+
+def test_invoice_matches_balance_debits(sync_db, monkeypatch, seed):
+    """Test that a month's invoice adds up to what billing took from the balance"""
+    clock = {"now": datetime(2026, 9, 30, 21, 0, 11)}
+    monkeypatch.setattr("app.tasks.billing.datetime", type("frozen", (datetime,), {
+        "utcnow": staticmethod(lambda: clock["now"])
+    }))
+    
+    with sync_db() as db:
+        user, vm = seed(db)
+        # Each cycle's share is a fraction of a cent
+        db.execute(UsageService.open_segments([(vm.id, user.id, Decimal("0.0137"))], clock["now"]))
+        db.commit()
+        user_id, vm_id = user.id, vm.id
+    
+    # Billed every 7m13s until the VM stops
+    debits = []
+    while clock["now"] < datetime(2026, 9, 30, 23, 50):
+        clock["now"] += timedelta(minutes=7, seconds=13)
+        debits.append(process_vm_billing()["total_amount"])
+    with sync_db() as db:
+        db.execute(UsageService.close_segments([vm_id], clock["now"] + timedelta(minutes=3)))
+        db.commit()
+    debits.append(process_vm_billing()["total_amount"])
+    
+    # Every debit fits the Numeric(10,2) balance as is (Postgres would round it otherwise)
+    debits = [Decimal(str(debit)) for debit in debits]
+    assert all(debit == debit.quantize(Decimal("0.01")) for debit in debits)
+    
+    clock["now"] = datetime(2026, 10, 3)
+    assert compact_usage_ledger()["months_closed"] == ["2026-09-01"]
+    
+    with sync_db() as db:
+        balance = db.get(User, user_id).balance
+        invoice = db.execute(select(Invoice)).scalar_one()
+        assert invoice.total > 0
+        assert invoice.total == sum(debits) == Decimal("100.00") - balance
+
+
+async def test_invoices_are_listed_for_their_owner_only(client, db_session, make_user):
+    """Test the invoice endpoints only return the caller's invoices"""
+    owner, other = make_user("owner@example.com"), make_user("other@example.com")
+    db_session.add_all([owner, other])
+    await db_session.flush()
+    db_session.add_all([
+        Invoice(user_id=owner.id, month=date(2026, 9, 1), number="INV-202609-000001", total=Decimal("25.00"),
+                vm_hours=25.0, lines=[{"vm_id": 1, "name": "web", "template": "small", "hours": 25.0,
+                                       "amount": "25.0000"}]),
+        Invoice(user_id=other.id, month=date(2026, 9, 1), number="INV-202609-000002", total=Decimal("1.00"),
+                vm_hours=1.0, lines=[]),
+    ])
+    await db_session.commit()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': str(owner.id)})}"}
+    
+    response = client.get("/api/v1/user/invoices", headers=headers)
+    
+    assert response.status_code == 200
+    assert [invoice["number"] for invoice in response.json()] == ["INV-202609-000001"]
+    assert response.json()[0]["lines"][0]["amount"] == "25.0000"
+    assert client.get("/api/v1/user/invoices/INV-202609-000001", headers=headers).json()["total"] == "25.00"
+    assert client.get("/api/v1/user/invoices/INV-202609-000002", headers=headers).status_code == 404
@@ -0,0 +1,85 @@
+import time
+
+import pytest
+
+from app.core import locks
+from app.core.locks import singleton
+
+
+def test_singleton_skips_overlapping_run(fake_redis):
+    """Test that a run started while another holds the lease is skipped"""
+    calls = []
+    
+    @singleton(name="job", policy="skip")
+    def job():
+        calls.append("outer")
+        # A duplicate cycle starting mid-run
+        calls.append(job())
+        return "done"
+    
+    assert job() == "done"
+    assert calls[1]["status"] == "skipped"
+    assert calls[1]["queued"] is False
+    assert fake_redis.get("lock:job") is None
+
+
+def test_singleton_queue_reruns_once(fake_redis):
+    """Test that queued duplicates collapse into one extra run"""
+    runs = []
+    
+    @singleton(name="job", policy="queue")
+    def job():
+        runs.append(len(runs))
+        if len(runs) == 1:
+            job()
+            job()
+        return len(runs)
+    
+    assert job() == 2
+    assert runs == [0, 1]
+    assert fake_redis.get("lock:job") is None
+    assert fake_redis.get("lock:job:pending") is None
+
+
+def test_singleton_releases_on_error(fake_redis):
+    """Test that the lease is released when the task raises"""
+    
+    @singleton(name="job")
+    def job():
+        raise RuntimeError("boom")
+    
+    with pytest.raises(RuntimeError):
+        job()
+    
+    assert fake_redis.get("lock:job") is None
+
+
+def test_lease_renew_requires_ownership(fake_redis):
+    """Test that a lease cannot be renewed by another owner"""
+    lease = locks.RedisLease("job", ttl_seconds=60)
+    other = locks.RedisLease("job", ttl_seconds=60)
+    
+    assert lease.acquire()
+    assert not other.acquire()
+    assert lease.renew()
+    assert not other.renew()
+
+
+def test_lost_lease_aborts_before_commit(fake_redis):
+    """Test that a body losing its lease is stopped at ensure_lease, past its own error handling"""
+    committed = []
+    
+    @singleton(name="job", ttl_seconds=1)
+    def job():
+        try:
+            # Another worker took over after our lease expired
+            fake_redis.set("lock:job", "someone-else")
+            time.sleep(0.5)
+            locks.ensure_lease()
+            committed.append(True)
+        except Exception:
+            return {"status": "error"}
+    
+    assert job() == {"status": "aborted", "reason": "lease_lost"}
+    assert committed == []
+    assert fake_redis.get("lock:job") == b"someone-else"
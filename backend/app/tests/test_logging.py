@@ -0,0 +1,72 @@
+import logging
+import logging.handlers
+import threading
+import time
+
+import orjson
+
+from app.core.logging import AuditLogger, LogFormatter, RingQueue
+
+
+def test_ring_queue_drops_oldest():
+    """Test that a full queue evicts its oldest record and counts it"""
+    ring = RingQueue(2)
+    for n in range(5):
+        ring.put_nowait(n)
+    
+    assert [ring.get_nowait(), ring.get_nowait()] == [3, 4]
+    assert (ring.enqueued, ring.dropped) == (5, 3)
+
+
+def test_slow_sink_does_not_block_callers():
+    """Test that logging returns immediately while the writer is stuck"""
+    ring = RingQueue(100)
+    release = threading.Event()
+    written = []
+    
+    class StuckHandler(logging.Handler):
+        def emit(self, record):
+            release.wait()
+            written.append(record.getMessage())
+    
+    listener = logging.handlers.QueueListener(ring, StuckHandler())
+    listener.start()
+    log = logging.getLogger("test.slow_sink")
+    log.propagate = False
+    log.addHandler(logging.handlers.QueueHandler(ring))
+    try:
+        start = time.perf_counter()
+        for n in range(1000):
+            log.warning("record %d", n)
+        elapsed = time.perf_counter() - start
+    finally:
+        release.set()
+        listener.stop()
+    
+    assert elapsed < 1.0
+    assert ring.dropped >= 800
+    assert written[-1] == "record 999"
+
+
+def test_audit_records_are_encoded_by_the_formatter():
+    """Test that audit events carry a dict and are rendered as JSON when written"""
+    records = []
+    
+    class Capture(logging.Handler):
+        def emit(self, record):
+            records.append(record)
+    
+    audit = AuditLogger()
+    handler = Capture()
+    audit.logger.addHandler(handler)
+    try:
+        audit.log("vm_start", user_id=7, details={"vm_id": 3})
+    finally:
+        audit.logger.removeHandler(handler)
+    
+    record, = records
+    assert record.audit["action"] == "vm_start"
+    line = LogFormatter("%(levelname)s - %(message)s").format(record)
+    level, payload = line.split(" - ", 1)
+    assert level == "INFO"
+    assert orjson.loads(payload)["details"] == {"vm_id": 3}
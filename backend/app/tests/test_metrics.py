@@ -0,0 +1,43 @@
+import pytest
+from fastapi import status
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(client):
+    """Test Prometheus metrics exposition"""
+    client.get("/api/v1/health")
+    
+    response = client.get("/metrics")
+    
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "http_request_duration_seconds" in response.text
+    assert 'route="/api/v1/health"' in response.text
+
+
+@pytest.mark.asyncio
+async def test_metrics_use_route_template(client):
+    """Test that request latency is labelled by route template, not raw path"""
+    client.get("/api/v1/templates/12345")
+    
+    response = client.get("/metrics")
+    
+    assert 'route="/api/v1/templates/{template_id}"' in response.text
+    assert 'route="/api/v1/templates/12345"' not in response.text
+
+
+def test_multiprocess_dir_is_reset_and_dead_processes_dropped(tmp_path, monkeypatch):
+    """Test worker startup clears stale samples and exited children drop live gauges"""
+    from app.core.metrics import mark_process_dead, reset_multiprocess_dir
+
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    (tmp_path / "counter_123.db").write_bytes(b"stale")
+    (tmp_path / "gauge_livemax_456.db").write_bytes(b"")
+
+    reset_multiprocess_dir()
+    assert list(tmp_path.iterdir()) == []
+
+    (tmp_path / "gauge_livemax_456.db").write_bytes(b"")
+    (tmp_path / "counter_456.db").write_bytes(b"")
+    mark_process_dead(456)
+    assert [path.name for path in tmp_path.iterdir()] == ["counter_456.db"]
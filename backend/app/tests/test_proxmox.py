@@ -0,0 +1,144 @@
+import asyncio
+
+import pytest
+import httpx
+
+from app.core.encryption import encryption
+from app.services.proxmox import ProxmoxService
+from app.tests.proxmox_simulator import ProxmoxSimulator
+
+
+def make_service(simulator: ProxmoxSimulator) -> ProxmoxService:
+    return ProxmoxService(
+        api_url="https://pve.example.com:8006",
+        api_token_encrypted=encryption.encrypt("root@pam!test=secret"),
+        server_name="sim",
+        transport=simulator.transport()
+    )
+
+
+@pytest.mark.asyncio
+async def test_connection_and_nodes():
+    """Test version and node listing"""
+    simulator = ProxmoxSimulator(nodes=2)
+    proxmox = make_service(simulator)
+    
+    version = await proxmox.test_connection()
+    nodes = await proxmox.get_nodes()
+    
+    assert version["data"]["version"]
+    assert [node["node"] for node in nodes] == ["pve1", "pve2"]
+
+
+@pytest.mark.asyncio
+async def test_clone_and_lifecycle():
+    """Test cloning from a template and driving VM state"""
+    simulator = ProxmoxSimulator(nodes=1)
+    simulator.add_vm(vmid=9000, node="pve1", template=True)
+    proxmox = make_service(simulator)
+    
+    vmid = await proxmox.get_next_vmid()
+    result = await proxmox.create_vm("pve1", vmid, "web", 2, 2048, 20, template_id=9000)
+    assert result["data"].startswith("UPID:pve1:")
+    
+    await proxmox.start_vm("pve1", vmid)
+    assert (await proxmox.get_vm_status("pve1", vmid))["status"] == "running"
+    
+    await proxmox.stop_vm("pve1", vmid)
+    assert (await proxmox.get_vm_status("pve1", vmid))["status"] == "stopped"
+    
+    await proxmox.delete_vm("pve1", vmid)
+    assert vmid not in simulator.vms
+
+
+@pytest.mark.asyncio
+async def test_cluster_resources_lists_all_vms():
+    """Test that one cluster/resources call returns every simulated VM"""
+    simulator = ProxmoxSimulator(nodes=3)
+    simulator.seed_vms(2000)
+    proxmox = make_service(simulator)
+    
+    resources = await proxmox.get_cluster_resources("vm")
+    
+    assert len(resources) == 2000
+    assert simulator.requests_by_route == {"resources": 1}
+
+
+@pytest.mark.asyncio
+async def test_error_injection():
+    """Test that injected errors surface as HTTP errors"""
+    simulator = ProxmoxSimulator(error_rate=1.0)
+    proxmox = make_service(simulator)
+    
+    with pytest.raises(httpx.HTTPStatusError):
+        await proxmox.test_connection()
+    
+    # Reads that swallow errors return empty results
+    assert await proxmox.get_nodes() == []
+
+
+@pytest.mark.asyncio
+async def test_concurrent_reads_are_coalesced():
+    """Test that identical concurrent GETs share one upstream request"""
+    simulator = ProxmoxSimulator(nodes=1, latency=0.05)
+    simulator.add_vm(vmid=100, node="pve1")
+    viewers = [make_service(simulator) for _ in range(20)]
+    
+    statuses = await asyncio.gather(*(proxmox.get_vm_status("pve1", 100) for proxmox in viewers))
+    resources = await asyncio.gather(*(proxmox.get_cluster_resources("vm") for proxmox in viewers))
+    
+    assert {status["status"] for status in statuses} == {"running"}
+    assert all(len(r) == 1 for r in resources)
+    assert simulator.requests_by_route == {"status": 1, "resources": 1}
+
+
+@pytest.mark.asyncio
+async def test_read_cache_expires_and_is_invalidated_by_writes():
+    """Test that cached reads are reused briefly and dropped after an action"""
+    simulator = ProxmoxSimulator(nodes=1)
+    simulator.add_vm(vmid=100, node="pve1", status="stopped")
+    proxmox = make_service(simulator)
+    
+    assert (await proxmox.get_vm_status("pve1", 100))["status"] == "stopped"
+    assert (await proxmox.get_vm_status("pve1", 100))["status"] == "stopped"
+    assert simulator.requests_by_route["status"] == 1
+    
+    # cluster/resources is coalesced but never cached
+    await proxmox.get_cluster_resources("vm")
+    await proxmox.get_cluster_resources("vm")
+    assert simulator.requests_by_route["resources"] == 2
+    
+    await proxmox.start_vm("pve1", 100)
+    assert (await proxmox.get_vm_status("pve1", 100))["status"] == "running"
+    assert simulator.requests_by_route["status"] == 2
+
+
+@pytest.mark.asyncio
+async def test_read_during_write_is_not_cached_past_it():
+    """Test that a read made while a write is in flight isn't served once the write returns"""
+    simulator = ProxmoxSimulator(nodes=1)
+    simulator.add_vm(vmid=100, node="pve1", status="stopped")
+    write_sent, release_write = asyncio.Event(), asyncio.Event()
+    
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.method == "POST":
+            write_sent.set()
+            await release_write.wait()
+        return await simulator.handle_httpx(request)
+    
+    proxmox = ProxmoxService(
+        api_url="https://pve.example.com:8006",
+        api_token_encrypted=encryption.encrypt("root@pam!test=secret"),
+        server_name="sim",
+        transport=httpx.MockTransport(handler)
+    )
+    
+    write = asyncio.ensure_future(proxmox.start_vm("pve1", 100))
+    await write_sent.wait()
+    # Read and cached while Proxmox is still working on the start
+    assert (await proxmox.get_vm_status("pve1", 100))["status"] == "stopped"
+    release_write.set()
+    await write
+    
+    assert (await proxmox.get_vm_status("pve1", 100))["status"] == "running"
+    assert simulator.requests_by_route["status"] == 2
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+from functools import partial
+from types import SimpleNamespace
+
+from app.core.encryption import encryption
+from app.models.vm import VMState
+from app.services.proxmox import ProxmoxService
+from app.services.reconciliation import ReconciliationService
+from app.tests.proxmox_simulator import ProxmoxSimulator
+
+
+def make_row(id, server_id, proxmox_vm_id, state, node_name="pve1", state_changed_at=None):
+    return SimpleNamespace(
+        id=id,
+        server_id=server_id,
+        proxmox_vm_id=proxmox_vm_id,
+        node_name=node_name,
+        state=state,
+        state_changed_at=state_changed_at
+    )
+
+
+def test_compute_changes_only_returns_changed_rows():
+    """Test that unchanged VMs produce no updates"""
+    rows = [
+        make_row(1, 1, 100, VMState.RUNNING),
+        make_row(2, 1, 101, VMState.RUNNING),
+    ]
+    cluster_state = {
+        (1, 100): ("pve1", "running"),
+        (1, 101): ("pve1", "stopped"),
+    }
+    
+    changes = ReconciliationService.compute_changes(rows, cluster_state, [1])
+    
+    assert changes == [{"id": 2, "state": VMState.STOPPED}]
+
+
+def test_compute_changes_tracks_migrations_and_missing_vms():
+    """Test node changes and VMs missing from the cluster"""
+    rows = [
+        make_row(1, 1, 100, VMState.RUNNING),
+        make_row(2, 1, 101, VMState.STOPPED),
+    ]
+    cluster_state = {(1, 100): ("pve2", "running")}
+    
+    changes = ReconciliationService.compute_changes(rows, cluster_state, [1])
+    
+    assert {"id": 1, "node_name": "pve2"} in changes
+    assert {"id": 2, "state": VMState.ERROR} in changes
+
+
+def test_compute_changes_skips_unreachable_servers():
+    """Test that VMs on servers that failed to answer are left untouched"""
+    rows = [make_row(1, 2, 100, VMState.RUNNING)]
+    
+    changes = ReconciliationService.compute_changes(rows, {}, [1])
+    
+    assert changes == []
+
+
+async def test_recent_panel_stop_is_not_undone(monkeypatch):
+    """Test that a VM the panel just stopped stays stopped while Proxmox still lists it running"""
+    simulator = ProxmoxSimulator(nodes=1)
+    vmid = simulator.add_vm(node="pve1", status="running")["vmid"]
+    monkeypatch.setattr(
+        "app.services.reconciliation.ProxmoxService", partial(ProxmoxService, transport=simulator.transport())
+    )
+    server = SimpleNamespace(id=1, name="pve", api_url="https://pve.example.com:8006",
+                             api_token_encrypted=encryption.encrypt("root@pam!test=secret"), verify_ssl=False)
+    now = datetime.utcnow()
+    settled_before = now - timedelta(minutes=3)
+
+    cluster_state, reachable = await ReconciliationService.fetch_cluster_state([server])
+
+    just_stopped = make_row(1, 1, vmid, VMState.STOPPED, state_changed_at=now)
+    assert ReconciliationService.compute_changes([just_stopped], cluster_state, reachable, settled_before) == []
+
+    # Long enough ago, the VM was started outside the panel
+    stopped_earlier = make_row(1, 1, vmid, VMState.STOPPED, state_changed_at=now - timedelta(minutes=10))
+    assert ReconciliationService.compute_changes([stopped_earlier], cluster_state, reachable, settled_before) == [
+        {"id": 1, "state": VMState.RUNNING}
+    ]
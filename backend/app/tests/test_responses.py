@@ -0,0 +1,69 @@
+import json
+import pytest
+from decimal import Decimal
+from fastapi import status
+from fastapi.encoders import jsonable_encoder
+
+from app.core.responses import serialize
+from app.core.security import get_password_hash, create_access_token
+from app.models.user import User, UserRole, UserStatus
+from app.models.server import Server
+from app.models.template import VMTemplate
+from app.models.vm import VM, VMState
+from app.schemas.vm import VMListResponse
+
+
+async def create_user_with_vms(db_session, count: int) -> User:
+    user = User(
+        email="test@example.com",
+        password_hash=get_password_hash("testpassword123"),
+        role=UserRole.USER,
+        status=UserStatus.ACTIVE,
+        balance=Decimal("10.00")
+    )
+    template = VMTemplate(
+        name="Ubuntu", cpu_cores=1, ram_mb=1024, disk_gb=10,
+        os_type="linux", os_name="Ubuntu 22.04", cost_per_hour=Decimal("0.05")
+    )
+    server = Server(name="pve", api_url="https://pve:8006", api_token_encrypted="x")
+    db_session.add_all([user, template, server])
+    await db_session.flush()
+    
+    db_session.add_all([
+        VM(
+            user_id=user.id, template_id=template.id, server_id=server.id,
+            node_name="pve", name=f"vm-{i}", cpu_cores=1, ram_mb=1024, disk_gb=10,
+            state=VMState.RUNNING
+        )
+        for i in range(count)
+    ])
+    await db_session.commit()
+    return user
+
+
+@pytest.mark.asyncio
+async def test_list_vms_response(client, db_session):
+    """Test GET /vms served through the fast serializer"""
+    user = await create_user_with_vms(db_session, 3)
+    token = create_access_token({"sub": str(user.id)})
+    
+    response = client.get("/api/v1/vms", headers={"Authorization": f"Bearer {token}"})
+    
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert data["total"] == 3
+    assert {vm["name"] for vm in data["vms"]} == {"vm-0", "vm-1", "vm-2"}
+    assert data["vms"][0]["state"] == "running"
+
+
+@pytest.mark.asyncio
+async def test_serialize_matches_default_encoding(db_session):
+    """Test that the fast path produces the same JSON as FastAPI's default path"""
+    await create_user_with_vms(db_session, 2)
+    from sqlalchemy import select
+    vms = (await db_session.execute(select(VM))).scalars().all()
+    
+    payload = {"vms": vms, "total": len(vms)}
+    expected = jsonable_encoder(VMListResponse.model_validate(payload, from_attributes=True))
+    
+    assert json.loads(serialize(VMListResponse, payload)) == expected
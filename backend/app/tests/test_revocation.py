@@ -0,0 +1,94 @@
+import time
+from datetime import timedelta
+
+import orjson
+import pytest
+
+from app.core import security
+from app.core.cache_bus import cache_bus
+from app.core.revocation import TokenRevocations
+from app.core.security import TokenCache, create_access_token, decode_token
+from app.models.user import UserRole
+
+
+def test_verified_claims_are_cached_until_expiry(monkeypatch):
+    """Test that a token's signature is checked once and its cached claims expire with it"""
+    calls = []
+    original = security.jwt.decode
+    monkeypatch.setattr(security.jwt, "decode", lambda *args, **kwargs: calls.append(1) or original(*args, **kwargs))
+    monkeypatch.setattr(security, "token_cache", TokenCache(2))
+    token = create_access_token({"sub": "1"})
+    
+    assert decode_token(token) == decode_token(token)
+    assert len(calls) == 1
+    
+    # Least recently used goes first
+    others = [create_access_token({"sub": str(user_id)}) for user_id in (2, 3)]
+    for other in others:
+        decode_token(other)
+    decode_token(token)
+    assert len(calls) == 4
+    
+    cache = TokenCache(10)
+    cache.put("t", {"sub": "1", "exp": time.time() - 1})
+    assert cache.get("t") is None
+
+
+@pytest.fixture
+async def users(db_session, make_user):
+    """Headers for an admin and a user, and the user's ID"""
+    admin, user = make_user("admin@example.com", "0", UserRole.ADMIN), make_user("user@example.com")
+    db_session.add_all([admin, user])
+    await db_session.commit()
+    return (
+        {"Authorization": f"Bearer {create_access_token({'sub': str(admin.id)})}"},
+        {"Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}"},
+        user.id
+    )
+
+
+async def test_logout_revokes_the_token(client, users):
+    """Test that a logged-out token is refused while a new login works"""
+    _, headers, user_id = users
+    assert client.get("/api/v1/user/me", headers=headers).status_code == 200
+    
+    assert client.post("/api/v1/auth/logout", headers=headers).status_code == 200
+    
+    response = client.get("/api/v1/user/me", headers=headers)
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Token has been revoked"
+    fresh = {"Authorization": f"Bearer {create_access_token({'sub': str(user_id)})}"}
+    assert client.get("/api/v1/user/me", headers=fresh).status_code == 200
+
+
+async def test_ban_revokes_existing_tokens(client, users):
+    """Test that banning a user ends their sessions through the revocation list"""
+    admin_headers, headers, user_id = users
+    
+    response = client.post(f"/api/v1/admin/users/{user_id}/ban", headers=admin_headers, json={"reason": "abuse"})
+    
+    assert response.status_code == 200
+    response = client.get("/api/v1/user/me", headers=headers)
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Token has been revoked"
+
+
+async def test_other_processes_pick_up_revocations(token_revocations, monkeypatch):
+    """Test that another process's copy reloads from Redis when invalidated"""
+    monkeypatch.setattr(cache_bus, "_handlers", dict(cache_bus._handlers))
+    other = TokenRevocations()
+    monkeypatch.setattr(other, "_client", token_revocations._client)
+    claims = security.jwt.get_unverified_claims(create_access_token({"sub": "7"}, timedelta(minutes=5)))
+    
+    assert await other.check(claims) is False
+    await token_revocations.revoke_token(claims)
+    # Synced a moment ago: the revocation arrives with the broadcast
+    assert await other.check(claims) is False
+    cache_bus.apply(orjson.dumps({"origin": "elsewhere", "cache": "token_revocations", "key": claims["jti"]}))
+    assert await other.check(claims) is True
+    
+    # Celery tasks revoke whole users through the synchronous client
+    user_claims = security.jwt.get_unverified_claims(create_access_token({"sub": "8"}))
+    token_revocations.revoke_users([8])
+    other._invalidate("users")
+    assert await other.check(user_claims) is True
@@ -0,0 +1,79 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.core import locks
+from app.services.proxmox import proxmox_clients
+from app.tasks.runtime import AsyncTaskRuntime, async_task
+from app.tests.proxmox_simulator import ProxmoxSimulator
+from app.tests.test_proxmox import make_service
+
+
+@pytest.fixture
+def runtime(monkeypatch):
+    runtime = AsyncTaskRuntime()
+    monkeypatch.setattr("app.tasks.runtime.task_runtime", runtime)
+    yield runtime
+    runtime.shutdown()
+
+
+def test_task_bodies_share_one_persistent_loop(runtime):
+    """Test that async task bodies run on the same loop, off the caller's thread"""
+
+    @async_task
+    async def body(value):
+        await asyncio.sleep(0)
+        return asyncio.get_running_loop(), threading.current_thread(), value
+
+    first_loop, first_thread, value = body(1)
+    second_loop, second_thread, _ = body(2)
+
+    assert value == 1
+    assert first_loop is second_loop is runtime.loop
+    assert first_thread is second_thread is not threading.current_thread()
+
+
+def test_task_body_errors_propagate(runtime):
+    """Test that exceptions reach the Celery task wrapper"""
+
+    @async_task
+    async def body():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        body()
+
+
+def test_task_bodies_see_the_callers_lease(runtime):
+    """Test that ensure_lease in an async body checks the lease of the calling @singleton"""
+    lease = locks.RedisLease("job", ttl_seconds=60)
+    lease.lost.set()
+
+    @async_task
+    async def body():
+        locks.ensure_lease()
+
+    token = locks._current_lease.set(lease)
+    try:
+        with pytest.raises(locks.LeaseLost):
+            body()
+    finally:
+        locks._current_lease.reset(token)
+    body()
+
+
+def test_proxmox_clients_are_pooled_on_the_runtime_loop(runtime):
+    """Test that Proxmox requests reuse one client per transport on the runtime loop"""
+    simulator = ProxmoxSimulator(nodes=1)
+    proxmox = make_service(simulator)
+
+    async def request():
+        await proxmox.get_next_vmid()
+        return proxmox_clients.get(proxmox.verify_ssl, proxmox.transport)
+
+    assert runtime.run(request()) is runtime.run(request())
+    assert simulator.requests_by_route == {"nextid": 2}
+
+    runtime.shutdown()
+    assert proxmox_clients.loop is None
@@ -0,0 +1,57 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from app.core.config import settings
+
+
+API_MODULES = ["app.main"]
+WORKER_MODULES = ["app.tasks.celery_app", "app.tasks.billing", "app.tasks.monitoring", "app.tasks.admin"]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+print(json.dumps({{"seconds": time.perf_counter() - start, "modules": sorted(sys.modules)}}))
+"""
+
+
+def cold_import(modules):
+    """Import modules in a fresh interpreter: (seconds, loaded module names)"""
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE.format(modules=modules)],
+        capture_output=True, text=True, check=True
+    ).stdout
+    result = json.loads(out.splitlines()[-1])
+    return result["seconds"], set(result["modules"])
+
+
+def slowest_imports(modules, limit=10):
+    """Top cumulative entries of -X importtime, for the failure message"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        capture_output=True, text=True
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+@pytest.mark.parametrize("modules, budget, kept_out", [
+    (API_MODULES, "IMPORT_BUDGET_API_SECONDS", {"celery", "psycopg2", "asyncpg", "cryptography.fernet"}),
+    (WORKER_MODULES, "IMPORT_BUDGET_WORKER_SECONDS", {"fastapi", "psycopg2", "asyncpg", "cryptography.fernet"}),
+])
+def test_cold_import_stays_within_budget(modules, budget, kept_out):
+    """Test that API and worker processes import quickly and leave heavy dependencies for first use"""
+    seconds, loaded = cold_import(modules)
+    
+    assert loaded.isdisjoint(kept_out), f"imported eagerly: {sorted(loaded & kept_out)}"
+    assert seconds <= getattr(settings, budget), (
+        f"import took {seconds:.2f}s; slowest (cumulative us): {slowest_imports(modules)}"
+    )
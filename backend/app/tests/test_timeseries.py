@@ -0,0 +1,139 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func
+
+from app.models.metric import MetricSample, MetricRollup, MetricCursor
+from app.services.timeseries import TimeSeriesService, RAW_RETENTION
+
+
+KEY = ("vm", 1, "100")
+
+
+def points(start, count, cpu=0.5):
+    """rrddata points a minute apart from start (an epoch aligned to 5 minutes)"""
+    return TimeSeriesService.normalize_points([
+        {"time": start + i * 60, "cpu": cpu, "mem": 100 * (i + 1), "maxmem": 4096}
+        for i in range(count)
+    ])
+
+
+def recent_hour():
+    now = int((datetime.utcnow() - datetime(1970, 1, 1)).total_seconds())
+    return now - now % 3600 - 3600
+
+
+def half_hour_ago():
+    now = int((datetime.utcnow() - datetime(1970, 1, 1)).total_seconds())
+    return now - now % 300 - 1800
+
+
+def test_normalize_points_skips_empty_rows():
+    """Test that rrddata rows without values are dropped"""
+    points = [
+        {"time": 1700000000, "cpu": 0.5, "memused": 1024, "memtotal": 4096},
+        {"time": 1700000060},
+    ]
+    
+    samples = TimeSeriesService.normalize_points(points)
+    
+    assert len(samples) == 1
+    assert samples[0]["timestamp"] == datetime.utcfromtimestamp(1700000000)
+    assert samples[0]["mem"] == 1024
+    assert samples[0]["maxmem"] == 4096
+
+
+def test_build_rollups_aggregates_per_bucket():
+    """Test that samples are folded into buckets of every size"""
+    samples = TimeSeriesService.normalize_points([
+        {"time": 1699999800, "cpu": 0.2, "mem": 100},
+        {"time": 1699999860, "cpu": 0.6, "mem": 300},
+    ])
+    
+    rollups = TimeSeriesService.build_rollups(("vm", 1, "100"), samples)
+    by_size = {}
+    for bucket in rollups:
+        by_size.setdefault(bucket["bucket_seconds"], []).append(bucket)
+    
+    assert len(by_size[60]) == 2
+    assert len(by_size[300]) == 1
+    
+    bucket = by_size[300][0]
+    assert bucket["sample_count"] == 2
+    assert abs(bucket["cpu_sum"] - 0.8) < 1e-9
+    assert bucket["cpu_max"] == 0.6
+    assert bucket["mem_max"] == 300
+
+
+def test_write_samples_skips_points_already_stored(sync_db):
+    """Test that overlapping rrddata only adds the points newer than the resource's cursor"""
+    start = recent_hour()
+    with sync_db() as db:
+        assert TimeSeriesService.write_samples(db, {KEY: points(start, 5)}) == 5
+        db.commit()
+        
+        # The next collection returns the same hour again plus two new points
+        assert TimeSeriesService.write_samples(db, {KEY: points(start, 7)}) == 2
+        assert TimeSeriesService.write_samples(db, {KEY: points(start, 7)}) == 0
+        db.commit()
+        
+        assert db.execute(select(func.count(MetricSample.id))).scalar() == 7
+        cursor = db.execute(select(MetricCursor.latest)).scalar_one()
+        assert cursor.replace(tzinfo=None) == datetime.utcfromtimestamp(start + 6 * 60)
+        minutes = db.execute(
+            select(func.count(MetricRollup.id)).where(MetricRollup.bucket_seconds == 60)
+        ).scalar()
+        assert minutes == 7
+
+
+def test_write_samples_folds_into_existing_buckets(sync_db):
+    """Test that a bucket written across two collections holds the combined aggregates"""
+    start = recent_hour()
+    with sync_db() as db:
+        TimeSeriesService.write_samples(db, {KEY: points(start, 2, cpu=0.2)})
+        db.commit()
+        TimeSeriesService.write_samples(db, {KEY: points(start, 4, cpu=0.8)})
+        db.commit()
+        
+        bucket = db.execute(
+            select(MetricRollup).where(MetricRollup.bucket_seconds == 300)
+        ).scalar_one()
+        assert bucket.sample_count == 4
+        assert abs(bucket.cpu_sum - (0.2 * 2 + 0.8 * 2)) < 1e-9
+        assert bucket.cpu_max == 0.8
+        assert bucket.mem_max == 400
+        assert bucket.maxmem == 4096
+
+
+async def test_query_range_averages_buckets(db_session):
+    """Test that a range query reads the bucket size of its range and averages each bucket"""
+    start = half_hour_ago()
+    await db_session.run_sync(TimeSeriesService.write_samples, {KEY: points(start, 10)})
+    await db_session.commit()
+    
+    hour = await TimeSeriesService.query_range(db_session, KEY, "1h")
+    day = await TimeSeriesService.query_range(db_session, KEY, "24h")
+    
+    assert len(hour) == 10
+    assert [point["mem"] for point in day] == [300, 800]
+    assert day[0]["mem_max"] == 500
+    assert await TimeSeriesService.query_range(db_session, ("vm", 1, "101"), "1h") == []
+
+
+def test_prune_drops_expired_rows(sync_db):
+    """Test that samples, cursors and buckets past retention are deleted and recent ones kept"""
+    old = int((datetime.utcnow() - RAW_RETENTION - timedelta(days=10) - datetime(1970, 1, 1)).total_seconds())
+    old -= old % 3600
+    with sync_db() as db:
+        TimeSeriesService.write_samples(db, {KEY: points(old, 1), ("vm", 1, "101"): points(recent_hour(), 1)})
+        db.commit()
+        
+        TimeSeriesService.prune(db)
+        db.commit()
+        
+        assert db.execute(select(MetricSample.resource_id)).scalars().all() == ["101"]
+        assert db.execute(select(MetricCursor.resource_id)).scalars().all() == ["101"]
+        # Hourly buckets are kept for 400 days
+        kept = db.execute(
+            select(MetricRollup.resource_id, MetricRollup.bucket_seconds).where(MetricRollup.resource_id == "100")
+        ).all()
+        assert kept == [("100", 3600)]
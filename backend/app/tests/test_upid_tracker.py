@@ -0,0 +1,113 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.models.task import Task, TaskStatus
+from app.services.upid_tracker import TaskLost, UPIDTracker
+from app.tests.test_proxmox import make_service
+from app.tests.proxmox_simulator import ProxmoxSimulator
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(settings, "PROXMOX_TASK_POLL_INITIAL_SECONDS", 0.01)
+    monkeypatch.setattr(settings, "PROXMOX_TASK_POLL_MAX_SECONDS", 0.05)
+
+
+async def test_many_tasks_share_one_poller_per_node():
+    """Test that outstanding UPIDs on a node are polled together"""
+    simulator = ProxmoxSimulator(nodes=2, task_duration=0.1)
+    vmids = simulator.seed_vms(200, status="stopped")
+    proxmox = make_service(simulator)
+    tracker = UPIDTracker()
+
+    upids = []
+    for vmid in vmids:
+        node = simulator.vms[vmid]["node"]
+        upids.append((node, (await proxmox.start_vm(node, vmid))["data"]))
+
+    statuses = await asyncio.gather(*(tracker.wait(proxmox, node, upid, timeout=5) for node, upid in upids))
+
+    assert all(tracker.succeeded(status) for status in statuses)
+    # Status lookups only for finished tasks; list polls stay per node, not per task
+    assert simulator.requests_by_route["task_status"] == len(upids)
+    assert simulator.requests_by_route["tasks"] < 40
+
+
+async def test_finished_tasks_update_task_rows(db_session):
+    """Test that linked Task rows are completed or failed"""
+    simulator = ProxmoxSimulator(nodes=1)
+    simulator.add_vm(vmid=100, node="pve1", status="stopped")
+    proxmox = make_service(simulator)
+
+    ok_upid = (await proxmox.start_vm("pve1", 100))["data"]
+    failed_upid = (await proxmox.stop_vm("pve1", 100))["data"]
+    simulator.tasks[failed_upid]["exitstatus"] = "VM quit/powerdown failed"
+
+    rows = [Task(type="vm_start", status=TaskStatus.RUNNING), Task(type="vm_stop", status=TaskStatus.RUNNING)]
+    db_session.add_all(rows)
+    await db_session.commit()
+
+    @asynccontextmanager
+    async def session():
+        yield db_session
+
+    tracker = UPIDTracker(session_factory=session)
+    await asyncio.gather(
+        tracker.wait(proxmox, "pve1", ok_upid, task_id=rows[0].id, timeout=5),
+        tracker.wait(proxmox, "pve1", failed_upid, task_id=rows[1].id, timeout=5)
+    )
+
+    db_session.expire_all()
+    tasks = (await db_session.execute(select(Task).order_by(Task.id))).scalars().all()
+    assert [task.status for task in tasks] == [TaskStatus.COMPLETED, TaskStatus.FAILED]
+    assert tasks[0].result == {"upid": ok_upid, "exitstatus": "OK"}
+    assert tasks[1].error_message == "VM quit/powerdown failed"
+    assert tasks[1].progress_percent == 100
+
+
+async def test_unreachable_node_fails_tasks_after_limit(db_session, monkeypatch):
+    """Test that a node whose task list keeps failing gives up its UPIDs and fails their rows"""
+    monkeypatch.setattr(settings, "PROXMOX_TASK_MAX_POLL_FAILURES", 3)
+    simulator = ProxmoxSimulator(nodes=1)
+    simulator.add_vm(vmid=100, node="pve1", status="stopped")
+    proxmox = make_service(simulator)
+    upid = (await proxmox.start_vm("pve1", 100))["data"]
+
+    async def unreachable(node, source="active"):
+        raise ConnectionError("node offline")
+
+    monkeypatch.setattr(proxmox, "get_node_tasks", unreachable)
+    row = Task(type="vm_start", status=TaskStatus.RUNNING)
+    db_session.add(row)
+    await db_session.commit()
+    task_id = row.id
+
+    @asynccontextmanager
+    async def session():
+        yield db_session
+
+    tracker = UPIDTracker(session_factory=session)
+    with pytest.raises(TaskLost, match="after 3 polls"):
+        await tracker.wait(proxmox, "pve1", upid, task_id=task_id, timeout=5)
+
+    db_session.expire_all()
+    task = await db_session.get(Task, task_id)
+    assert task.status == TaskStatus.FAILED
+    assert "node offline" in task.error_message
+    assert tracker._queues == {}
+
+
+async def test_long_running_tasks_are_given_up(monkeypatch):
+    """Test that a task still running past the tracking limit stops being polled"""
+    monkeypatch.setattr(settings, "PROXMOX_TASK_MAX_TRACK_SECONDS", 0.1)
+    simulator = ProxmoxSimulator(nodes=1, task_duration=60)
+    simulator.add_vm(vmid=100, node="pve1", status="stopped")
+    proxmox = make_service(simulator)
+    upid = (await proxmox.start_vm("pve1", 100))["data"]
+
+    with pytest.raises(TaskLost, match="tracking limit"):
+        await UPIDTracker().wait(proxmox, "pve1", upid, timeout=5)
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import select
+
+from app.core.metrics import billing_cycle_amount
+from app.models.user import User
+from app.models.usage import UsageSegment
+from app.models.vm import VMState
+from app.services.usage import UsageService
+from app.tasks.billing import process_vm_billing
+
+
+def test_segment_change():
+    """Test which transitions open and close segments"""
+    assert UsageService.segment_change(VMState.STOPPED, VMState.RUNNING) == (False, True)
+    assert UsageService.segment_change(VMState.RUNNING, VMState.STOPPED) == (True, False)
+    assert UsageService.segment_change(VMState.RUNNING, VMState.SUSPENDED) == (False, False)
+    assert UsageService.segment_change(VMState.SUSPENDED, VMState.DELETED) == (True, False)
+
+
+def test_compute_charges_stops_at_segment_end():
+    """Test that closed segments are charged up to their end only"""
+    now = datetime(2026, 1, 1, 12, 0)
+    segments = [
+        SimpleNamespace(id=1, vm_id=1, user_id=1, rate=Decimal("1.20"), started_at=now - timedelta(hours=2),
+                        billed_until=now - timedelta(hours=1), ended_at=now - timedelta(minutes=30)),
+        SimpleNamespace(id=2, vm_id=2, user_id=1, rate=Decimal("0.60"), started_at=now - timedelta(hours=1),
+                        billed_until=now - timedelta(hours=1), ended_at=None),
+    ]
+    
+    closed, open_ = UsageService.compute_charges(segments, now)
+    
+    assert closed["cost"] == Decimal("0.6")
+    assert closed["settled"] is True
+    assert closed["billed_until"] == now - timedelta(minutes=30)
+    assert open_["cost"] == Decimal("0.6")
+    assert open_["settled"] is False
+    assert UsageService.totals([closed, open_], "user_id") == {1: Decimal("1.2")}
+
+
+def test_billing_cycle_settles_closed_segments(sync_db, make_user, make_template, make_server, make_vm):
+    """Test that a VM stopped mid-cycle is billed up to the stop only"""
+    now = datetime.utcnow()
+    
+    with sync_db() as db:
+        user, template, server = make_user(balance="10.00"), make_template(cost_per_hour="1.00"), make_server()
+        db.add_all([user, template, server])
+        db.flush()
+        vm = make_vm(user, template, server)
+        db.add(vm)
+        db.flush()
+        db.execute(UsageService.open_segments([(vm.id, user.id, Decimal("1.00"))], now - timedelta(hours=2)))
+        db.execute(UsageService.close_segments([vm.id], now - timedelta(hours=1)))
+        db.commit()
+        user_id = user.id
+    
+    result = process_vm_billing()
+    
+    assert result["status"] == "success"
+    assert result["vms_billed"] == 1
+    assert result["segments_settled"] == 1
+    assert result["total_amount"] == pytest.approx(1.0)
+    
+    with sync_db() as db:
+        assert db.get(User, user_id).balance == pytest.approx(Decimal("9.00"))
+        assert db.execute(select(UsageSegment.settled_at)).scalar_one() is not None
+    
+    # Nothing left to charge
+    assert process_vm_billing()["vms_billed"] == 0
+
+
+def test_billing_keeps_balances_decimal(sync_db, make_user, make_template, make_server, make_vm):
+    """Test that float rates are charged as Decimal and only reported as float (regression: TypeError)"""
+    now = datetime.utcnow()
+    segment = SimpleNamespace(id=1, vm_id=1, user_id=1, rate=0.1, started_at=now - timedelta(hours=3),
+                              billed_until=now - timedelta(hours=3), ended_at=now)
+    
+    charge, = UsageService.compute_charges([segment], now)
+    assert isinstance(charge["cost"], Decimal)
+    assert charge["cost"] == Decimal("0.3")
+    
+    with sync_db() as db:
+        user, template, server = make_user(balance="5.00"), make_template(cost_per_hour="0.10"), make_server()
+        db.add_all([user, template, server])
+        db.flush()
+        vm = make_vm(user, template, server)
+        db.add(vm)
+        db.flush()
+        db.execute(UsageService.open_segments([(vm.id, user.id, Decimal("0.10"))], now - timedelta(hours=3)))
+        db.execute(UsageService.close_segments([vm.id], now))
+        db.commit()
+        user_id = user.id
+    
+    result = process_vm_billing()
+    
+    assert result["status"] == "success"
+    assert isinstance(result["total_amount"], float)
+    assert result["total_amount"] == pytest.approx(0.3)
+    assert billing_cycle_amount._value.get() == pytest.approx(0.3)
+    with sync_db() as db:
+        assert db.get(User, user_id).balance == pytest.approx(Decimal("4.70"))
@@ -0,0 +1,100 @@
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select, update
+
+from app.core.events import event_publisher
+from app.models.user import User
+from app.models.vm import VM, VMState
+from app.services.exhaustion import exhaustion_scheduler
+
+
+@pytest.fixture(autouse=True)
+def quiet(monkeypatch):
+    async def noop_async(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr(event_publisher, "publish_async", noop_async)
+    monkeypatch.setattr(exhaustion_scheduler, "refresh_async", noop_async)
+
+
+async def set_state(db_session, vm_id, state):
+    await db_session.execute(update(VM).where(VM.id == vm_id).values(state=state))
+    await db_session.commit()
+
+
+async def test_resume_only_from_suspended(client, db_session, simulator, owned_vms):
+    """Test that resume is refused unless the VM is suspended"""
+    headers, vms = owned_vms
+
+    response = client.post(f"/api/v1/vms/{vms[0].id}/action", headers=headers, json={"action": "resume"})
+    assert response.status_code == 409
+
+    await set_state(db_session, vms[0].id, VMState.SUSPENDED)
+    response = client.post(f"/api/v1/vms/{vms[0].id}/action", headers=headers, json={"action": "resume"})
+    assert response.status_code == 200
+
+
+async def test_resume_checks_balance(client, db_session, simulator, owned_vms):
+    """Test that resume is held to the same balance check as start"""
+    headers, vms = owned_vms
+    await set_state(db_session, vms[0].id, VMState.SUSPENDED)
+    await db_session.execute(update(User).where(User.email == "owner@example.com").values(balance=Decimal("0")))
+    await db_session.commit()
+
+    response = client.post(f"/api/v1/vms/{vms[0].id}/action", headers=headers, json={"action": "resume"})
+
+    assert response.status_code == 402
+
+
+@pytest.mark.parametrize("state", [VMState.DELETED, VMState.DELETING])
+async def test_actions_on_deleted_vms_conflict(client, db_session, simulator, owned_vms, state):
+    """Test that deleted or deleting VMs can't be started again"""
+    headers, vms = owned_vms
+    await set_state(db_session, vms[0].id, state)
+
+    response = client.post(f"/api/v1/vms/{vms[0].id}/action", headers=headers, json={"action": "start"})
+
+    assert response.status_code == 409
+
+
+async def test_stop_goes_through_proxmox(client, db_session, simulator, owned_vms):
+    """Test that the VM is stopped on Proxmox before the database records it"""
+    headers, vms = owned_vms
+    simulator.vms[vms[2].proxmox_vm_id]["status"] = "running"
+
+    response = client.post(f"/api/v1/vms/{vms[2].id}/action", headers=headers, json={"action": "stop"})
+
+    assert response.status_code == 200
+    assert response.json()["upid"].startswith("UPID:")
+    assert simulator.vms[vms[2].proxmox_vm_id]["status"] == "stopped"
+    vm = (await db_session.execute(select(VM).where(VM.id == vms[2].id))).scalar_one()
+    await db_session.refresh(vm)
+    assert vm.state == VMState.STOPPED
+    assert vm.state_changed_at is not None
+
+
+async def test_proxmox_refusal_keeps_state(client, db_session, simulator, owned_vms):
+    """Test that a failed Proxmox call leaves the VM's state alone"""
+    headers, vms = owned_vms
+    del simulator.vms[vms[2].proxmox_vm_id]
+
+    response = client.post(f"/api/v1/vms/{vms[2].id}/action", headers=headers, json={"action": "stop"})
+
+    assert response.status_code == 502
+    vm = (await db_session.execute(select(VM).where(VM.id == vms[2].id))).scalar_one()
+    await db_session.refresh(vm)
+    assert vm.state == VMState.RUNNING
+
+
+async def test_action_must_apply_to_current_state(client, db_session, simulator, owned_vms):
+    """Test that stopping a stopped VM is a no-op and suspending it a conflict, neither calling Proxmox"""
+    headers, vms = owned_vms
+
+    response = client.post(f"/api/v1/vms/{vms[0].id}/action", headers=headers, json={"action": "stop"})
+    assert response.status_code == 200
+    assert response.json()["upid"] is None
+
+    response = client.post(f"/api/v1/vms/{vms[0].id}/action", headers=headers, json={"action": "suspend"})
+    assert response.status_code == 409
+    assert simulator.request_count == 0
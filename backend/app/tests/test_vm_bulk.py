@@ -0,0 +1,132 @@
+from types import SimpleNamespace
+
+import orjson
+import pytest
+from pydantic import ValidationError
+from sqlalchemy import select
+
+from app.models.usage import UsageSegment
+from app.models.vm import VM, VMState
+from app.schemas.vm import VMBulkAction, VMBulkDelete
+from app.services.vm_bulk import VMBulkService
+
+
+def lines(response):
+    return [orjson.loads(line) for line in response.content.splitlines()]
+
+
+async def test_bulk_start_by_selector_streams_results(client, db_session, simulator, owned_vms):
+    """Test that a selector matches only the caller's VMs and each gets a result"""
+    headers, vms = owned_vms
+
+    response = client.post("/api/v1/vms/actions", headers=headers, json={
+        "action": "start", "selector": {"name_prefix": "ci-"}
+    })
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    results = lines(response)
+    by_id = {result["id"]: result for result in results[:-1]}
+    assert by_id[vms[0].id]["status"] == by_id[vms[1].id]["status"] == "ok"
+    assert by_id[vms[2].id] == {"id": vms[2].id, "status": "skipped", "error": "VM is running"}
+    assert vms[4].id not in by_id
+    assert results[-1]["summary"] == {"total": 3, "succeeded": 2, "failed": 0, "skipped": 1, "dispatched": 0}
+    assert simulator.requests_by_route["action"] == 2
+
+    db_session.expire_all()
+    states = dict((await db_session.execute(select(VM.id, VM.state))).all())
+    assert states[vms[0].id] == states[vms[1].id] == VMState.RUNNING
+    assert states[vms[3].id] == VMState.STOPPED
+    segments = (await db_session.execute(select(UsageSegment.vm_id))).scalars().all()
+    assert sorted(segments) == [vms[0].id, vms[1].id]
+
+
+async def test_bulk_delete_checks_ownership_and_reports_proxmox_errors(
+    client, db_session, simulator, owned_vms
+):
+    """Test other users' VMs are not found and failed Proxmox calls keep the VM"""
+    headers, vms = owned_vms
+    # Gone from Proxmox already: the delete call fails
+    del simulator.vms[vms[1].proxmox_vm_id]
+
+    response = client.post("/api/v1/vms/bulk-delete", headers=headers, json={
+        "vm_ids": [vms[0].id, vms[1].id, vms[4].id]
+    })
+
+    results = lines(response)
+    by_id = {result["id"]: result for result in results[:-1]}
+    assert by_id[vms[4].id] == {"id": vms[4].id, "status": "error", "error": "VM not found"}
+    assert by_id[vms[1].id]["status"] == "error"
+    assert by_id[vms[0].id]["status"] == "ok"
+    assert results[-1]["summary"]["succeeded"] == 1
+
+    db_session.expire_all()
+    states = dict((await db_session.execute(select(VM.id, VM.state))).all())
+    assert states[vms[0].id] == VMState.DELETED
+    assert states[vms[1].id] == VMState.STOPPED
+    assert states[vms[4].id] == VMState.STOPPED
+
+
+async def test_failed_proxmox_tasks_keep_the_vm(client, db_session, simulator, owned_vms):
+    """Test that a VM only changes state once its Proxmox task succeeded"""
+    headers, vms = owned_vms
+    simulator.task_duration = 0.05
+    original = simulator._new_task
+
+    def failing_task(node, task_type, vmid):
+        upid = original(node, task_type, vmid)
+        if int(vmid) == vms[1].proxmox_vm_id:
+            simulator.tasks[upid]["exitstatus"] = "start failed: QEMU exited with code 1"
+        return upid
+
+    simulator._new_task = failing_task
+
+    response = client.post("/api/v1/vms/actions", headers=headers, json={
+        "action": "start", "vm_ids": [vms[0].id, vms[1].id]
+    })
+
+    results = lines(response)
+    by_id = {result["id"]: result for result in results[:-1]}
+    assert by_id[vms[0].id]["status"] == "ok"
+    assert by_id[vms[1].id]["status"] == "error"
+    assert by_id[vms[1].id]["error"] == "start failed: QEMU exited with code 1"
+
+    db_session.expire_all()
+    states = dict((await db_session.execute(select(VM.id, VM.state))).all())
+    assert states[vms[0].id] == VMState.RUNNING
+    assert states[vms[1].id] == VMState.STOPPED
+
+
+async def test_dispatch_reports_unusable_servers():
+    """Test that a server whose token can't be decrypted fails its VMs instead of hanging"""
+    row = SimpleNamespace(id=1, server_id=1, proxmox_vm_id=100, node_name="pve1", server_name="pve",
+                          api_url="https://pve:8006", api_token_encrypted="not-a-token", verify_ssl=True)
+
+    results = [item async for item in VMBulkService.dispatch("stop", [row])]
+
+    assert [(item[0].id, item[1]) for item in results] == [(1, "error")]
+
+
+async def test_oversized_selector_is_rejected(client, db_session, simulator, owned_vms, monkeypatch):
+    """Test that a selector matching more than the cap is refused before any call"""
+    monkeypatch.setattr("app.api.v1.vms.MAX_BULK_VMS", 2)
+    monkeypatch.setattr("app.services.vm_bulk.MAX_BULK_VMS", 2)
+    headers, _ = owned_vms
+
+    response = client.post("/api/v1/vms/bulk-delete", headers=headers, json={
+        "selector": {"name_prefix": "ci-"}
+    })
+
+    assert response.status_code == 422
+    assert "action" not in simulator.requests_by_route
+
+
+def test_bulk_request_needs_one_target():
+    """Test that exactly one of IDs or a non-empty selector is accepted"""
+    with pytest.raises(ValidationError):
+        VMBulkDelete()
+    with pytest.raises(ValidationError):
+        VMBulkAction(action="stop", vm_ids=[1], selector={"name_prefix": "ci-"})
+    with pytest.raises(ValidationError):
+        VMBulkDelete(selector={})
+    assert VMBulkDelete(selector={"states": ["stopped"]}).selector.states == ["stopped"]
@@ -0,0 +1,41 @@
+"""
+Production API serving: gunicorn managing uvicorn workers
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+The app is imported once in the master and workers are forked from it
+(preload_app), so they start without re-importing anything. Import does not
+open connections or start loops (see app/core/database.py); each worker sets
+up its pools, Redis subscriptions and Proxmox clients in the app lifespan.
+In-process caches are per worker and kept coherent via app/core/cache_bus.py.
+
+Metrics run in multiprocess mode so /metrics aggregates every worker.
+"""
+import multiprocessing
+import os
+
+# Must be set before the app (and its metrics) is imported
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus-multiproc-api")
+
+bind = os.environ.get("API_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY") or multiprocessing.cpu_count())
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+# Rolling restarts keep long-lived workers from accumulating fragmentation
+max_requests = int(os.environ.get("API_MAX_REQUESTS") or 10000)
+max_requests_jitter = max_requests // 10
+graceful_timeout = 30
+timeout = 60
+keepalive = 5
+
+
+def on_starting(server):
+    # Once per master start (not on HUP): no metric files from a previous run
+    from app.core.metrics import reset_multiprocess_dir
+    reset_multiprocess_dir()
+
+
+def child_exit(server, worker):
+    from app.core.metrics import mark_process_dead
+    mark_process_dead(worker.pid)